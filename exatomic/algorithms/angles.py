@@ -2,15 +2,21 @@
 # Copyright (c) 2015-2020, Exa Analytics Development Team
 # Distributed under the terms of the Apache License 2.0
 """
-Two Body Properties Computations
+Bond and Dihedral Angles
 #####################################
+Bond angles are computed from a (CSR) bond adjacency: every pair of atoms
+bonded to a given central atom forms an angle. All central atoms (of all
+frames) are processed in a single pass. Dihedral (torsion) angles are
+computed for bonded paths i-j-k-l, enumerated once from a reference frame,
+for every frame of a trajectory.
 """
 import numpy as np
 import numba as nb
 import pandas as pd
-from IPython.display import display
-from ipywidgets import FloatProgress
+from scipy.sparse import csr_matrix
 from exatomic.base import nbpll
+from exatomic.core.three import AtomThree
+from exatomic.algorithms.distance import _inv3
 
 
 @nb.jit(nopython=True, nogil=True, parallel=nbpll)
@@ -33,45 +39,397 @@ def angles(dx, dy, dz, dr, atom0, atom1):
     return rad, adx
 
 
-# Angles
+@nb.jit(nopython=True, nogil=True)
+def _bond_vector(i, j, x, y, z, cells, invs, cdx, periodic):
+    """
+    Separation vector from body i to body j (minimum image if periodic).
+    """
+    dx = x[j] - x[i]
+    dy = y[j] - y[i]
+    dz = z[j] - z[i]
+    if periodic:
+        return _minimum_image_vector(dx, dy, dz, cells[cdx[i]], invs[cdx[i]])
+    return dx, dy, dz
+
+
+@nb.jit(nopython=True, nogil=True)
+def _minimum_image_vector(dx, dy, dz, cell, inv):
+    """
+    Minimum image of an arbitrary separation vector given a cell matrix and
+    its inverse.
+    """
+    fa = dx*inv[0, 0] + dy*inv[1, 0] + dz*inv[2, 0]
+    fb = dx*inv[0, 1] + dy*inv[1, 1] + dz*inv[2, 1]
+    fc = dx*inv[0, 2] + dy*inv[1, 2] + dz*inv[2, 2]
+    fa -= np.round(fa)
+    fb -= np.round(fb)
+    fc -= np.round(fc)
+    return (fa*cell[0, 0] + fb*cell[1, 0] + fc*cell[2, 0],
+            fa*cell[0, 1] + fb*cell[1, 1] + fc*cell[2, 1],
+            fa*cell[0, 2] + fb*cell[1, 2] + fc*cell[2, 2])
+
+
+@nb.jit(nopython=True, nogil=True)
+def _inverse_cells(cells):
+    """Inverse of each cell matrix."""
+    invs = np.empty_like(cells)
+    for k in range(len(cells)):
+        invs[k] = _inv3(cells[k])
+    return invs
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def bond_angles(indptr, indices, x, y, z, cells, cdx, periodic):
+    """
+    Compute all bond angles given a (symmetric) bond adjacency.
+
+    For each central body i, every pair j < k of bodies adjacent to i (i.e.
+    ``indices[indptr[i]:indptr[i+1]]``) gives the angle j-i-k. Results for
+    central body i start at the cumulative sum of the number of pairs of the
+    preceding bodies, so bodies are processed independently (in parallel).
+
+    Args:
+        indptr (array): CSR row pointers (by body position)
+        indices (array): CSR column indices (body positions)
+        x (array): Cartesian x array
+        y (array): Cartesian y array
+        z (array): Cartesian z array
+        cells (array): Cell matrices (rows are cell vectors), shape (ncells, 3, 3)
+        cdx (array): Index of each body's cell matrix
+        periodic (bool): Use the minimum image convention
+
+    Returns:
+        center (array): Position of the central body
+        atom1 (array): Position of the first outer body
+        atom2 (array): Position of the second outer body
+        angle (array): Angle (radians)
+    """
+    n = len(indptr) - 1
+    invs = _inverse_cells(cells) if periodic else cells
+    offset = np.zeros((n + 1, ), dtype=np.int64)
+    for i in range(n):
+        k = indptr[i + 1] - indptr[i]
+        offset[i + 1] = offset[i] + k*(k - 1)//2
+    m = offset[n]
+    center = np.empty((m, ), dtype=np.int64)
+    atom1 = np.empty((m, ), dtype=np.int64)
+    atom2 = np.empty((m, ), dtype=np.int64)
+    angle = np.empty((m, ), dtype=np.float64)
+    for i in nb.prange(n):
+        p = offset[i]
+        for q in range(indptr[i], indptr[i + 1]):
+            j = indices[q]
+            ax, ay, az = _bond_vector(i, j, x, y, z, cells, invs, cdx, periodic)
+            for s in range(q + 1, indptr[i + 1]):
+                k = indices[s]
+                bx, by, bz = _bond_vector(i, k, x, y, z, cells, invs, cdx, periodic)
+                cos = (ax*bx + ay*by + az*bz)/np.sqrt((ax**2 + ay**2 + az**2)*
+                                                      (bx**2 + by**2 + bz**2))
+                center[p] = i
+                atom1[p] = j
+                atom2[p] = k
+                angle[p] = np.arccos(max(-1.0, min(1.0, cos)))
+                p += 1
+    return center, atom1, atom2, angle
+
+
+def adjacency(atom0, atom1, index):
+    """
+    Symmetric (CSR) adjacency matrix of pairs of atoms, by atom position.
+
+    Args:
+        atom0 (array): Atom index of the first atom of each pair
+        atom1 (array): Atom index of the second atom of each pair
+        index (array): Atom index of each position (e.g. ``atom.index.values``)
+
+    Returns:
+        csr (:class:`~scipy.sparse.csr_matrix`): Adjacency matrix (sorted indices)
+    """
+    n = len(index)
+    order = np.argsort(index, kind='mergesort')
+    p0 = order[np.searchsorted(index, atom0, sorter=order)]
+    p1 = order[np.searchsorted(index, atom1, sorter=order)]
+    csr = csr_matrix((np.ones((2*len(p0), ), dtype=np.int8),
+                      (np.concatenate((p0, p1)), np.concatenate((p1, p0)))), shape=(n, n))
+    csr.sort_indices()
+    return csr
+
+
+def _angle_table(csr, atom, cells, cdx, periodic):
+    """
+    Bond angles of the atoms of an atom table given their adjacency (see
+    :func:`~exatomic.algorithms.angles.bond_angles`).
+    """
+    center, atom1, atom2, angle = bond_angles(csr.indptr.astype(np.int64),
+                                              csr.indices.astype(np.int64),
+                                              atom['x'].values.astype(np.float64),
+                                              atom['y'].values.astype(np.float64),
+                                              atom['z'].values.astype(np.float64),
+                                              cells, cdx, periodic)
+    index = atom.index.values
+    return AtomThree.from_dict({'atom0': index[center], 'atom1': index[atom1],
+                                'atom2': index[atom2], 'angle': angle,
+                                'frame': atom['frame'].values.astype(np.int64)[center]})
+
+
+def _cells(universe, atom):
+    """
+    Cell matrices of a universe's frames and the cell index of each atom.
+    """
+    cols = ['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']
+    if not universe.periodic:
+        return np.zeros((1, 3, 3)), np.zeros((len(atom), ), dtype=np.int64), False
+    cells = universe.frame[cols].values.astype(np.float64).reshape(-1, 3, 3)
+    cdx = universe.frame.index.get_indexer(atom['frame'].values.astype(np.int64))
+    return cells, cdx.astype(np.int64), True
+
+
+def compute_angles(universe, bonds=True):
+    """
+    Compute bond angles for every frame of a universe.
+
+    Every pair of atoms bonded (see :func:`~exatomic.core.two.compute_atom_two`)
+    to a central atom gives an angle; bonds are counted regardless of which
+    atom of the pair is atom0. Periodic universes (orthorhombic or triclinic)
+    use the minimum image convention.
+
+    .. code-block:: python
+
+        uni.compute_atom_two(bonds_only=True)
+        angles = compute_angles(uni)
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): Universe with two body data
+        bonds (bool): Restrict to bond angles (default True)
+
+    Returns:
+        atom_three (:class:`~exatomic.core.three.AtomThree`): Bond angles
+
+    Warning:
+        If bonds is set to False, angles between all pairs of neighbors
+        (within the two body cutoff) are computed; this may be very large.
+    """
+    atom_two = universe.atom_two
+    if bonds:
+        atom_two = atom_two[atom_two['bond'] == True]
+    atom = universe.atom
+    csr = adjacency(atom_two['atom0'].values.astype(np.int64),
+                    atom_two['atom1'].values.astype(np.int64), atom.index.values)
+    cells, cdx, periodic = _cells(universe, atom)
+    return _angle_table(csr, atom, cells, cdx, periodic)
+
+
 def compute_angles_out_of_core(hdfname, uni, bond=True):
     """
     Given an HDF of atom two body properties, compute angles.
 
     Atomic two body data is expected to have been computed (see
-    :func:`~exatomic.core.two.compute_atom_two_out_of_core`)
+    :func:`~exatomic.core.two.compute_atom_two_out_of_core`). Angles of each
+    frame (see :func:`~exatomic.algorithms.angles.compute_angles`) are saved
+    to the same file with keys ``frame_fdx/atom_angle``.
 
     Args:
         hdfname (str): Path to HDF file containing two body data
         uni (:class:`~exatomic.core.universe.Universe`): Universe
         bond (bool): Restrict to bond angles (default True)
 
+    Returns:
+        frames (array): Frame indices whose angles were computed
+
     Warning:
         If bond is set to False, this process may take a very long time.
     """
-    store = pd.HDFStore(hdfname, mode="a")
-    f = u.atom['frame'].unique()
-    n = len(f)
-    fp = FloatProgress(description="Computing:")
-    display(fp)
-    for i, fdx in enumerate(f):
-        tdf = store.get("frame_"+str(fdx) + "/atom_two")
-        indexes = []
-        radians = []
-        for atom0, group in tdf[tdf['bond'] == True].groupby("atom0"):
-            dx = group['dx'].values.astype(float)
-            dy = group['dy'].values.astype(float)
-            dz = group['dz'].values.astype(float)
-            dr = group['dr'].values.astype(float)
-            atom1 = group['atom1'].values.astype(int)
-            rad, adx = angles(dx, dy, dz, dr, atom0, atom1)
-            indexes.append(adx)
-            radians.append(rad)
-        indexes = np.concatenate(indexes)
-        radians = np.concatenate(radians)
-        adf = pd.DataFrame(indexes, columns=("atom0", "atom1", "atom2"))
-        adf['angle'] = radians
-        store.put("frame_"+str(fdx) + "/atom_angle", adf)
-        fp.value = i/n*100
-    store.close()
-    fp.close()
+    frames = []
+    cells, cdx, periodic = _cells(uni, uni.atom)
+    with pd.HDFStore(hdfname, mode="a") as store:
+        keys = set(store.keys())
+        for fdx, idx in uni.atom.groupby("frame").indices.items():
+            key = "/frame_" + str(fdx) + "/atom_two"
+            if key not in keys or len(idx) == 0:
+                continue
+            tdf = store.get(key)
+            if bond:
+                tdf = tdf[tdf['bond'] == True]
+            atom = uni.atom.iloc[idx]
+            csr = adjacency(tdf['atom0'].values.astype(np.int64),
+                            tdf['atom1'].values.astype(np.int64), atom.index.values)
+            adf = _angle_table(csr, atom, cells, cdx[idx], periodic)
+            adf._revert_categories()
+            store.put("frame_" + str(fdx) + "/atom_angle", pd.DataFrame(adf))
+            frames.append(fdx)
+    return np.array(frames, dtype=np.int64)
+
+
+@nb.jit(nopython=True, nogil=True)
+def dihedral_paths(indptr, indices):
+    """
+    Enumerate all bonded paths i-j-k-l given a (symmetric) bond adjacency.
+
+    Each central bond j-k (j < k) is visited once; paths closing a three
+    membered ring (i = l) are skipped.
+
+    Args:
+        indptr (array): CSR row pointers (by body position)
+        indices (array): CSR column indices (body positions)
+
+    Returns:
+        paths (array): Body positions of each path, shape (npaths, 4)
+    """
+    n = len(indptr) - 1
+    m = 0
+    paths = np.empty((0, 4), dtype=np.int64)
+    for sweep in range(2):
+        if sweep == 1:
+            paths = np.empty((m, 4), dtype=np.int64)
+            m = 0
+        for j in range(n):
+            for q in range(indptr[j], indptr[j + 1]):
+                k = indices[q]
+                if k <= j:
+                    continue
+                for s in range(indptr[j], indptr[j + 1]):
+                    i = indices[s]
+                    if i == k:
+                        continue
+                    for t in range(indptr[k], indptr[k + 1]):
+                        l = indices[t]
+                        if l == j or l == i:
+                            continue
+                        if sweep == 1:
+                            paths[m, 0] = i
+                            paths[m, 1] = j
+                            paths[m, 2] = k
+                            paths[m, 3] = l
+                        m += 1
+    return paths
+
+
+@nb.jit(nopython=True, nogil=True)
+def _path_vector(xyz, f, i, j, cell, inv, periodic):
+    """Separation vector from body i to body j in frame f."""
+    dx = xyz[f, j, 0] - xyz[f, i, 0]
+    dy = xyz[f, j, 1] - xyz[f, i, 1]
+    dz = xyz[f, j, 2] - xyz[f, i, 2]
+    if periodic:
+        return _minimum_image_vector(dx, dy, dz, cell, inv)
+    return dx, dy, dz
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def dihedral_angles(xyz, paths, cells, periodic, bins):
+    """
+    Compute dihedral angles of fixed paths for every frame.
+
+    The angle of path i-j-k-l is that between the planes i-j-k and j-k-l,
+    in (-pi, pi] and positive for a clockwise rotation of i about j-k when
+    viewed from j (IUPAC convention). If bins are given, angles are binned
+    per frame (as in :func:`~numpy.histogram`) instead of being returned.
+
+    Args:
+        xyz (array): Coordinates of shape (nframes, nbodies, 3)
+        paths (array): Body positions of each path, shape (npaths, 4)
+        cells (array): Cell matrix of each frame, shape (nframes, 3, 3)
+        periodic (bool): Use the minimum image convention
+        bins (array): Bin edges (empty to return angles)
+
+    Returns:
+        result (array): Angles (radians) of shape (nframes, npaths) or counts
+        of shape (nframes, len(bins) - 1)
+    """
+    nf = xyz.shape[0]
+    m = len(paths)
+    nbin = len(bins) - 1
+    hist = nbin > 0
+    result = np.zeros((nf, nbin if hist else m), dtype=np.float64)
+    for f in nb.prange(nf):
+        cell = cells[f]
+        inv = _inv3(cell) if periodic else cell
+        for p in range(m):
+            ax, ay, az = _path_vector(xyz, f, paths[p, 0], paths[p, 1], cell, inv, periodic)
+            bx, by, bz = _path_vector(xyz, f, paths[p, 1], paths[p, 2], cell, inv, periodic)
+            cx, cy, cz = _path_vector(xyz, f, paths[p, 2], paths[p, 3], cell, inv, periodic)
+            # Normals of the two planes (a x b and b x c)
+            mx = ay*bz - az*by
+            my = az*bx - ax*bz
+            mz = ax*by - ay*bx
+            nx = by*cz - bz*cy
+            ny = bz*cx - bx*cz
+            nz = bx*cy - by*cx
+            yy = np.sqrt(bx**2 + by**2 + bz**2)*(ax*nx + ay*ny + az*nz)
+            phi = np.arctan2(yy, mx*nx + my*ny + mz*nz)
+            if not hist:
+                result[f, p] = phi
+            elif bins[0] <= phi <= bins[-1]:
+                k = min(np.searchsorted(bins, phi, side='right') - 1, nbin - 1)
+                result[f, k] += 1
+    return result
+
+
+def compute_dihedrals(universe, bins=None, bonds=True):
+    """
+    Compute dihedral (torsion) angles of all bonded paths i-j-k-l for every
+    frame of a trajectory.
+
+    Paths are enumerated once, from the bonds of the first frame (see
+    :func:`~exatomic.core.two.compute_atom_two`, e.g. with
+    ``bonds_only=True``); topology is assumed fixed, i.e. every frame has
+    the same atoms in the same order. Angles are then computed for all frames
+    at once from a contiguous coordinate array, using each frame's cell for
+    periodic universes.
+
+    .. code-block:: python
+
+        uni.compute_atom_two(bonds_only=True)
+        dihedrals = compute_dihedrals(uni)              # Table of all angles
+        counts = compute_dihedrals(uni, bins=72)        # Counts per frame
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): Universe with two body data
+        bins (int, array): Number of (equal) bins in (-pi, pi] or bin edges (default no histogram)
+        bonds (bool): Restrict to bonded paths (default True)
+
+    Returns:
+        dihedrals (:class:`~pandas.DataFrame`): Atoms (atom0 to atom3), dihedral
+        angle (radians) and frame of each path, or (if bins are given) counts
+        per frame (rows) and bin center (columns)
+    """
+    atom = universe.atom
+    frames = atom['frame'].values.astype(np.int64)
+    order = np.argsort(frames, kind='mergesort')
+    fdxs, counts = np.unique(frames, return_counts=True)
+    if len(fdxs) == 0:
+        raise ValueError("Universe has no atoms")
+    if not np.all(counts == counts[0]):
+        raise ValueError("Every frame must have the same number of atoms")
+    index = atom.index.values[order].reshape(len(fdxs), counts[0])
+    atom_two = universe.atom_two
+    if bonds:
+        atom_two = atom_two[atom_two['bond'] == True]
+    atom0 = atom_two['atom0'].values.astype(np.int64)
+    atom1 = atom_two['atom1'].values.astype(np.int64)
+    first = np.isin(atom0, index[0]) & np.isin(atom1, index[0])
+    csr = adjacency(atom0[first], atom1[first], index[0])
+    paths = dihedral_paths(csr.indptr.astype(np.int64), csr.indices.astype(np.int64))
+    xyz = atom[['x', 'y', 'z']].values.astype(np.float64)[order].reshape(len(fdxs), counts[0], 3)
+    if universe.periodic:
+        cols = ['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']
+        cells = universe.frame.loc[fdxs, cols].values.astype(np.float64).reshape(-1, 3, 3)
+    else:
+        cells = np.zeros((len(fdxs), 3, 3))
+    if bins is None:
+        phi = dihedral_angles(xyz, paths, cells, universe.periodic, np.empty((0, )))
+        npath = len(paths)
+        return pd.DataFrame.from_dict({'atom0': index[:, paths[:, 0]].ravel(),
+                                       'atom1': index[:, paths[:, 1]].ravel(),
+                                       'atom2': index[:, paths[:, 2]].ravel(),
+                                       'atom3': index[:, paths[:, 3]].ravel(),
+                                       'dihedral': phi.ravel(),
+                                       'frame': np.repeat(fdxs, npath)})
+    if np.ndim(bins) == 0:
+        bins = np.linspace(-np.pi, np.pi, int(bins) + 1)
+    bins = np.asarray(bins, dtype=np.float64)
+    hist = dihedral_angles(xyz, paths, cells, universe.periodic, bins)
+    hist = pd.DataFrame(hist.astype(np.int64), index=fdxs,
+                        columns=(bins[1:] + bins[:-1])/2)
+    hist.index.name = 'frame'
+    return hist
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+"""
+Coordination Numbers
+#######################
+Per atom, per frame coordination numbers: the number of b atoms within a
+cutoff of each a atom (or a smooth, switching function weighted count).
+Pairs are found with a linked cell search frame by frame, so two body data
+is never materialized.
+"""
+import numpy as np
+import pandas as pd
+from exatomic.core.two import _pdist_frames, _map_frames, _frame_cell
+from exatomic.algorithms.distance import coordination_numbers
+from exatomic.algorithms.pcf import _selection
+
+
+def compute_coordination(universe, a, b, rcut=6.0, r0=None, nn=6, mm=12, dense=False,
+                         n_jobs=1):
+    """
+    Compute the coordination number of every a atom in every frame.
+
+    .. code-block:: python
+
+        cn = compute_coordination(uni, "Na", "O", rcut=6.0)      # Count within 6 au
+        uni.atom['cn'] = cn                                     # Frame-indexed column (NaN if not Na)
+        cn = compute_coordination(uni, "O", "O", rcut=8.0, r0=6.0, dense=True)
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): The universe
+        a (str, list, array): Central atom type (see :func:`~exatomic.algorithms.pcf.radial_pair_correlation`)
+        b (str, list, array): Neighbor atom type
+        rcut (float): Cutoff distance
+        r0 (float): Use the rational switching function with this distance (default count)
+        nn (int): Switching function numerator exponent
+        mm (int): Switching function denominator exponent
+        dense (bool): Return a (frames by a atoms) table rather than a series
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+
+    Returns:
+        cn (:class:`~pandas.Series`): Coordination number by (a) atom index or
+        (if dense) :class:`~pandas.DataFrame` with a row per frame and a column
+        per a atom (in order of appearance within the frame)
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.coordination_numbers`
+    """
+    atom = universe.atom
+    isa = _selection(atom, a)
+    role = isa.astype(np.int64) + 2*_selection(atom, b).astype(np.int64)
+    role = pd.Series(role, index=atom.index)
+    if universe.periodic:
+        boundary = "ortho" if universe.orthorhombic else "triclinic"
+    else:
+        boundary = "free"
+    r0 = 0.0 if r0 is None else float(r0)
+    worker = lambda item: _frame_coordination(item, boundary, rcut, r0, nn, mm)
+    index = []
+    values = []
+    for idx, cn in _map_frames(worker, _pdist_frames(universe, boundary, role), n_jobs):
+        index.append(idx)
+        values.append(cn)
+    index = np.concatenate(index) if len(index) > 0 else np.empty((0, ), dtype=np.int64)
+    values = np.concatenate(values) if len(values) > 0 else np.empty((0, ))
+    cn = pd.Series(values, index=index, name='cn').reindex(atom.index[isa])
+    if not dense:
+        return cn
+    frames = atom.loc[cn.index, 'frame'].values.astype(np.int64)
+    fdxs, counts = np.unique(frames, return_counts=True)
+    if not np.all(counts == counts[0]):
+        raise ValueError("Every frame must have the same number of a atoms (dense)")
+    order = np.argsort(frames, kind='mergesort')
+    return pd.DataFrame(cn.values[order].reshape(len(fdxs), -1),
+                        index=pd.Index(fdxs, name='frame'))
+
+
+def _frame_coordination(item, boundary, rcut, r0, nn, mm):
+    """
+    Coordination numbers of the a atoms of a single frame given the per frame
+    arguments generated by :func:`~exatomic.core.two._pdist_frames` (with roles).
+    """
+    _, args = item
+    x, y, z = args[:3]
+    index, role = args[-2:]
+    cell = _frame_cell(args, boundary)
+    keep = role > 0
+    cn = coordination_numbers(x[keep], y[keep], z[keep], cell, boundary != "free",
+                              role[keep], rcut, r0, nn, mm)
+    isa = (role[keep] & 1) == 1
+    return index[keep][isa], cn[isa]
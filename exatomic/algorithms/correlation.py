@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+"""
+Time Correlation Functions
+############################
+Auto- and cross-correlation functions of per atom (e.g. velocities from the
+:class:`~exatomic.core.atom.Atom` table or QE cp.x vel files, see
+:func:`~exatomic.qe.cp.dynamics.parse_xyz`) or per frame (e.g. dipoles from
+the :class:`~exatomic.core.frame.Frame` table) vector signals, averaged over
+all time origins.
+
+.. math::
+
+    C_{ab}\\left(m\\right) = \\frac{1}{T - m}\\sum_{t=0}^{T-m-1}
+        \\mathbf{a}\\left(t\\right)\\cdot\\mathbf{b}\\left(t + m\\right)
+
+Correlations are computed with zero padded FFTs (O(T log T) for T frames)
+in chunks of atoms, and may be transformed to spectra (e.g. the vibrational
+density of states from the velocity autocorrelation function or IR spectra
+from the dipole derivative autocorrelation function).
+"""
+import numpy as np
+import pandas as pd
+
+
+_windows = {'hann': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman,
+            'bartlett': np.bartlett}
+
+
+def correlate_fft(a, b=None, maxlag=None):
+    """
+    Time correlation function of each body, averaged over all time origins.
+
+    Signals are zero padded (to a power of two at least twice their length) so
+    that the circular correlation computed by the FFT equals the linear one.
+
+    Args:
+        a (array): Signal of shape (frames, bodies, components)
+        b (array): Second signal of the same shape for cross-correlation (default autocorrelation)
+        maxlag (int): Largest lag (in frames) returned (default all)
+
+    Returns:
+        corr (array): Correlation function of shape (lags, bodies)
+    """
+    a = np.asarray(a, dtype=np.float64)
+    nt = a.shape[0]
+    nlag = nt if maxlag is None else min(int(maxlag) + 1, nt)
+    n = 1 << (2*nt - 1).bit_length()
+    fa = np.fft.rfft(a, n=n, axis=0)
+    if b is None:
+        prod = (fa*fa.conj()).real
+    else:
+        prod = fa.conj()*np.fft.rfft(np.asarray(b, dtype=np.float64), n=n, axis=0)
+    corr = np.fft.irfft(prod, n=n, axis=0)[:nlag].sum(axis=2)
+    return corr/(nt - np.arange(nlag))[:, None]
+
+
+def _fft_chunksize(nt, ncomp, memory, cross=False):
+    """
+    Number of bodies per chunk such that the (zero padded) FFT work arrays of
+    :func:`~exatomic.algorithms.correlation.correlate_fft` fit in the given
+    number of bytes.
+
+    Args:
+        nt (int): Number of frames
+        ncomp (int): Number of signal components
+        memory (int): Memory budget (bytes)
+        cross (bool): Cross-correlation (two transformed signals)
+
+    Returns:
+        chunksize (int): Bodies per chunk (at least 1)
+    """
+    n = 1 << (2*nt - 1).bit_length()
+    # Complex transforms (n/2 + 1 complex = n doubles each), their product and
+    # the real inverse transform, per component
+    per_body = 8*n*ncomp*(4 if cross else 3)
+    return max(1, int(memory)//per_body)
+
+
+def _frame_array(df, columns):
+    """
+    Reshape the given columns of a per atom (with a 'frame' column) or per frame
+    table into a contiguous (frames, bodies, components) array.
+
+    Returns:
+        arr (array): Signal array
+        order (array): Row order of the table corresponding to the flattened array
+        nat (int): Number of bodies per frame
+    """
+    if 'frame' not in df.columns:
+        arr = df[list(columns)].values.astype(np.float64)
+        return arr[:, None, :], np.arange(len(df)), 1
+    frames = df['frame'].values.astype(np.int64)
+    order = np.argsort(frames, kind='mergesort')
+    fdxs, counts = np.unique(frames, return_counts=True)
+    if not np.all(counts == counts[0]):
+        raise ValueError("Every frame must have the same number of atoms")
+    arr = df[list(columns)].values.astype(np.float64)[order]
+    return arr.reshape(len(fdxs), counts[0], len(columns)), order, counts[0]
+
+
+def _group_mean(values, groups, name):
+    """
+    Average (lags, bodies) values over bodies, optionally per group (one
+    label per body).
+    """
+    lag = pd.Index(np.arange(len(values)), name='lag')
+    if groups is None:
+        return pd.Series(values.mean(axis=1), index=lag, name=name)
+    keys, inverse = np.unique(np.asarray(groups).astype(str), return_inverse=True)
+    means = np.zeros((len(values), len(keys)), dtype=np.float64)
+    for k in range(len(keys)):
+        means[:, k] = values[:, inverse == k].mean(axis=1)
+    return pd.DataFrame(means, index=lag, columns=keys)
+
+
+def time_correlation(df, columns=("vx", "vy", "vz"), other=None, by=None, maxlag=None,
+                     normalize=False, chunksize=None, memory=2**28):
+    """
+    Compute the auto- or cross-correlation function of a vector signal.
+
+    Per atom signals come from tables with a 'frame' column (every frame must
+    contain the same atoms in the same order); otherwise each row is a frame.
+    The correlation of each atom is computed in chunks of atoms and averaged
+    (per group if requested). Unless given, the number of atoms per chunk is
+    chosen such that the FFT work arrays of a chunk fit in the memory budget;
+    for 10^5 frames of 3 component signals a single atom requires about 20 MB.
+
+    .. code-block:: python
+
+        vacf = time_correlation(uni.atom, by='symbol')                  # Velocity autocorrelation
+        vel = parse_xyz("cp.vel", symbols, columns=("vx", "vy", "vz"))  # QE cp.x velocities
+        vacf = time_correlation(vel, normalize=True)
+        dacf = time_correlation(uni.frame, ("dx", "dy", "dz"))          # Dipole autocorrelation
+        ccf = time_correlation(uni.atom, ("vx", "vy", "vz"), other=("fx", "fy", "fz"))
+
+    Args:
+        df (:class:`~pandas.DataFrame`): Per atom or per frame table
+        columns (iterable): Signal columns (components)
+        other (iterable): Columns of the second signal (cross-correlation)
+        by (str): Column by which atoms are grouped (default average over all atoms)
+        maxlag (int): Largest lag (in frames) computed (default all)
+        normalize (bool): Divide by the zero lag value
+        chunksize (int): Number of atoms processed at a time (default from memory)
+        memory (int): Memory budget (bytes) for the FFT work arrays of a chunk
+
+    Returns:
+        corr (:class:`~pandas.Series`): Correlation function by lag (in frames)
+        or :class:`~pandas.DataFrame` with a column per group if by is given
+    """
+    columns = list(columns)
+    if other is not None and len(list(other)) != len(columns):
+        raise ValueError("Signals must have the same number of components")
+    a, order, nat = _frame_array(df, columns)
+    b = None if other is None else _frame_array(df, other)[0]
+    nlag = len(a) if maxlag is None else min(int(maxlag) + 1, len(a))
+    if chunksize is None:
+        chunksize = _fft_chunksize(len(a), len(columns), memory, other is not None)
+    corr = np.empty((nlag, nat), dtype=np.float64)
+    for i in range(0, nat, chunksize):
+        bb = None if b is None else b[:, i:i + chunksize]
+        corr[:, i:i + chunksize] = correlate_fft(a[:, i:i + chunksize], bb, maxlag)
+    groups = None if by is None else df[by].values[order][:nat]
+    corr = _group_mean(corr, groups, 'corr')
+    if normalize:
+        corr /= corr.iloc[0]
+    return corr
+
+
+def correlation_spectrum(corr, dt=1.0, window="hann", pad=None):
+    """
+    Spectrum (cosine transform) of a time correlation function.
+
+    The correlation function is multiplied by the decaying half of the window
+    function (to suppress truncation ripples) and zero padded before the FFT.
+    Frequencies are in inverse units of dt (cycles per unit time).
+
+    .. code-block:: python
+
+        vacf = time_correlation(uni.atom, normalize=True)
+        vdos = correlation_spectrum(vacf, dt=0.5)        # dt in fs gives frequencies in 1/fs
+
+    Args:
+        corr (:class:`~pandas.Series`): Correlation function(s) by lag (or DataFrame)
+        dt (float): Time between frames
+        window (str): One of 'hann', 'hamming', 'blackman', 'bartlett' or None
+        pad (int): Length of the transform (default next power of two of twice the number of lags)
+
+    Returns:
+        spectrum (:class:`~pandas.Series`): Intensity by frequency (or DataFrame)
+    """
+    values = np.asarray(corr, dtype=np.float64)
+    vec = values.ndim == 1
+    if vec:
+        values = values[:, None]
+    nlag = len(values)
+    if window is not None:
+        if window not in _windows:
+            raise ValueError("Unknown window {}, choose from {}".format(window, list(_windows)))
+        values = values*_windows[window](2*nlag)[nlag:, None]
+    n = 1 << (2*nlag - 1).bit_length() if pad is None else int(pad)
+    # Even extension of the correlation function: a real cosine transform
+    spec = 2*np.fft.rfft(values, n=n, axis=0).real - values[0]
+    freq = pd.Index(np.fft.rfftfreq(n, d=dt), name='frequency')
+    if vec:
+        return pd.Series(spec[:, 0]*dt, index=freq, name='intensity')
+    return pd.DataFrame(spec*dt, index=freq, columns=corr.columns)
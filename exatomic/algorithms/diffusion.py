@@ -7,11 +7,12 @@ Diffusion Coefficients
 Various algorithms for computing diffusion coefficients are coded here.
 """
 from exa.util.units import Length, Time
-from exatomic.algorithms.displacement import absolute_squared_displacement
+from exatomic.algorithms.displacement import (absolute_squared_displacement,
+                                              mean_squared_displacement)
 
 
 def einstein_relation(universe, input_time='ps', input_length='au',
-                      length='cm', time='s'):
+                      length='cm', time='s', all_origins=True):
     """
     Compute the (time dependent) diffusion coefficient using Einstein's relation.
 
@@ -28,6 +29,7 @@ def einstein_relation(universe, input_time='ps', input_length='au',
         input_length (str): String unit of xyz coordinates
         length (str): String unit name of output length unit
         time (str): Sting unit name of output time unit
+        all_origins (bool): Average over all time origins (default) rather than only the first frame
 
     Returns:
         d (:class:`~exa.core.numerical.DataFrame`): Diffussion coefficient as a function of time
@@ -35,7 +37,15 @@ def einstein_relation(universe, input_time='ps', input_length='au',
     Note:
         The asymptotic value of the returned variable is the diffusion coefficient.
         The default units of the diffusion coefficient are :math:`\\frac{cm^{2}}{s}`.
+        If all_origins is True, the result is indexed by lag (in frames, see
+        :func:`~exatomic.algorithms.displacement.mean_squared_displacement`)
+        and frames are assumed equally spaced in time.
     """
+    if all_origins:
+        msd = mean_squared_displacement(universe, by=None)
+        t = universe.frame['time'].values
+        t = (t[msd.index.values] - t[0])*Time[input_time, time]
+        return msd*Length[input_length, length]**2/(6*t)
     msd = absolute_squared_displacement(universe).mean(axis=1)
     t = universe.frame['time'] * Time[input_time, time]
     msd *= Length[input_length, length]**2
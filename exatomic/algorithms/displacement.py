@@ -7,6 +7,8 @@ Computation of Displacement
 """
 import numpy as np
 import pandas as pd
+from exatomic.algorithms.correlation import (correlate_fft, _frame_array, _group_mean,
+                                             _fft_chunksize)
 
 
 def absolute_squared_displacement(universe, ref_frame=None):
@@ -42,3 +44,148 @@ def absolute_squared_displacement(universe, ref_frame=None):
     df.index = universe.frame.index.copy()
     df.columns = universe.atom['label'].unique()
     return df
+
+
+def msd_fft(xyz):
+    """
+    Mean squared displacement of each body, averaged over all time origins.
+
+    Uses the FFT formulation, which scales as O(T log T) for T frames:
+
+    .. math::
+
+        MSD(m) = \\frac{1}{T - m}\\sum_{k=0}^{T-m-1}\\left|\\mathbf{r}(k + m)
+            - \\mathbf{r}(k)\\right|^{2} = S_{1}(m) - 2S_{2}(m)
+
+    where :math:`S_{2}` is the position autocorrelation function (computed with
+    a zero padded FFT) and :math:`S_{1}` follows from a recursion over the
+    squared positions.
+
+    Args:
+        xyz (array): Unwrapped positions of shape (frames, bodies, 3)
+
+    Returns:
+        msd (array): Mean squared displacement of shape (frames, bodies) by lag (in frames)
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    nt = xyz.shape[0]
+    count = (nt - np.arange(nt))[:, None]
+    dsq = (xyz**2).sum(axis=2)
+    # S1: recursive sum of squared positions
+    total = 2*dsq.sum(axis=0)
+    drop = np.cumsum(dsq + dsq[::-1], axis=0)
+    s1 = np.empty_like(dsq)
+    s1[0] = total
+    s1[1:] = total - drop[:-1]
+    s1 /= count
+    # S2: position autocorrelation
+    return s1 - 2*correlate_fft(xyz)
+
+
+def unwrap_positions(xyz, cells):
+    """
+    Unwrap a trajectory of in cell positions into continuous coordinates.
+
+    Integer image flags are kept for every body in fractional coordinates:
+    the change in fractional position between consecutive frames (each in
+    its own cell) is rounded to the image crossing, and the flags are the
+    cumulative sum of these crossings. The unwrapped position of each frame
+    is its wrapped position shifted by the flags in that frame's cell. This
+    handles orthorhombic and triclinic cells as well as cells that change
+    from frame to frame (e.g. NPT dynamics), provided no body moves more than
+    half a cell length between frames.
+
+    Args:
+        xyz (array): Wrapped positions of shape (frames, bodies, 3)
+        cells (array): Cell matrices (rows are cell vectors) of shape (frames, 3, 3)
+
+    Returns:
+        unwrapped (array): Unwrapped positions of shape (frames, bodies, 3)
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    cells = np.asarray(cells, dtype=np.float64)
+    frac = np.einsum('tni,tij->tnj', xyz, np.linalg.inv(cells))
+    # Image flags: cumulative sum of rounded fractional jumps
+    images = np.zeros_like(frac)
+    np.cumsum(-np.rint(np.diff(frac, axis=0)), axis=0, out=images[1:])
+    unwrapped = xyz + np.einsum('tni,tij->tnj', images, cells)
+    return unwrapped
+
+
+def unwrap_trajectory(universe, dense=False):
+    """
+    Unwrap the atomic positions of a periodic universe so that every atom
+    follows a continuous path across frames (as needed for MSD and diffusion
+    coefficients).
+
+    Every frame must contain the same atoms in the same order. Cells are read
+    per frame from the frame table, see
+    :func:`~exatomic.algorithms.displacement.unwrap_positions`.
+
+    .. code-block:: python
+
+        uni.atom[['ux', 'uy', 'uz']] = unwrap_trajectory(uni)
+        xyz = unwrap_trajectory(uni, dense=True)       # (frames, atoms, 3)
+
+    Args:
+        universe (:class:`~exatomic.Universe`): Periodic universe
+        dense (bool): Return a (frames by atoms by 3) array rather than a table
+
+    Returns:
+        unwrapped (:class:`~pandas.DataFrame`): Unwrapped ux, uy, uz
+        coordinates (indexed like the atom table) or an array if dense
+    """
+    atom = universe.atom
+    xyz, order, nat = _frame_array(atom, ('x', 'y', 'z'))
+    if universe.frame.is_periodic():
+        fdxs = np.unique(atom['frame'].values.astype(np.int64))
+        cols = ['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']
+        cells = universe.frame.loc[fdxs, cols].values.astype(np.float64).reshape(-1, 3, 3)
+        xyz = unwrap_positions(xyz, cells)
+    if dense:
+        return xyz
+    unwrapped = np.empty((len(atom), 3), dtype=np.float64)
+    unwrapped[order] = xyz.reshape(-1, 3)
+    return pd.DataFrame(unwrapped, index=atom.index, columns=['ux', 'uy', 'uz'])
+
+
+def mean_squared_displacement(universe, by="symbol", chunksize=None, unwrap=False,
+                              memory=2**28):
+    """
+    Compute the mean squared displacement, averaged over all time origins, as
+    a function of lag time.
+
+    Positions of all frames are assembled into a contiguous (frames by atoms
+    by 3) array and the MSD of each atom is computed with
+    :func:`~exatomic.algorithms.displacement.msd_fft` in chunks of atoms, then
+    averaged per species. Every frame must contain the same atoms in the same
+    order, and coordinates must be unwrapped (continuous across periodic
+    boundaries, see :func:`~exatomic.algorithms.displacement.unwrap_trajectory`).
+
+    .. code-block:: python
+
+        msd = mean_squared_displacement(uni)             # Column per symbol
+        msd = mean_squared_displacement(uni, by=None)    # Average over all atoms
+
+    Args:
+        universe (:class:`~exatomic.Universe`): The universe containing atomic positions
+        by (str): Atom table column by which atoms are grouped (None for all atoms)
+        chunksize (int): Number of atoms processed at a time (default from memory)
+        unwrap (bool): Unwrap (in cell) periodic coordinates first
+        memory (int): Memory budget (bytes) for the FFT work arrays of a chunk
+
+    Returns:
+        msd (:class:`~pandas.DataFrame`): Mean squared displacement by lag (in
+        frames, index) and species (columns) or :class:`~pandas.Series` if by is None
+    """
+    atom = universe.atom
+    xyz, order, nat = _frame_array(atom, ('x', 'y', 'z'))
+    if unwrap:
+        xyz = unwrap_trajectory(universe, dense=True)
+    if chunksize is None:
+        chunksize = _fft_chunksize(len(xyz), 3, memory)
+    msd = np.empty(xyz.shape[:2], dtype=np.float64)
+    for i in range(0, nat, chunksize):
+        msd[:, i:i + chunksize] = msd_fft(xyz[:, i:i + chunksize])
+    groups = None if by is None else atom[by].values[order][:nat]
+    return _group_mean(msd, groups, 'msd')
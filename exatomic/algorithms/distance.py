@@ -33,6 +33,27 @@ def modv(x, y):
     return np.mod(x, y)
 
 
+@nb.jit(nopython=True, nogil=True)
+def _grow(arr, n):
+    """
+    Return a copy of a 1D array (arr) enlarged to length n.
+    """
+    new = np.empty((n, ), dtype=arr.dtype)
+    new[:len(arr)] = arr
+    return new
+
+
+@nb.jit(nopython=True, nogil=True)
+def _initial_size(n, nn):
+    """
+    Initial result buffer length for n bodies with at most nn pairs.
+
+    Buffers start proportional to n (rather than nn) and are doubled as
+    needed, so that memory scales with the number of pairs found.
+    """
+    return min(nn, 32*n + 1024)
+
+
 @nb.jit(nopython=True, nogil=True, parallel=nbpll)
 def pdist_ortho(ux, uy, uz, a, b, c, index, dmax=8.0):
     """
@@ -59,11 +80,12 @@ def pdist_ortho(ux, uy, uz, a, b, c, index, dmax=8.0):
     dmax2 = dmax**2
     n = len(ux)
     nn = n*(n - 1)//2
-    dx = np.empty((nn, ), dtype=np.float64)
+    size = _initial_size(n, nn)
+    dx = np.empty((size, ), dtype=np.float64)
     dy = dx.copy()
     dz = dx.copy()
     dr = dx.copy()
-    ii = np.empty((nn, ), dtype=np.int64)
+    ii = np.empty((size, ), dtype=np.int64)
     jj = ii.copy()
     projection = ii.copy()
     k = 0
@@ -74,6 +96,15 @@ def pdist_ortho(ux, uy, uz, a, b, c, index, dmax=8.0):
         zi = uz[i]
         # For each atom j
         for j in range(i+1, n):
+            if k == size:
+                size = min(nn, 2*size)
+                dx = _grow(dx, size)
+                dy = _grow(dy, size)
+                dz = _grow(dz, size)
+                dr = _grow(dr, size)
+                ii = _grow(ii, size)
+                jj = _grow(jj, size)
+                projection = _grow(projection, size)
             xj = ux[j]
             yj = uy[j]
             zj = uz[j]
@@ -113,13 +144,13 @@ def pdist_ortho(ux, uy, uz, a, b, c, index, dmax=8.0):
                         prj += 1
             if inck:
                 k += 1
-    dx = dx[:k]
-    dy = dy[:k]
-    dz = dz[:k]
-    dr = dr[:k]
-    ii = ii[:k]
-    jj = jj[:k]
-    projection = projection[:k]
+    dx = dx[:k].copy()
+    dy = dy[:k].copy()
+    dz = dz[:k].copy()
+    dr = dr[:k].copy()
+    ii = ii[:k].copy()
+    jj = jj[:k].copy()
+    projection = projection[:k].copy()
     return dx, dy, dz, dr, ii, jj, projection
 
 
@@ -149,8 +180,9 @@ def pdist_ortho_nv(ux, uy, uz, a, b, c, index, dmax=8.0):
     dmax2 = dmax**2
     n = len(ux)
     nn = n*(n - 1)//2
-    dr = np.empty((nn, ), dtype=np.float64)
-    ii = np.empty((nn, ), dtype=np.int64)
+    size = _initial_size(n, nn)
+    dr = np.empty((size, ), dtype=np.float64)
+    ii = np.empty((size, ), dtype=np.int64)
     jj = ii.copy()
     projection = ii.copy()
     k = 0
@@ -161,6 +193,12 @@ def pdist_ortho_nv(ux, uy, uz, a, b, c, index, dmax=8.0):
         zi = uz[i]
         # For each atom j
         for j in range(i+1, n):
+            if k == size:
+                size = min(nn, 2*size)
+                dr = _grow(dr, size)
+                ii = _grow(ii, size)
+                jj = _grow(jj, size)
+                projection = _grow(projection, size)
             xj = ux[j]
             yj = uy[j]
             zj = uz[j]
@@ -197,10 +235,10 @@ def pdist_ortho_nv(ux, uy, uz, a, b, c, index, dmax=8.0):
                         prj += 1
             if inck:
                 k += 1
-    dr = dr[:k]
-    ii = ii[:k]
-    jj = jj[:k]
-    projection = projection[:k]
+    dr = dr[:k].copy()
+    ii = ii[:k].copy()
+    jj = jj[:k].copy()
+    projection = projection[:k].copy()
     return dr, ii, jj, projection
 
 
@@ -214,11 +252,12 @@ def pdist(x, y, z, index, dmax=8.0):
     dmax2 = dmax**2
     m = len(x)
     n = m*(m - 1)//2
-    dx = np.empty((n, ), dtype=np.float64)
+    size = _initial_size(m, n)
+    dx = np.empty((size, ), dtype=np.float64)
     dy = dx.copy()
     dz = dx.copy()
     dr = dx.copy()
-    atom0 = np.empty((n, ), dtype=np.int64)
+    atom0 = np.empty((size, ), dtype=np.int64)
     atom1 = atom0.copy()
     k = 0
     for i in range(m):
@@ -226,6 +265,14 @@ def pdist(x, y, z, index, dmax=8.0):
         yi = y[i]
         zi = z[i]
         for j in range(i + 1, m):
+            if k == size:
+                size = min(n, 2*size)
+                dx = _grow(dx, size)
+                dy = _grow(dy, size)
+                dz = _grow(dz, size)
+                dr = _grow(dr, size)
+                atom0 = _grow(atom0, size)
+                atom1 = _grow(atom1, size)
             dx_ = xi - x[j]
             dy_ = yi - y[j]
             dz_ = zi - z[j]
@@ -238,12 +285,12 @@ def pdist(x, y, z, index, dmax=8.0):
                 atom0[k] = index[i]
                 atom1[k] = index[j]
                 k += 1
-    dx = dx[:k]
-    dy = dy[:k]
-    dz = dz[:k]
-    dr = dr[:k]
-    atom0 = atom0[:k]
-    atom1 = atom1[:k]
+    dx = dx[:k].copy()
+    dy = dy[:k].copy()
+    dz = dz[:k].copy()
+    dr = dr[:k].copy()
+    atom0 = atom0[:k].copy()
+    atom1 = atom1[:k].copy()
     return dx, dy, dz, dr, atom0, atom1
 
 
@@ -257,8 +304,9 @@ def pdist_nv(x, y, z, index, dmax=8.0):
     dmax2 = dmax**2
     m = len(x)
     n = m*(m - 1)//2
-    dr = np.empty((n, ), dtype=np.float64)
-    atom0 = np.empty((n, ), dtype=np.int64)
+    size = _initial_size(m, n)
+    dr = np.empty((size, ), dtype=np.float64)
+    atom0 = np.empty((size, ), dtype=np.int64)
     atom1 = atom0.copy()
     k = 0
     for i in range(m):
@@ -266,13 +314,914 @@ def pdist_nv(x, y, z, index, dmax=8.0):
         yi = y[i]
         zi = z[i]
         for j in range(i + 1, m):
+            if k == size:
+                size = min(n, 2*size)
+                dr = _grow(dr, size)
+                atom0 = _grow(atom0, size)
+                atom1 = _grow(atom1, size)
             dr_ = (xi - x[j])**2 + (yi - y[j])**2 + (zi - z[j])**2
             if dr_ < dmax2:
                 dr[k] = np.sqrt(dr_)
                 atom0[k] = index[i]
                 atom1[k] = index[j]
                 k += 1
-    dr = dr[:k]
-    atom0 = atom0[:k]
-    atom1 = atom1[:k]
+    dr = dr[:k].copy()
+    atom0 = atom0[:k].copy()
+    atom1 = atom1[:k].copy()
     return dr, atom0, atom1
+
+
+@nb.jit(nopython=True, nogil=True)
+def _bin_cells(cx, cy, cz, nx, ny, nz):
+    """
+    Counting sort of bodies into a grid of (linked) cells.
+
+    Args:
+        cx (array): Integer cell index in x of each body
+        cy (array): Integer cell index in y of each body
+        cz (array): Integer cell index in z of each body
+        nx (int): Number of cells in x
+        ny (int): Number of cells in y
+        nz (int): Number of cells in z
+
+    Returns:
+        start (array): Offsets into order for each cell (length ncells + 1)
+        order (array): Positions of bodies sorted by cell
+    """
+    n = len(cx)
+    ncell = nx*ny*nz
+    start = np.zeros((ncell + 1, ), dtype=np.int64)
+    cell = np.empty((n, ), dtype=np.int64)
+    for i in range(n):
+        cell[i] = (cx[i]*ny + cy[i])*nz + cz[i]
+        start[cell[i] + 1] += 1
+    for i in range(ncell):
+        start[i + 1] += start[i]
+    fill = start[:-1].copy()
+    order = np.empty((n, ), dtype=np.int64)
+    for i in range(n):
+        order[fill[cell[i]]] = i
+        fill[cell[i]] += 1
+    return start, order
+
+
+@nb.jit(nopython=True, nogil=True)
+def _neighbor_cells(c, n, periodic):
+    """
+    Unique neighboring cell indices (including c itself) along one dimension.
+    """
+    if periodic and n < 3:
+        return np.arange(n)
+    cells = np.empty((3, ), dtype=np.int64)
+    m = 0
+    for d in range(-1, 2):
+        cc = c + d
+        if periodic:
+            cc = cc % n
+        elif cc < 0 or cc >= n:
+            continue
+        cells[m] = cc
+        m += 1
+    return cells[:m]
+
+
+@nb.jit(nopython=True, nogil=True)
+def _inv3(cell):
+    """
+    Inverse of a 3x3 (cell) matrix via its adjugate.
+    """
+    inv = np.empty((3, 3), dtype=np.float64)
+    for i in range(3):
+        for j in range(3):
+            inv[j, i] = (cell[(i+1)%3, (j+1)%3]*cell[(i+2)%3, (j+2)%3] -
+                         cell[(i+1)%3, (j+2)%3]*cell[(i+2)%3, (j+1)%3])
+    det = cell[0, 0]*inv[0, 0] + cell[0, 1]*inv[1, 0] + cell[0, 2]*inv[2, 0]
+    return inv/det
+
+
+@nb.jit(nopython=True, nogil=True)
+def _plane_spacings(cell):
+    """
+    Distances between opposite faces of a (triclinic) cell.
+
+    The cell matrix rows are the cell vectors; the spacing between faces
+    spanned by two vectors is the volume divided by the area of that face.
+    """
+    inv = _inv3(cell)
+    spacing = np.empty((3, ), dtype=np.float64)
+    for i in range(3):
+        spacing[i] = 1.0/np.sqrt(inv[0, i]**2 + inv[1, i]**2 + inv[2, i]**2)
+    return spacing
+
+
+@nb.jit(nopython=True, nogil=True)
+def _is_ortho(cell):
+    """True if the cell matrix is diagonal."""
+    for i in range(3):
+        for j in range(3):
+            if i != j and cell[i, j] != 0.0:
+                return False
+    return True
+
+
+@nb.jit(nopython=True, nogil=True)
+def _minimum_image(dx, dy, dz, cell, ortho):
+    """
+    Minimum image of the separation (dx, dy, dz) of two bodies in a cell.
+
+    Only the 27 projections (-1, 0, 1 along each cell vector) of the first
+    body are considered, as in :func:`~exatomic.algorithms.distance.pdist_ortho`.
+
+    Returns:
+        dx, dy, dz (float): Separation vector of the closest projection
+        prj (int): Projection index (0 to 26, 13 being the unit cell)
+    """
+    if ortho:
+        sa = max(-1, min(1, -int(np.round(dx/cell[0, 0]))))
+        sb = max(-1, min(1, -int(np.round(dy/cell[1, 1]))))
+        sc = max(-1, min(1, -int(np.round(dz/cell[2, 2]))))
+        return (dx + sa*cell[0, 0], dy + sb*cell[1, 1], dz + sc*cell[2, 2],
+                (sa + 1)*9 + (sb + 1)*3 + sc + 1)
+    dpr = np.inf
+    dpx = 0.0
+    dpy = 0.0
+    dpz = 0.0
+    prj = 13
+    prj_ = 0
+    for sa in range(-1, 2):
+        for sb in range(-1, 2):
+            for sc in range(-1, 2):
+                dpx_ = dx + sa*cell[0, 0] + sb*cell[1, 0] + sc*cell[2, 0]
+                dpy_ = dy + sa*cell[0, 1] + sb*cell[1, 1] + sc*cell[2, 1]
+                dpz_ = dz + sa*cell[0, 2] + sb*cell[1, 2] + sc*cell[2, 2]
+                dpr_ = dpx_**2 + dpy_**2 + dpz_**2
+                if dpr_ < dpr:
+                    dpr = dpr_
+                    dpx = dpx_
+                    dpy = dpy_
+                    dpz = dpz_
+                    prj = prj_
+                prj_ += 1
+    return dpx, dpy, dpz, prj
+
+
+@nb.jit(nopython=True, nogil=True)
+def _cell_grid(x, y, z, cell, periodic, dmax):
+    """
+    Bin bodies into a grid of (linked) cells whose widths are at least dmax.
+
+    For periodic systems cells are constructed in fractional coordinates of
+    the (possibly triclinic) cell matrix, whose rows are the cell vectors.
+
+    Returns:
+        cx, cy, cz (array): Integer cell index of each body along each dimension
+        nx, ny, nz (int): Number of cells along each dimension
+        start (array): Offsets into order for each cell (see :func:`~exatomic.algorithms.distance._bin_cells`)
+        order (array): Positions of bodies sorted by cell
+    """
+    n = len(x)
+    fx = np.empty((n, ), dtype=np.float64)
+    fy = fx.copy()
+    fz = fx.copy()
+    if periodic:
+        # Cell widths (face spacings) and fractional coordinates
+        lx, ly, lz = _plane_spacings(cell)
+        inv = _inv3(cell)
+        for i in range(n):
+            fx[i] = x[i]*inv[0, 0] + y[i]*inv[1, 0] + z[i]*inv[2, 0]
+            fy[i] = x[i]*inv[0, 1] + y[i]*inv[1, 1] + z[i]*inv[2, 1]
+            fz[i] = x[i]*inv[0, 2] + y[i]*inv[1, 2] + z[i]*inv[2, 2]
+    else:
+        ox = x.min() if n > 0 else 0.0
+        oy = y.min() if n > 0 else 0.0
+        oz = z.min() if n > 0 else 0.0
+        lx = (x.max() - ox) if n > 0 else 0.0
+        ly = (y.max() - oy) if n > 0 else 0.0
+        lz = (z.max() - oz) if n > 0 else 0.0
+        for i in range(n):
+            fx[i] = (x[i] - ox)/lx if lx > 0.0 else 0.0
+            fy[i] = (y[i] - oy)/ly if ly > 0.0 else 0.0
+            fz[i] = (z[i] - oz)/lz if lz > 0.0 else 0.0
+    nx = max(1, int(lx/dmax))
+    ny = max(1, int(ly/dmax))
+    nz = max(1, int(lz/dmax))
+    if not periodic:
+        # Cap the number of (mostly empty) cells for sparse systems
+        while nx*ny*nz > 4*n + 64:
+            if nx >= ny and nx >= nz:
+                nx = max(1, nx//2)
+            elif ny >= nz:
+                ny = max(1, ny//2)
+            else:
+                nz = max(1, nz//2)
+    cx = np.empty((n, ), dtype=np.int64)
+    cy = cx.copy()
+    cz = cx.copy()
+    for i in range(n):
+        if periodic:
+            cx[i] = int(np.floor(fx[i]*nx)) % nx
+            cy[i] = int(np.floor(fy[i]*ny)) % ny
+            cz[i] = int(np.floor(fz[i]*nz)) % nz
+        else:
+            cx[i] = min(int(fx[i]*nx), nx - 1)
+            cy[i] = min(int(fy[i]*ny), ny - 1)
+            cz[i] = min(int(fz[i]*nz), nz - 1)
+    start, order = _bin_cells(cx, cy, cz, nx, ny, nz)
+    return cx, cy, cz, nx, ny, nz, start, order
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def _pdist_cells(x, y, z, cell, periodic, index, dmax, vector, rad, extra):
+    """
+    Linked cell pairwise distance search shared by the cell list kernels.
+
+    Bodies are binned into cells whose widths are at least dmax so that
+    only the 27 cells surrounding a body need to be searched. The search is
+    performed twice; the first pass counts the number of pairs within dmax
+    and the second fills exactly sized result arrays. For periodic systems
+    cells are constructed in fractional coordinates of the (possibly
+    triclinic) cell matrix, whose rows are the cell vectors, the minimum
+    image convention is used and the projection index follows that of
+    :func:`~exatomic.algorithms.distance.pdist_ortho`.
+
+    If per body radii (rad) are given, only pairs closer than the sum of their
+    radii plus extra (i.e. bonds) are kept and the search is restricted to
+    that (typically much shorter) distance.
+    """
+    n = len(x)
+    bonds = len(rad) > 0
+    if bonds and n > 0:
+        dmax = min(dmax, 2*rad.max() + extra)
+    dmax2 = dmax**2
+    ortho = _is_ortho(cell)
+    cx, cy, cz, nx, ny, nz, start, order = _cell_grid(x, y, z, cell, periodic, dmax)
+    k = 0
+    nv = 0
+    dx = np.empty((nv, ), dtype=np.float64)
+    dy = dx.copy()
+    dz = dx.copy()
+    dr = dx.copy()
+    atom0 = np.empty((nv, ), dtype=np.int64)
+    atom1 = atom0.copy()
+    projection = atom0.copy()
+    for sweep in range(2):
+        if sweep == 1:
+            nv = k if vector else 0
+            dx = np.empty((nv, ), dtype=np.float64)
+            dy = np.empty((nv, ), dtype=np.float64)
+            dz = np.empty((nv, ), dtype=np.float64)
+            dr = np.empty((k, ), dtype=np.float64)
+            atom0 = np.empty((k, ), dtype=np.int64)
+            atom1 = np.empty((k, ), dtype=np.int64)
+            projection = np.empty((k if periodic else 0, ), dtype=np.int64)
+            k = 0
+        for i in range(n):
+            xi = x[i]
+            yi = y[i]
+            zi = z[i]
+            for ncx in _neighbor_cells(cx[i], nx, periodic):
+                for ncy in _neighbor_cells(cy[i], ny, periodic):
+                    for ncz in _neighbor_cells(cz[i], nz, periodic):
+                        cll = (ncx*ny + ncy)*nz + ncz
+                        for p in range(start[cll], start[cll + 1]):
+                            j = order[p]
+                            if j <= i:
+                                continue
+                            dx_ = xi - x[j]
+                            dy_ = yi - y[j]
+                            dz_ = zi - z[j]
+                            prj = 13
+                            if periodic:
+                                dx_, dy_, dz_, prj = _minimum_image(dx_, dy_, dz_, cell, ortho)
+                            dr2_ = dx_**2 + dy_**2 + dz_**2
+                            if bonds and dr2_ > (rad[i] + rad[j] + extra)**2:
+                                continue
+                            if dr2_ < dmax2:
+                                if sweep == 1:
+                                    if vector:
+                                        dx[k] = dx_
+                                        dy[k] = dy_
+                                        dz[k] = dz_
+                                    dr[k] = np.sqrt(dr2_)
+                                    atom0[k] = index[i]
+                                    atom1[k] = index[j]
+                                    if periodic:
+                                        projection[k] = prj
+                                k += 1
+    return dx, dy, dz, dr, atom0, atom1, projection
+
+
+# Placeholder (no radii) for the linked cell search
+_NORAD = np.empty((0, ), dtype=np.float64)
+
+
+@nb.jit(nopython=True, nogil=True)
+def _ortho_cell(a, b, c):
+    """Cell matrix of an orthorhombic cell."""
+    cell = np.zeros((3, 3), dtype=np.float64)
+    cell[0, 0] = a
+    cell[1, 1] = b
+    cell[2, 2] = c
+    return cell
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_cells(x, y, z, index, dmax=8.0):
+    """
+    Pairwise distance computation for points in cartesian space using a
+    linked cell (cell list) search; scales linearly with the number of points.
+
+    Does return distance vectors.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist`
+    """
+    dx, dy, dz, dr, atom0, atom1, _ = _pdist_cells(x, y, z, np.zeros((3, 3)), False,
+                                                   index, dmax, True, _NORAD, 0.0)
+    return dx, dy, dz, dr, atom0, atom1
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_cells_nv(x, y, z, index, dmax=8.0):
+    """
+    Pairwise distance computation for points in cartesian space using a
+    linked cell (cell list) search; scales linearly with the number of points.
+
+    Does not return distance vectors.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_nv`
+    """
+    _, _, _, dr, atom0, atom1, _ = _pdist_cells(x, y, z, np.zeros((3, 3)), False,
+                                                index, dmax, False, _NORAD, 0.0)
+    return dr, atom0, atom1
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_ortho_cells(ux, uy, uz, a, b, c, index, dmax=8.0):
+    """
+    Pairwise two body calculation for bodies in an orthorhombic periodic cell
+    using a linked cell (cell list) search.
+
+    Does return distance vectors. Results (including projections) are the
+    same as those of :func:`~exatomic.algorithms.distance.pdist_ortho`.
+
+    Args:
+        ux (array): In unit cell x array
+        uy (array): In unit cell y array
+        uz (array): In unit cell z array
+        a (float): Unit cell dimension a
+        b (float): Unit cell dimension b
+        c (float): Unit cell dimension c
+        index (array): Atom indexes
+        dmax (float): Maximum distance of interest
+    """
+    return _pdist_cells(ux, uy, uz, _ortho_cell(a, b, c), True, index, dmax, True,
+                        _NORAD, 0.0)
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_ortho_cells_nv(ux, uy, uz, a, b, c, index, dmax=8.0):
+    """
+    Pairwise two body calculation for bodies in an orthorhombic periodic cell
+    using a linked cell (cell list) search.
+
+    Does not return distance vectors.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_ortho_cells`
+    """
+    _, _, _, dr, ii, jj, projection = _pdist_cells(ux, uy, uz, _ortho_cell(a, b, c),
+                                                   True, index, dmax, False, _NORAD, 0.0)
+    return dr, ii, jj, projection
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def _pdist_triclinic(ux, uy, uz, cell, index, dmax, vector):
+    """
+    All pairs minimum image search in a triclinic cell (see pdist_triclinic).
+    """
+    dmax2 = dmax**2
+    n = len(ux)
+    nn = n*(n - 1)//2
+    size = _initial_size(n, nn)
+    nv = size if vector else 0
+    dx = np.empty((nv, ), dtype=np.float64)
+    dy = dx.copy()
+    dz = dx.copy()
+    dr = np.empty((size, ), dtype=np.float64)
+    ii = np.empty((size, ), dtype=np.int64)
+    jj = ii.copy()
+    projection = ii.copy()
+    # Cartesian shifts of the 27 projections
+    shifts = np.empty((27, 3), dtype=np.float64)
+    prj = 0
+    for aa in range(-1, 2):
+        for bb in range(-1, 2):
+            for cc in range(-1, 2):
+                for l in range(3):
+                    shifts[prj, l] = aa*cell[0, l] + bb*cell[1, l] + cc*cell[2, l]
+                prj += 1
+    k = 0
+    for i in range(n):
+        xi = ux[i]
+        yi = uy[i]
+        zi = uz[i]
+        for j in range(i+1, n):
+            if k == size:
+                size = min(nn, 2*size)
+                if vector:
+                    dx = _grow(dx, size)
+                    dy = _grow(dy, size)
+                    dz = _grow(dz, size)
+                dr = _grow(dr, size)
+                ii = _grow(ii, size)
+                jj = _grow(jj, size)
+                projection = _grow(projection, size)
+            dx_ = xi - ux[j]
+            dy_ = yi - uy[j]
+            dz_ = zi - uz[j]
+            dpr = dmax2
+            inck = False
+            for prj in range(27):
+                dpx_ = dx_ + shifts[prj, 0]
+                dpy_ = dy_ + shifts[prj, 1]
+                dpz_ = dz_ + shifts[prj, 2]
+                dpr_ = dpx_**2 + dpy_**2 + dpz_**2
+                if dpr_ < dpr:
+                    if vector:
+                        dx[k] = dpx_
+                        dy[k] = dpy_
+                        dz[k] = dpz_
+                    dr[k] = np.sqrt(dpr_)
+                    ii[k] = index[i]
+                    jj[k] = index[j]
+                    projection[k] = prj
+                    dpr = dpr_
+                    inck = True
+            if inck:
+                k += 1
+    nv = k if vector else 0
+    return (dx[:nv].copy(), dy[:nv].copy(), dz[:nv].copy(), dr[:k].copy(),
+            ii[:k].copy(), jj[:k].copy(), projection[:k].copy())
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_triclinic(ux, uy, uz, cell, index, dmax=8.0):
+    """
+    Pairwise two body calculation for bodies in a general (triclinic)
+    periodic cell.
+
+    Does return distance vectors.
+
+    The cell is given as a 3x3 matrix whose rows are the cell vectors
+    (i.e. ``[[xi, yi, zi], [xj, yj, zj], [xk, yk, zk]]`` from the
+    :class:`~exatomic.core.frame.Frame` table). Coordinates must be in the
+    unit cell (fractional coordinates between 0 and 1). The projection index
+    has the same meaning as in :func:`~exatomic.algorithms.distance.pdist_ortho`,
+    with projection (aa, bb, cc) of atom i located at
+    ``r_i + aa*a + bb*b + cc*c``.
+
+    Args:
+        ux (array): In unit cell x array
+        uy (array): In unit cell y array
+        uz (array): In unit cell z array
+        cell (array): Cell matrix (rows are cell vectors)
+        index (array): Atom indexes
+        dmax (float): Maximum distance of interest
+    """
+    return _pdist_triclinic(ux, uy, uz, cell, index, dmax, True)
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_triclinic_nv(ux, uy, uz, cell, index, dmax=8.0):
+    """
+    Pairwise two body calculation for bodies in a general (triclinic)
+    periodic cell.
+
+    Does not return distance vectors.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_triclinic`
+    """
+    _, _, _, dr, ii, jj, projection = _pdist_triclinic(ux, uy, uz, cell, index,
+                                                       dmax, False)
+    return dr, ii, jj, projection
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_triclinic_cells(ux, uy, uz, cell, index, dmax=8.0):
+    """
+    Pairwise two body calculation for bodies in a general (triclinic)
+    periodic cell using a linked cell (cell list) search.
+
+    Does return distance vectors.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_triclinic`
+    """
+    return _pdist_cells(ux, uy, uz, cell, True, index, dmax, True, _NORAD, 0.0)
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_triclinic_cells_nv(ux, uy, uz, cell, index, dmax=8.0):
+    """
+    Pairwise two body calculation for bodies in a general (triclinic)
+    periodic cell using a linked cell (cell list) search.
+
+    Does not return distance vectors.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_triclinic`
+    """
+    _, _, _, dr, ii, jj, projection = _pdist_cells(ux, uy, uz, cell, True,
+                                                   index, dmax, False, _NORAD, 0.0)
+    return dr, ii, jj, projection
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_bonds(x, y, z, index, codes, radii, bond_extra=0.45, dmax=8.0):
+    """
+    Bond detection for points in cartesian space.
+
+    Rather than computing all distances up to dmax and determining bonds
+    afterwards, only bonded pairs, those closer than the sum of their
+    (covalent) radii plus bond_extra, are searched for and returned.
+
+    Does return distance vectors.
+
+    Args:
+        x (array): Cartesian x array
+        y (array): Cartesian y array
+        z (array): Cartesian z array
+        index (array): Atom indexes
+        codes (array): Integer (symbol category) code of each atom
+        radii (array): Radius of each code
+        bond_extra (float): Additional amount for determining bonds
+        dmax (float): Maximum bond length
+    """
+    dx, dy, dz, dr, atom0, atom1, _ = _pdist_cells(x, y, z, np.zeros((3, 3)), False,
+                                                   index, dmax, True, radii[codes],
+                                                   bond_extra)
+    return dx, dy, dz, dr, atom0, atom1
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_ortho_bonds(ux, uy, uz, a, b, c, index, codes, radii, bond_extra=0.45,
+                      dmax=8.0):
+    """
+    Bond detection for bodies in an orthorhombic periodic cell.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_bonds` and
+        :func:`~exatomic.algorithms.distance.pdist_ortho`
+    """
+    return _pdist_cells(ux, uy, uz, _ortho_cell(a, b, c), True, index, dmax, True,
+                        radii[codes], bond_extra)
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_triclinic_bonds(ux, uy, uz, cell, index, codes, radii, bond_extra=0.45,
+                          dmax=8.0):
+    """
+    Bond detection for bodies in a general (triclinic) periodic cell.
+
+    See Also:
+        :func:`~exatomic.algorithms.distance.pdist_bonds` and
+        :func:`~exatomic.algorithms.distance.pdist_triclinic`
+    """
+    return _pdist_cells(ux, uy, uz, cell, True, index, dmax, True, radii[codes],
+                        bond_extra)
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def wrap_triclinic(x, y, z, cell):
+    """
+    Wrap cartesian coordinates into a (triclinic) unit cell.
+
+    Args:
+        x (array): Cartesian x array
+        y (array): Cartesian y array
+        z (array): Cartesian z array
+        cell (array): Cell matrix (rows are cell vectors)
+
+    Returns:
+        ux, uy, uz (array): In unit cell coordinates
+    """
+    inv = _inv3(cell)
+    n = len(x)
+    ux = np.empty((n, ), dtype=np.float64)
+    uy = ux.copy()
+    uz = ux.copy()
+    for i in range(n):
+        fa = x[i]*inv[0, 0] + y[i]*inv[1, 0] + z[i]*inv[2, 0]
+        fb = x[i]*inv[0, 1] + y[i]*inv[1, 1] + z[i]*inv[2, 1]
+        fc = x[i]*inv[0, 2] + y[i]*inv[1, 2] + z[i]*inv[2, 2]
+        fa -= np.floor(fa)
+        fb -= np.floor(fb)
+        fc -= np.floor(fc)
+        ux[i] = fa*cell[0, 0] + fb*cell[1, 0] + fc*cell[2, 0]
+        uy[i] = fa*cell[0, 1] + fb*cell[1, 1] + fc*cell[2, 1]
+        uz[i] = fa*cell[0, 2] + fb*cell[1, 2] + fc*cell[2, 2]
+    return ux, uy, uz
+
+
+@nb.jit(nopython=True, nogil=True)
+def unwrap_bonded(x, y, z, order, parent, cells, cdx):
+    """
+    Make bonded clusters (molecules) whole across periodic boundaries.
+
+    Atoms are visited along a spanning forest of the bond graph (parents
+    before children); each atom is placed at the minimum image of its
+    position relative to its (already placed) parent.
+
+    Args:
+        x (array): Cartesian x array
+        y (array): Cartesian y array
+        z (array): Cartesian z array
+        order (array): Visiting order (positions), e.g. breadth first
+        parent (array): Position of each atom's parent (negative for roots)
+        cells (array): Cell matrices (rows are cell vectors), shape (ncells, 3, 3)
+        cdx (array): Index of each atom's cell matrix
+
+    Returns:
+        ux, uy, uz (array): Unwrapped coordinates
+    """
+    invs = np.empty_like(cells)
+    for k in range(len(cells)):
+        invs[k] = _inv3(cells[k])
+    ux = x.copy()
+    uy = y.copy()
+    uz = z.copy()
+    for i in order:
+        p = parent[i]
+        if p < 0:
+            continue
+        cell = cells[cdx[i]]
+        inv = invs[cdx[i]]
+        dx = x[i] - x[p]
+        dy = y[i] - y[p]
+        dz = z[i] - z[p]
+        fa = dx*inv[0, 0] + dy*inv[1, 0] + dz*inv[2, 0]
+        fb = dx*inv[0, 1] + dy*inv[1, 1] + dz*inv[2, 1]
+        fc = dx*inv[0, 2] + dy*inv[1, 2] + dz*inv[2, 2]
+        fa -= np.round(fa)
+        fb -= np.round(fb)
+        fc -= np.round(fc)
+        ux[i] = ux[p] + fa*cell[0, 0] + fb*cell[1, 0] + fc*cell[2, 0]
+        uy[i] = uy[p] + fa*cell[0, 1] + fb*cell[1, 1] + fc*cell[2, 1]
+        uz[i] = uz[p] + fa*cell[0, 2] + fb*cell[1, 2] + fc*cell[2, 2]
+    return ux, uy, uz
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def verlet_list(x, y, z, cell, periodic, rlist):
+    """
+    Build a (Verlet) neighbor list of all pairs within rlist.
+
+    Args:
+        x (array): Cartesian (in unit cell, if periodic) x array
+        y (array): Cartesian (in unit cell, if periodic) y array
+        z (array): Cartesian (in unit cell, if periodic) z array
+        cell (array): Cell matrix (rows are cell vectors), ignored if not periodic
+        periodic (bool): Periodic boundary conditions
+        rlist (float): List cutoff (distance of interest plus skin)
+
+    Returns:
+        ii (array): Position (not index) of the first body of each pair
+        jj (array): Position of the second body of each pair
+    """
+    index = np.arange(len(x))
+    _, _, _, _, ii, jj, _ = _pdist_cells(x, y, z, cell, periodic, index, rlist,
+                                         False, _NORAD, 0.0)
+    return ii, jj
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def pdist_pairs(x, y, z, cell, periodic, index, ii, jj, dmax, vector):
+    """
+    Pairwise distance computation restricted to candidate pairs (e.g. a
+    neighbor list from :func:`~exatomic.algorithms.distance.verlet_list`).
+
+    Args:
+        x (array): Cartesian (in unit cell, if periodic) x array
+        y (array): Cartesian (in unit cell, if periodic) y array
+        z (array): Cartesian (in unit cell, if periodic) z array
+        cell (array): Cell matrix (rows are cell vectors), ignored if not periodic
+        periodic (bool): Periodic boundary conditions
+        index (array): Atom indexes
+        ii (array): Position of the first body of each candidate pair
+        jj (array): Position of the second body of each candidate pair
+        dmax (float): Maximum distance of interest
+        vector (bool): Return distance vectors
+
+    Returns:
+        dx, dy, dz, dr, atom0, atom1, projection (array): As in the cell kernels
+    """
+    ortho = _is_ortho(cell)
+    dmax2 = dmax**2
+    m = len(ii)
+    nv = m if vector else 0
+    dx = np.empty((nv, ), dtype=np.float64)
+    dy = dx.copy()
+    dz = dx.copy()
+    dr = np.empty((m, ), dtype=np.float64)
+    atom0 = np.empty((m, ), dtype=np.int64)
+    atom1 = atom0.copy()
+    projection = np.empty((m if periodic else 0, ), dtype=np.int64)
+    k = 0
+    for p in range(m):
+        i = ii[p]
+        j = jj[p]
+        dx_ = x[i] - x[j]
+        dy_ = y[i] - y[j]
+        dz_ = z[i] - z[j]
+        prj = 13
+        if periodic:
+            dx_, dy_, dz_, prj = _minimum_image(dx_, dy_, dz_, cell, ortho)
+        dr2_ = dx_**2 + dy_**2 + dz_**2
+        if dr2_ < dmax2:
+            if vector:
+                dx[k] = dx_
+                dy[k] = dy_
+                dz[k] = dz_
+            dr[k] = np.sqrt(dr2_)
+            atom0[k] = index[i]
+            atom1[k] = index[j]
+            if periodic:
+                projection[k] = prj
+            k += 1
+    nv = k if vector else 0
+    return (dx[:nv].copy(), dy[:nv].copy(), dz[:nv].copy(), dr[:k].copy(),
+            atom0[:k].copy(), atom1[:k].copy(),
+            projection[:(k if periodic else 0)].copy())
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def max_displacement(x, y, z, x0, y0, z0, cell, periodic):
+    """
+    Largest (minimum image) displacement of any body from reference positions.
+
+    Args:
+        x (array): Current x array
+        y (array): Current y array
+        z (array): Current z array
+        x0 (array): Reference x array
+        y0 (array): Reference y array
+        z0 (array): Reference z array
+        cell (array): Cell matrix (rows are cell vectors), ignored if not periodic
+        periodic (bool): Periodic boundary conditions
+
+    Returns:
+        dmax (float): Maximum displacement
+    """
+    ortho = _is_ortho(cell)
+    dmax2 = 0.0
+    for i in range(len(x)):
+        dx = x[i] - x0[i]
+        dy = y[i] - y0[i]
+        dz = z[i] - z0[i]
+        if periodic:
+            dx, dy, dz, _ = _minimum_image(dx, dy, dz, cell, ortho)
+        dmax2 = max(dmax2, dx**2 + dy**2 + dz**2)
+    return np.sqrt(dmax2)
+
+
+@nb.jit(nopython=True, nogil=True)
+def pair_histogram(x, y, z, cell, periodic, codes, ncode, bins):
+    """
+    Histogram of pair distances by (ordered) pair of body codes.
+
+    Pairs are found using the linked cell search (see
+    :func:`~exatomic.algorithms.distance._pdist_cells`) with a cutoff of the
+    largest bin edge and counted directly; no pair distances are stored.
+    Each (unordered) pair of bodies i < j is counted once, in
+    ``hist[codes[i], codes[j]]``; bins have the same meaning as in
+    :func:`~numpy.histogram` (the last bin includes its right edge).
+
+    Args:
+        x (array): Cartesian (in unit cell, if periodic) x array
+        y (array): Cartesian (in unit cell, if periodic) y array
+        z (array): Cartesian (in unit cell, if periodic) z array
+        cell (array): Cell matrix (rows are cell vectors), ignored if not periodic
+        periodic (bool): Periodic boundary conditions
+        codes (array): Integer code (0 to ncode - 1) of each body
+        ncode (int): Number of codes
+        bins (array): Monotonically increasing bin edges
+
+    Returns:
+        hist (array): Pair counts of shape (ncode, ncode, len(bins) - 1)
+    """
+    nbin = len(bins) - 1
+    hist = np.zeros((ncode, ncode, nbin), dtype=np.int64)
+    n = len(x)
+    if n < 2 or nbin < 1:
+        return hist
+    lo = bins[0]
+    hi = bins[-1]
+    width = (hi - lo)/nbin
+    ortho = _is_ortho(cell)
+    cx, cy, cz, nx, ny, nz, start, order = _cell_grid(x, y, z, cell, periodic, hi)
+    for i in range(n):
+        xi = x[i]
+        yi = y[i]
+        zi = z[i]
+        for ncx in _neighbor_cells(cx[i], nx, periodic):
+            for ncy in _neighbor_cells(cy[i], ny, periodic):
+                for ncz in _neighbor_cells(cz[i], nz, periodic):
+                    cll = (ncx*ny + ncy)*nz + ncz
+                    for p in range(start[cll], start[cll + 1]):
+                        j = order[p]
+                        if j <= i:
+                            continue
+                        dx = xi - x[j]
+                        dy = yi - y[j]
+                        dz = zi - z[j]
+                        if periodic:
+                            dx, dy, dz, _ = _minimum_image(dx, dy, dz, cell, ortho)
+                        dr = np.sqrt(dx**2 + dy**2 + dz**2)
+                        if dr < lo or dr > hi:
+                            continue
+                        b = min(int((dr - lo)/width), nbin - 1)
+                        # Correct for (non-uniform bins or) rounding at the edges
+                        while b > 0 and dr < bins[b]:
+                            b -= 1
+                        while b < nbin - 1 and dr >= bins[b + 1]:
+                            b += 1
+                        hist[codes[i], codes[j], b] += 1
+    return hist
+
+
+@nb.jit(nopython=True, nogil=True)
+def coordination_numbers(x, y, z, cell, periodic, role, rcut, r0=0.0, nn=6, mm=12):
+    """
+    Number of b bodies within a cutoff of every a body.
+
+    Pairs are found using the linked cell search (see
+    :func:`~exatomic.algorithms.distance._pdist_cells`); no pair data is
+    stored. If r0 is positive, each neighbor contributes the (smooth) rational
+    switching function
+
+    .. math::
+
+        s(r) = \\frac{1 - (r/r_0)^n}{1 - (r/r_0)^m}
+
+    rather than 1 (neighbors beyond rcut are always ignored).
+
+    Args:
+        x (array): Cartesian (in unit cell, if periodic) x array
+        y (array): Cartesian (in unit cell, if periodic) y array
+        z (array): Cartesian (in unit cell, if periodic) z array
+        cell (array): Cell matrix (rows are cell vectors), ignored if not periodic
+        periodic (bool): Periodic boundary conditions
+        role (array): 1 (a), 2 (b), 3 (both) or 0 (neither) for each body
+        rcut (float): Cutoff distance
+        r0 (float): Switching function distance (default 0, i.e. count)
+        nn (int): Switching function numerator exponent
+        mm (int): Switching function denominator exponent
+
+    Returns:
+        cn (array): Coordination number of each body (zero if not a)
+    """
+    n = len(x)
+    cn = np.zeros((n, ), dtype=np.float64)
+    if n < 2:
+        return cn
+    rcut2 = rcut**2
+    ortho = _is_ortho(cell)
+    cx, cy, cz, nx, ny, nz, start, order = _cell_grid(x, y, z, cell, periodic, rcut)
+    for i in range(n):
+        if role[i] == 0:
+            continue
+        for ncx in _neighbor_cells(cx[i], nx, periodic):
+            for ncy in _neighbor_cells(cy[i], ny, periodic):
+                for ncz in _neighbor_cells(cz[i], nz, periodic):
+                    cll = (ncx*ny + ncy)*nz + ncz
+                    for p in range(start[cll], start[cll + 1]):
+                        j = order[p]
+                        if j <= i or role[j] == 0:
+                            continue
+                        ij = (role[i] & 1) != 0 and (role[j] & 2) != 0
+                        ji = (role[j] & 1) != 0 and (role[i] & 2) != 0
+                        if not (ij or ji):
+                            continue
+                        dx = x[i] - x[j]
+                        dy = y[i] - y[j]
+                        dz = z[i] - z[j]
+                        if periodic:
+                            dx, dy, dz, _ = _minimum_image(dx, dy, dz, cell, ortho)
+                        dr2 = dx**2 + dy**2 + dz**2
+                        if dr2 > rcut2:
+                            continue
+                        s = 1.0
+                        if r0 > 0.0:
+                            q = np.sqrt(dr2)/r0
+                            if abs(q - 1.0) < 1e-8:
+                                s = nn/mm
+                            else:
+                                s = (1.0 - q**nn)/(1.0 - q**mm)
+                        if ij:
+                            cn[i] += s
+                        if ji:
+                            cn[j] += s
+    return cn
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+"""
+Hydrogen Bonds
+####################
+Geometric detection of hydrogen bonds D-H...A: the donor (D) to acceptor (A)
+distance must not exceed a cutoff and the D-H...A angle must be at least a
+given minimum. Hydrogen atoms are assigned to donors using bonds (see
+:func:`~exatomic.core.two.compute_atom_two`); donor acceptor pairs are found
+with a linked cell search so that the cost scales linearly with the number
+of atoms.
+"""
+import numpy as np
+import numba as nb
+import pandas as pd
+from exatomic.base import nbpll
+from exatomic.core.two import _pdist_frames, _map_frames, _frame_cell
+from exatomic.algorithms.distance import (_cell_grid, _neighbor_cells, _minimum_image,
+                                          _is_ortho)
+
+
+@nb.jit(nopython=True, nogil=True)
+def _hbond_check(d, h, x, y, z, cell, periodic, ortho, dax, day, daz, cosmax):
+    """
+    Cosine of the D-H...A angle given the donor to acceptor vector (or 2 if
+    the angle criterion is not met).
+    """
+    dhx = x[h] - x[d]
+    dhy = y[h] - y[d]
+    dhz = z[h] - z[d]
+    if periodic:
+        dhx, dhy, dhz, _ = _minimum_image(dhx, dhy, dhz, cell, ortho)
+    # Vectors from H to D and from H to A
+    hax = dax - dhx
+    hay = day - dhy
+    haz = daz - dhz
+    cos = -(dhx*hax + dhy*hay + dhz*haz)/np.sqrt((dhx**2 + dhy**2 + dhz**2)*
+                                                 (hax**2 + hay**2 + haz**2))
+    return cos if cos <= cosmax else 2.0
+
+
+@nb.jit(nopython=True, nogil=True, parallel=nbpll)
+def hbonds(x, y, z, cell, periodic, role, hptr, hidx, dmax, cosmax):
+    """
+    Find geometric hydrogen bonds in a single frame.
+
+    Args:
+        x (array): Cartesian (in unit cell, if periodic) x array
+        y (array): Cartesian (in unit cell, if periodic) y array
+        z (array): Cartesian (in unit cell, if periodic) z array
+        cell (array): Cell matrix (rows are cell vectors), ignored if not periodic
+        periodic (bool): Periodic boundary conditions
+        role (array): 1 (donor), 2 (acceptor), 3 (both) or 0 (hydrogen or neither) for each body
+        hptr (array): Offsets into hidx of the hydrogens of each body (length nbodies + 1)
+        hidx (array): Positions of hydrogen bodies (grouped by donor)
+        dmax (float): Maximum donor to acceptor distance
+        cosmax (float): Maximum cosine of the D-H...A angle
+
+    Returns:
+        donor (array): Position of the donor
+        hydrogen (array): Position of the hydrogen
+        acceptor (array): Position of the acceptor
+        distance (array): Donor to acceptor distance
+        angle (array): D-H...A angle (degrees)
+    """
+    heavy = np.flatnonzero(role > 0)
+    hx = x[heavy]
+    hy = y[heavy]
+    hz = z[heavy]
+    ortho = _is_ortho(cell)
+    cx, cy, cz, nx, ny, nz, start, order = _cell_grid(hx, hy, hz, cell, periodic, dmax)
+    dmax2 = dmax**2
+    k = 0
+    donor = np.empty((0, ), dtype=np.int64)
+    hydrogen = donor.copy()
+    acceptor = donor.copy()
+    distance = np.empty((0, ), dtype=np.float64)
+    angle = distance.copy()
+    for sweep in range(2):
+        if sweep == 1:
+            donor = np.empty((k, ), dtype=np.int64)
+            hydrogen = np.empty((k, ), dtype=np.int64)
+            acceptor = np.empty((k, ), dtype=np.int64)
+            distance = np.empty((k, ), dtype=np.float64)
+            angle = np.empty((k, ), dtype=np.float64)
+            k = 0
+        for ii in range(len(heavy)):
+            for ncx in _neighbor_cells(cx[ii], nx, periodic):
+                for ncy in _neighbor_cells(cy[ii], ny, periodic):
+                    for ncz in _neighbor_cells(cz[ii], nz, periodic):
+                        cll = (ncx*ny + ncy)*nz + ncz
+                        for p in range(start[cll], start[cll + 1]):
+                            jj = order[p]
+                            if jj == ii:
+                                continue
+                            # Pairs are visited in both orders: i is the donor
+                            i = heavy[ii]
+                            j = heavy[jj]
+                            if (role[i] & 1) == 0 or (role[j] & 2) == 0:
+                                continue
+                            dx = x[j] - x[i]
+                            dy = y[j] - y[i]
+                            dz = z[j] - z[i]
+                            if periodic:
+                                dx, dy, dz, _ = _minimum_image(dx, dy, dz, cell, ortho)
+                            dr2 = dx**2 + dy**2 + dz**2
+                            if dr2 > dmax2:
+                                continue
+                            for q in range(hptr[i], hptr[i + 1]):
+                                h = hidx[q]
+                                cos = _hbond_check(i, h, x, y, z, cell, periodic, ortho,
+                                                   dx, dy, dz, cosmax)
+                                if cos > 1.0:
+                                    continue
+                                if sweep == 1:
+                                    donor[k] = i
+                                    hydrogen[k] = h
+                                    acceptor[k] = j
+                                    distance[k] = np.sqrt(dr2)
+                                    angle[k] = np.degrees(np.arccos(max(-1.0, cos)))
+                                k += 1
+    return donor, hydrogen, acceptor, distance, angle
+
+
+def compute_hbonds(universe, donors=("N", "O", "F"), acceptors=("N", "O", "F"),
+                   dmax=6.6, angle=120.0, n_jobs=1):
+    """
+    Detect hydrogen bonds in every frame of a universe.
+
+    A hydrogen bond D-H...A exists if the donor to acceptor distance is at most
+    dmax and the D-H...A angle is at least angle. Hydrogens belong to the
+    donors they are bonded to, so bonds must have been computed (e.g. using
+    ``uni.compute_atom_two(bonds_only=True)``). Frames are processed
+    independently (by a pool of workers, see n_jobs); periodic universes
+    (orthorhombic or triclinic) use the minimum image convention.
+
+    .. code-block:: python
+
+        uni.compute_atom_two(bonds_only=True)
+        hbond, counts = compute_hbonds(uni, n_jobs=4)
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): Universe with bonds
+        donors (iterable): Symbols of donor atoms
+        acceptors (iterable): Symbols of acceptor atoms
+        dmax (float): Maximum donor to acceptor distance (default 6.6 au, about 3.5 Angstrom)
+        angle (float): Minimum D-H...A angle (degrees)
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+
+    Returns:
+        hbond (:class:`~pandas.DataFrame`): Donor, hydrogen, acceptor (atom indices),
+        donor to acceptor distance, D-H...A angle (degrees) and frame
+        counts (:class:`~pandas.Series`): Number of hydrogen bonds per frame
+    """
+    atom = universe.atom
+    symbol = atom['symbol'].astype(str)
+    isd = symbol.isin(donors).values
+    role = pd.Series(isd.astype(np.int64) + 2*symbol.isin(acceptors).values.astype(np.int64),
+                     index=atom.index)
+    # Hydrogens bonded to donors
+    two = universe.atom_two
+    two = two[two['bond'] == True]
+    atom0 = two['atom0'].values.astype(np.int64)
+    atom1 = two['atom1'].values.astype(np.int64)
+    ish = (symbol == "H").values
+    pos = pd.Index(atom.index)
+    p0 = pos.get_indexer(atom0)
+    p1 = pos.get_indexer(atom1)
+    d = np.concatenate((atom0[isd[p0] & ish[p1]], atom1[isd[p1] & ish[p0]]))
+    h = np.concatenate((atom1[isd[p0] & ish[p1]], atom0[isd[p1] & ish[p0]]))
+    # Donor hydrogen pairs split by frame once (each worker only sees its own frame)
+    dh = pd.Series(h, index=d)
+    dh = dict(tuple(dh.groupby(atom['frame'].values[pos.get_indexer(d)].astype(np.int64))))
+    if universe.periodic:
+        boundary = "ortho" if universe.orthorhombic else "triclinic"
+    else:
+        boundary = "free"
+    cosmax = np.cos(np.radians(angle))
+    empty = pd.Series([], dtype=np.int64)
+    worker = lambda item: _frame_hbonds(item, boundary, dh.get(item[0], empty), dmax, cosmax)
+    frames = []
+    counts = {}
+    for fdx, result in _map_frames(worker, _pdist_frames(universe, boundary, role), n_jobs):
+        frames.append(result)
+        counts[fdx] = len(result)
+    if len(frames) > 0:
+        hbond = pd.concat(frames, ignore_index=True)
+    else:
+        hbond = pd.DataFrame(columns=['donor', 'hydrogen', 'acceptor', 'distance',
+                                      'angle', 'frame'])
+    counts = pd.Series(counts, name='hbond_count').reindex(universe.frame.index, fill_value=0)
+    return hbond, counts
+
+
+def _frame_hbonds(item, boundary, pairs, dmax, cosmax):
+    """
+    Hydrogen bonds of a single frame given the per frame arguments generated
+    by :func:`~exatomic.core.two._pdist_frames` (with roles) and the frame's
+    hydrogens (values) indexed by donor.
+    """
+    fdx, args = item
+    x, y, z = args[:3]
+    index, role = args[-2:]
+    cell = _frame_cell(args, boundary)
+    # Hydrogens of each donor (by position)
+    pos = pd.Index(index)
+    dpos = pos.get_indexer(pairs.index.values)
+    hpos = pos.get_indexer(pairs.values)
+    order = np.argsort(dpos, kind='mergesort')
+    hptr = np.zeros((len(index) + 1, ), dtype=np.int64)
+    hptr[1:] = np.cumsum(np.bincount(dpos, minlength=len(index)))
+    donor, hydrogen, acceptor, distance, angle = hbonds(x, y, z, cell, boundary != "free",
+                                                        role, hptr, hpos[order], dmax, cosmax)
+    return fdx, pd.DataFrame.from_dict({'donor': index[donor], 'hydrogen': index[hydrogen],
+                                        'acceptor': index[acceptor], 'distance': distance,
+                                        'angle': angle, 'frame': fdx})
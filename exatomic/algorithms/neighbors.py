@@ -1,309 +1,410 @@
-# -*- coding: utf-8 -*-
-# Copyright (c) 2015-2020, Exa Analytics Development Team
-# Distributed under the terms of the Apache License 2.0
-"""
-Neighbor Selection Algorithms
-###############################
-This module provides algoirthms for selecting nearest neighbors, e.g. nearest
-solvent molecules to a solute molecule. Because two body properties do not always
-represent the desired molecules (i.e. bonds appear where they are not desired),
-these algorithms are not completely black box.
-
-Before performing a search, check that the molecule table is computed as desired
-and classified (if necessary): see :func:`~exatomic.two.BaseTwo.compute_bonds`
-and :func:`~exatomic.molecule.Molecule.classify`.
-"""
-import numpy as np
-import pandas as pd
-import numba as nb
-from collections import defaultdict
-from IPython.display import display
-from ipywidgets import FloatProgress
-from exatomic.base import nbpll
-from exatomic.core.atom import Atom
-from exatomic.core.universe import Universe
-
-
-@nb.jit(nopython=True, parallel=nbpll)
-def _worker(idx, x, y, z, a):
-    """
-    Generate a 3x3x3 'super' cell from a cubic unit cell.
-
-    Args:
-        idx (array): Array of index values
-        x (array): Array of x coordinates
-        y (array): Array of y coordinates
-        z (array): Array of z coordinates
-        a (float): Cubic unit cell dimension
-    """
-    n = len(x)
-    idxs = np.empty((27*n, ), dtype=np.int64)
-    prj = idxs.copy()
-    px = np.empty((27*n, ), dtype=np.float64)
-    py = px.copy()
-    pz = px.copy()
-    p = 0
-    m = 0
-    for i in [-1, 0, 1]:
-        for j in [-1, 0, 1]:
-            for k in [-1, 0, 1]:
-                for l in range(n):
-                    idxs[m] = idx[l]
-                    px[m] = x[l] + i*a
-                    py[m] = y[l] + j*a
-                    pz[m] = z[l] + k*a
-                    prj[m] = p
-                    m += 1
-                p += 1
-    return idxs, px, py, pz, prj
-
-
-def _create_super_universe(u, a):
-    """
-    Generate a 3x3x3 super cell from a cubic periodic universe
-
-    Args:
-        u (:class:`~exatomic.core.universe.Universe`): Universe
-        a (float): Cubic unit cell dimension
-
-    Returns:
-        uni (:class:`~exatomic.core.universe.Universe`): Universe of 3x3x3x super cell
-    """
-    adxs = []
-    xs = []
-    ys = []
-    zs = []
-    prjs = []
-    fdxs = []
-    grps = u.atom.groupby("frame")
-    for fdx, atom in grps:
-        adx, x, y, z, prj = _worker(atom.index.values.astype(np.int64),
-                                    atom['x'].values.astype(np.float64),
-                                    atom['y'].values.astype(np.float64),
-                                    atom['z'].values.astype(np.float64), a)
-        adxs.append(adx)
-        xs.append(x)
-        ys.append(y)
-        zs.append(z)
-        prjs.append(prj)
-        fdxs += [fdx]*len(adx)
-    adxs = np.concatenate(adxs)
-    xs = np.concatenate(xs)
-    ys = np.concatenate(ys)
-    zs = np.concatenate(zs)
-    prjs = np.concatenate(prjs)
-    # Overwrite the last 'atom' group because that value doesn't need to exist anymore
-    atom = pd.DataFrame.from_dict({'atom': adxs, 'x': xs, 'y': ys, 'z': zs, 'prj': prjs})
-    atom['frame'] = fdxs
-    atom['symbol'] = atom['atom'].map(u.atom['symbol'])
-    atom['label'] = atom['atom'].map(u.atom['label'])
-    atom = Atom(atom)
-    return Universe(atom=atom)
-
-
-def periodic_nearest_neighbors_by_atom(uni, source, a, sizes, **kwargs):
-    """
-    Determine nearest neighbor molecules to a given source (or sources) and
-    return the data as a dataframe.
-
-    Warning:
-        For universes with more than about 250 atoms, consider using the
-        slower but more memory efficient
-        :func:`~exatomic.algorithms.neighbors.periodic_nearest_neighbors_by_atom_large`.
-
-    For a simple cubic periodic system with unit cell dimension ``a``,
-    clusters can be generated as follows. In the example below, additional
-    keyword arguments have been included as they are almost always required
-    in order to correctly identify molecular units semi-empirically.
-
-    .. code-block:: python
-
-        periodic_nearest_neighbors_by_atom(u, [0], 40.0, [0, 5, 10, 50],
-                                           dmax=40.0, C=1.6, O=1.6)
-
-    Argument descriptions can be found below. The additional keyword arguments,
-    ``dmax``, ``C``, ``O``, are passed directly to the two body computation used
-    to determine (semi-empirically) molecular units. Note that although molecules
-    are computed, neighboring molecular units are determine by an atom to atom
-    criteria.
-
-    Args:
-        uni (:class:`~exatomic.core.universe.Universe`): Universe
-        source (int, str, list): Integer label or string symbol of source atom
-        a (float): Cubic unit cell dimension
-        sizes (list): List of slices to create
-        kwargs: Additional keyword arguments to be passed to atom two body calculation
-
-    Returns:
-        dct (dict): Dictionary of sliced universes and nearest neighbor table
-
-    See Also:
-        Sliced universe construction can be facilitated by
-        :func:`~exatomic.algorithms.neighbors.construct`.
-    """
-    def sorter(group, source_atom_idxs):
-        s = group[['atom0', 'atom1']].stack()
-        return s[~s.isin(source_atom_idxs)].reset_index()
-
-    if "label" not in uni.atom.columns:
-        uni.atom['label'] = uni.atom.get_atom_labels()
-    dct = defaultdict(list)
-    grps = uni.atom.groupby("frame")
-    ntot = len(grps)
-    fp = FloatProgress(description="Slicing:")
-    display(fp)
-    for i, (fdx, atom) in enumerate(grps):
-        if len(atom) > 0:
-            uu = _create_super_universe(Universe(atom=atom.copy()), a)
-            uu.compute_atom_two(**kwargs)
-            uu.compute_molecule()
-            if isinstance(source, (int, np.int32, np.int64)):
-                source_atom_idxs = uu.atom[(uu.atom.index.isin([source])) &
-                                           (uu.atom['prj'] == 13)].index.values
-            elif isinstance(source, (list, tuple)):
-                source_atom_idxs = uu.atom[uu.atom['label'].isin(source) &
-                                           (uu.atom['prj'] == 13)].index.values
-            else:
-                source_atom_idxs = uu.atom[(uu.atom['symbol'] == source) &
-                                           (uu.atom['prj'] == 13)].index.values
-            source_molecule_idxs = uu.atom.loc[source_atom_idxs, 'molecule'].unique().astype(int)
-            uu.atom_two['frame'] = uu.atom_two['atom0'].map(uu.atom['frame'])
-            nearest_atoms = uu.atom_two[(uu.atom_two['atom0'].isin(source_atom_idxs)) |
-                                        (uu.atom_two['atom1'].isin(source_atom_idxs))].sort_values("dr")[['frame', 'atom0', 'atom1']]
-            nearest = nearest_atoms.groupby("frame").apply(sorter, source_atom_idxs=source_atom_idxs)
-            del nearest['level_1']
-            nearest.index.names = ['frame', 'idx']
-            nearest.columns = ['two', 'atom']
-            nearest['molecule'] = nearest['atom'].map(uu.atom['molecule'])
-            nearest = nearest[~nearest['molecule'].isin(source_molecule_idxs)]
-            nearest = nearest.drop_duplicates('molecule', keep='first')
-            nearest.reset_index(inplace=True)
-            nearest['frame'] = nearest['frame'].astype(int)
-            nearest['molecule'] = nearest['molecule'].astype(int)
-            dct['nearest'].append(nearest)
-            for nn in sizes:
-                atm = []
-                for j, fdx in enumerate(nearest['frame'].unique()):
-                    mdxs = nearest.loc[nearest['frame'] == fdx, 'molecule'].tolist()[:nn]
-                    mdxs.append(source_molecule_idxs[j])
-                    atm.append(uu.atom[uu.atom['molecule'].isin(mdxs)][['symbol', 'x', 'y', 'z', 'frame']].copy())
-                dct[nn].append(pd.concat(atm, ignore_index=True))
-        fp.value = i/ntot*100
-    dct['nearest'] = pd.concat(dct['nearest'], ignore_index=True)
-    for nn in sizes:
-        dct[nn] = Universe(atom=pd.concat(dct[nn], ignore_index=True))
-    fp.close()
-    return dct
-
-
-def periodic_nearest_neighbors_by_atom_large(uni, source, a, sizes, **kwargs):
-    """
-    Determine nearest neighbor molecules to a given source (or sources) and
-    return the data as a dataframe.
-
-    Tip:
-        This function performs the same operation as
-        :func:`~exatomic.algorithms.neighbors.periodic_nearest_neighbors_by_atom`,
-        but is meant for universes containing more than about 250 atoms
-        per frame (the referenced function will be faster for smaller universes).
-
-    For a simple cubic periodic system with unit cell dimension ``a``,
-    clusters can be generated as follows. In the example below, additional
-    keyword arguments have been included as they are almost always required
-    in order to correctly identify molecular units semi-empirically.
-
-    .. code-block:: python
-
-        periodic_nearest_neighbors_by_atom_ooc(u, [0], 40.0, [0, 5, 10, 50],
-                                           dmax=40.0, C=1.6, O=1.6)
-
-    Argument descriptions can be found below. The additional keyword arguments,
-    ``dmax``, ``C``, ``O``, are passed directly to the two body computation used
-    to determine (semi-empirically) molecular units. Note that although molecules
-    are computed, neighboring molecular units are determine by an atom to atom
-    criteria.
-
-    Args:
-        uni (:class:`~exatomic.core.universe.Universe`): Universe
-        source (int, str, list): Integer label or string symbol of source atom
-        a (float): Cubic unit cell dimension
-        sizes (iterable): List of slices to create
-        kwargs: Additional keyword arguments to be passed to atom two body calculation
-
-    Returns:
-        dct (dict): Dictionary of sliced universes and nearest neighbor table
-
-    See Also:
-        Sliced universe construction can be facilitated by
-        :func:`~exatomic.algorithms.neighbors.construct`.
-    """
-    if "label" not in uni.atom.columns:
-        uni.atom['label'] = uni.atom.get_atom_labels()
-    if not isinstance(sizes, list):
-        raise TypeError("Argument sizes must be iterable of ints.")
-    dct = defaultdict(list)
-    grps = uni.atom.groupby("frame")
-    ntot = len(grps)
-    fp = FloatProgress(description="Slicing:")
-    display(fp)
-    for i, (fdx, atom) in enumerate(grps):
-        if len(atom) > 0:
-            uu = Universe(atom=atom.copy())
-            uu.frame = uni.frame.loc[[fdx], :]
-            uu.compute_atom_two(**kwargs)
-            uu.compute_molecule()
-            if isinstance(source, (int, np.int32, np.int64)):
-                source_atom_idxs = [source]
-            elif isinstance(source, np.ndarray):
-                source_atom_idxs = source.tolist()
-            elif isinstance(source, (list, tuple)):
-                source_atom_idxs = uu.atom[uu.atom['label'].isin(source) |
-                                           uu.atom['symbol'].isin(source)].index.astype(int).tolist()
-            else:
-                source_atom_idxs = uu.atom[uu.atom['symbol'] == source].index.astype(int).tolist()
-            source_molecule_idxs = uu.atom.loc[source_atom_idxs, 'molecule'].unique().astype(int).tolist()
-            # Identify the nearest molecules
-            nearest_atoms = uu.atom_two[uu.atom_two['atom0'].isin(source_atom_idxs) |
-                                        uu.atom_two['atom1'].isin(source_atom_idxs)].sort_values('dr')[['atom0', 'atom1']].copy()
-            nearest_atoms['molecule0'] = nearest_atoms['atom0'].map(uu.atom['molecule'])
-            nearest_atoms['molecule1'] = nearest_atoms['atom1'].map(uu.atom['molecule'])
-            nearest_molecules = nearest_atoms[['molecule0', 'molecule1']].stack()
-            nearest_molecules = nearest_molecules[~nearest_molecules.isin(source_molecule_idxs)].drop_duplicates(keep='first')
-            # Build the appropriate universes
-            for nn in sizes:
-                atom1 = uu.atom.loc[uu.atom['molecule'].isin(nearest_molecules.iloc[:nn].tolist()+source_molecule_idxs),
-                                   ['symbol', 'x', 'y', 'z']]
-                adxs, x, y, z, prj = _worker(atom1.index.values.astype(int),
-                                             atom1['x'].values.astype(float),
-                                             atom1['y'].values.astype(float),
-                                             atom1['z'].values.astype(float), a)
-                patom = pd.DataFrame.from_dict({'atom': adxs, 'x': x, 'y': y, 'z': z, 'prj': prj})
-                patom['frame'] = patom['atom'].map(uu.atom['frame'])
-                patom['symbol'] = patom['atom'].map(uu.atom['symbol'])
-                sliced_u = Universe(atom=patom)
-                sliced_u.compute_atom_two(dmax=a)
-                sliced_u.compute_molecule()
-                source_adxs1 = sliced_u.atom[(sliced_u.atom['prj'] == 13) & sliced_u.atom['atom'].isin(source_atom_idxs)].index
-                source_mdxs1 = sliced_u.atom.loc[source_adxs1, 'molecule'].unique().tolist()
-                nearest_atoms1 = sliced_u.atom_two[sliced_u.atom_two['atom0'].isin(source_adxs1) |
-                                                   sliced_u.atom_two['atom1'].isin(source_adxs1)].sort_values('dr')[['atom0', 'atom1']].copy()
-                nearest_atoms1['molecule0'] = nearest_atoms1['atom0'].map(sliced_u.atom['molecule'])
-                nearest_atoms1['molecule1'] = nearest_atoms1['atom1'].map(sliced_u.atom['molecule'])
-                nearest_molecules1 = nearest_atoms1[['molecule0', 'molecule1']].stack()
-                nearest_molecules1 = nearest_molecules1[~nearest_molecules1.isin(source_mdxs1)].drop_duplicates(keep='first')
-                # Its fine to overwrite atom1 above since the uu.atom slice is not necessarily clustered
-                atom1 = sliced_u.atom.loc[sliced_u.atom['molecule'].isin(nearest_molecules1.iloc[:nn].tolist()+source_mdxs1)].copy()
-                dct[nn].append(atom1)
-            index = nearest_molecules.index.get_level_values(0)
-            nearest_molecules = nearest_molecules.to_frame()
-            nearest_molecules.columns = ['molecule']
-            nearest_molecules['frame'] = fdx
-            nearest_molecules['atom0'] = nearest_atoms.loc[index, 'atom0'].values
-            nearest_molecules['atom1'] = nearest_atoms.loc[index, 'atom1'].values
-            dct['nearest'].append(nearest_molecules)
-        fp.value = i/ntot*100
-    dct['nearest'] = pd.concat(dct['nearest'], ignore_index=True)
-    for nn in sizes:
-        dct[nn] = Universe(atom=pd.concat(dct[nn], ignore_index=True))
-    fp.close()
-    return dct
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+"""
+Neighbor Selection Algorithms
+###############################
+This module provides algoirthms for selecting nearest neighbors, e.g. nearest
+solvent molecules to a solute molecule. Because two body properties do not always
+represent the desired molecules (i.e. bonds appear where they are not desired),
+these algorithms are not completely black box.
+
+Before performing a search, check that the molecule table is computed as desired
+and classified (if necessary): see :func:`~exatomic.two.BaseTwo.compute_bonds`
+and :func:`~exatomic.molecule.Molecule.classify`.
+"""
+import os
+import csv
+import warnings
+import numpy as np
+import pandas as pd
+import numba as nb
+from collections import defaultdict
+from exa.util.units import Length
+from exatomic.core.atom import Atom
+from exatomic.core.universe import Universe
+from exatomic.core.molecule import unwrap_molecules
+from exatomic.core.two import _map_frames
+from exatomic.interfaces.xyz import XYZ
+from exatomic.algorithms.distance import _inv3, _plane_spacings
+
+
+_CELL = ['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']
+
+
+@nb.jit(nopython=True, nogil=True)
+def _image_worker(fa, fb, fc, molecule, cell, pad):
+    """
+    Generate periodic images of (whole) molecules that come within a given
+    distance of the unit cell.
+
+    Rather than replicating every atom 27 times (a full 3x3x3 super cell),
+    only images (-1, 0, 1 along each cell vector) of molecules having an atom
+    within pad of the unit cell faces are generated; the number of atoms
+    generated scales with the volume of the padding shell.
+
+    Args:
+        fa (array): Fractional coordinates along the first cell vector
+        fb (array): Fractional coordinates along the second cell vector
+        fc (array): Fractional coordinates along the third cell vector
+        molecule (array): Per atom molecule (0 to number of molecules - 1)
+        cell (array): Cell matrix (rows are cell vectors)
+        pad (float): Padding distance
+
+    Returns:
+        idxs (array): Position (in the input arrays) of each image atom
+        px, py, pz (array): Cartesian coordinates of the image atoms
+        prj (array): Projection index (0 to 26, 13 being the unit cell)
+    """
+    spacing = _plane_spacings(cell)
+    da = pad/spacing[0]
+    db = pad/spacing[1]
+    dc = pad/spacing[2]
+    n = len(fa)
+    nmol = molecule.max() + 1 if n > 0 else 0
+    keep = np.zeros((27, nmol), dtype=np.bool_)
+    for i in range(n):
+        p = 0
+        for sa in range(-1, 2):
+            for sb in range(-1, 2):
+                for sc in range(-1, 2):
+                    if (-da <= fa[i] + sa <= 1 + da and -db <= fb[i] + sb <= 1 + db and
+                        -dc <= fc[i] + sc <= 1 + dc):
+                        keep[p, molecule[i]] = True
+                    p += 1
+    m = 0
+    for p in range(27):
+        for i in range(n):
+            if keep[p, molecule[i]]:
+                m += 1
+    idxs = np.empty((m, ), dtype=np.int64)
+    prj = np.empty((m, ), dtype=np.int64)
+    px = np.empty((m, ), dtype=np.float64)
+    py = px.copy()
+    pz = px.copy()
+    m = 0
+    p = 0
+    for sa in range(-1, 2):
+        for sb in range(-1, 2):
+            for sc in range(-1, 2):
+                for i in range(n):
+                    if keep[p, molecule[i]]:
+                        ga = fa[i] + sa
+                        gb = fb[i] + sb
+                        gc = fc[i] + sc
+                        idxs[m] = i
+                        px[m] = ga*cell[0, 0] + gb*cell[1, 0] + gc*cell[2, 0]
+                        py[m] = ga*cell[0, 1] + gb*cell[1, 1] + gc*cell[2, 1]
+                        pz[m] = ga*cell[0, 2] + gb*cell[1, 2] + gc*cell[2, 2]
+                        prj[m] = p
+                        m += 1
+                p += 1
+    return idxs, px, py, pz, prj
+
+
+def _frame_molecules(atom, frame, dmax, kwargs):
+    """
+    Compute (periodic) bonds and molecules of a single frame and make its
+    molecules whole.
+
+    The frame is processed as an independent universe (with a 0 based atom
+    index, so that sparse matrices are sized by the frame's atoms), such that
+    memory usage does not depend on the length of the trajectory.
+
+    Args:
+        atom (:class:`~exatomic.core.atom.Atom`): Atom table of the frame
+        frame (:class:`~pandas.DataFrame`): Frame table row (with cell vectors)
+        dmax (float): Maximum distance for the (bonds only) two body search
+        kwargs (dict): Keyword arguments for the two body calculation
+
+    Returns:
+        atom (:class:`~pandas.DataFrame`): Atom table (original index) with molecules
+        xyz (array): Unwrapped coordinates
+    """
+    index = atom.index
+    uu = Universe(atom=Atom(atom.reset_index(drop=True)), frame=frame)
+    uu.compute_atom_two(bonds_only=True, dmax=dmax, **kwargs)
+    uu.compute_molecule()
+    xyz = unwrap_molecules(uu).values
+    atom = pd.DataFrame(uu.atom)
+    atom.index = index
+    return atom, xyz
+
+
+def _slice(args):
+    """
+    Bond, unwrap and slice a single frame (see
+    :func:`~exatomic.algorithms.neighbors._iter_slices`).
+    """
+    fdx, atom, frame, source, sizes, dmax, kwargs = args
+    atom, xyz = _frame_molecules(atom, frame, dmax, kwargs)
+    cell = frame[_CELL].values.astype(np.float64).reshape(3, 3)
+    return _slice_frame(fdx, atom, xyz, cell, source, sizes, dmax)
+
+
+def _source_atoms(atom, source):
+    """Positions (within a frame's atom table) of the source atom(s)."""
+    if isinstance(source, (int, np.int32, np.int64)):
+        mask = atom.index.isin([source])
+    elif isinstance(source, np.ndarray):
+        mask = atom.index.isin(source)
+    elif isinstance(source, (list, tuple)):
+        mask = atom['label'].isin(source) | atom['symbol'].astype(str).isin(source)
+    else:
+        mask = atom['symbol'] == source
+    return np.flatnonzero(mask)
+
+
+def _slice_frame(fdx, atom, xyz, cell, source, sizes, dmax):
+    """
+    Nearest neighbor molecules of the source atom(s) and the corresponding
+    clusters for a single frame.
+
+    A single (cutoff padded) set of molecule images is generated and ranked
+    once; clusters of all sizes are cut from that ranking.
+
+    Args:
+        fdx (int): Frame index
+        atom (:class:`~exatomic.core.atom.Atom`): Atom table of the frame (with molecules)
+        xyz (array): Unwrapped coordinates of the frame's atoms
+        cell (array): Cell matrix
+        source: Source atom(s) (see :func:`~exatomic.algorithms.neighbors.periodic_nearest_neighbors_by_atom`)
+        sizes (list): Numbers of nearest molecules per cluster
+        dmax (float): Maximum source to neighbor (atom to atom) distance
+
+    Returns:
+        nearest (:class:`~pandas.DataFrame`): Sorted nearest molecules (see
+        :func:`~exatomic.algorithms.neighbors.periodic_nearest_neighbors_by_atom`)
+        clusters (dict): Cluster atom tables keyed by size
+    """
+    mols, molecule = np.unique(atom['molecule'].values.astype(np.int64), return_inverse=True)
+    frac = np.dot(xyz, _inv3(cell))
+    # Shift molecules such that their first atom lies in the unit cell
+    first = np.unique(molecule, return_index=True)[1]
+    frac -= np.floor(frac[first])[molecule]
+    idxs, px, py, pz, prj = _image_worker(frac[:, 0].copy(), frac[:, 1].copy(),
+                                          frac[:, 2].copy(), molecule, cell, dmax)
+    key = prj*len(mols) + molecule[idxs]
+    src = _source_atoms(atom, source)
+    center = prj == 13
+    dr = np.full((len(idxs), ), np.inf)
+    nearest_src = np.zeros((len(idxs), ), dtype=np.int64)
+    for i in src:
+        s = np.flatnonzero(center & (idxs == i))[0]
+        d = np.sqrt((px - px[s])**2 + (py - py[s])**2 + (pz - pz[s])**2)
+        closer = d < dr
+        dr[closer] = d[closer]
+        nearest_src[closer] = i
+    source_keys = np.unique(13*len(mols) + molecule[src])
+    candidate = (dr <= dmax) & ~np.isin(key, source_keys)
+    order = np.flatnonzero(candidate)
+    order = order[np.argsort(dr[order], kind='mergesort')]
+    # Closest pair of each molecule (two is its rank among all source neighbor pairs)
+    two = np.sort(np.unique(key[order], return_index=True)[1])
+    order = order[two]
+    index = atom.index.values
+    nearest = pd.DataFrame.from_dict({'frame': fdx, 'idx': np.arange(len(order)), 'two': two,
+                                      'atom': index[idxs[order]],
+                                      'molecule': mols[molecule[idxs[order]]],
+                                      'atom0': index[nearest_src[order]], 'prj': prj[order],
+                                      'dr': dr[order]})
+    symbols = atom['symbol'].astype(str).values
+    clusters = {}
+    for nn in sizes:
+        sel = np.flatnonzero(np.isin(key, np.concatenate((key[order[:nn]], source_keys))))
+        clusters[nn] = pd.DataFrame.from_dict({'symbol': symbols[idxs[sel]], 'x': px[sel],
+                                               'y': py[sel], 'z': pz[sel], 'frame': fdx,
+                                               'atom': index[idxs[sel]], 'prj': prj[sel]})
+    return nearest, clusters
+
+
+def _iter_slices(uni, source, a, sizes, **kwargs):
+    """
+    Generate per frame slicing arguments for
+    :func:`~exatomic.algorithms.neighbors._slice`: only a single frame's
+    atoms are copied at a time; bonds, molecules and unwrapping are computed
+    per frame by the worker.
+    """
+    if not isinstance(sizes, (list, tuple, np.ndarray)):
+        raise TypeError("Argument sizes must be iterable of ints.")
+    dmax = kwargs.pop('dmax', 8.0)
+    if "label" not in uni.atom.columns:
+        uni.atom['label'] = uni.atom.get_atom_labels()
+    frame = uni.frame
+    if not all(col in frame.columns for col in _CELL):
+        if a is None:
+            raise ValueError("Cell vectors (or a cubic cell dimension) are required")
+        frame = frame.copy()
+        for i, col in enumerate(_CELL):
+            frame[col] = a if i % 4 == 0 else 0.0
+        frame['periodic'] = True
+    frames = uni.atom['frame'].values.astype(np.int64)
+    for fdx, idx in uni.atom.groupby(frames).indices.items():
+        if len(idx) > 0:
+            yield (fdx, uni.atom.iloc[idx].copy(), frame.loc[[fdx]], source, sizes,
+                   dmax, kwargs)
+
+
+def periodic_nearest_neighbors_by_atom(uni, source, a, sizes, **kwargs):
+    """
+    Determine nearest neighbor molecules to a given source (or sources) and
+    return the data as a dataframe.
+
+    For a periodic system, clusters can be generated as follows. In the example
+    below, additional keyword arguments have been included as they are almost
+    always required in order to correctly identify molecular units
+    semi-empirically.
+
+    .. code-block:: python
+
+        periodic_nearest_neighbors_by_atom(u, [0], 40.0, [0, 5, 10, 50],
+                                           dmax=20.0, C=1.6, O=1.6)
+
+    Argument descriptions can be found below. The additional keyword argument
+    ``dmax`` is the largest (atom to atom) distance at which neighboring
+    molecules are searched for; periodic images of molecules are only generated
+    within ``dmax`` of the unit cell (rather than a full 3x3x3 super cell).
+    Remaining keyword arguments, e.g. ``C``, ``O``, are passed to the (bonds
+    only) two body computation used to determine (semi-empirically) molecular
+    units. Note that although molecules are computed, neighboring molecular
+    units are determine by an atom to atom criteria.
+
+    The nearest neighbor table has a row per neighboring molecule image, in
+    order of increasing distance, with the columns frame, idx (rank within the
+    frame), two (rank of the closest source to neighbor atom pair among all
+    such pairs), atom (neighbor atom), molecule (neighbor molecule), as well
+    as atom0 (source atom of the pair), prj (periodic image of the neighbor,
+    13 being the unit cell) and dr (pair distance).
+
+    Args:
+        uni (:class:`~exatomic.core.universe.Universe`): Universe
+        source (int, str, list): Integer label or string symbol of source atom
+        a (float): Cubic unit cell dimension (only used if the frame has no cell vectors)
+        sizes (list): List of slices to create
+        kwargs: Additional keyword arguments to be passed to atom two body calculation
+
+    Returns:
+        dct (dict): Dictionary of sliced universes and nearest neighbor table
+
+    See Also:
+        Sliced universe construction can be facilitated by
+        :func:`~exatomic.algorithms.neighbors.construct`.
+    """
+    dct = defaultdict(list)
+    for args in _iter_slices(uni, source, a, sizes, **kwargs):
+        nearest, clusters = _slice(args)
+        dct['nearest'].append(nearest)
+        for nn in sizes:
+            dct[nn].append(clusters[nn])
+    dct['nearest'] = pd.concat(dct['nearest'], ignore_index=True)
+    for nn in sizes:
+        dct[nn] = Universe(atom=Atom(pd.concat(dct[nn], ignore_index=True)))
+    return dct
+
+
+def periodic_nearest_neighbors_by_atom_large(uni, source, a, sizes, **kwargs):
+    """
+    Determine nearest neighbor molecules to a given source (or sources) and
+    return the data as a dataframe.
+
+    Warning:
+        Deprecated, use
+        :func:`~exatomic.algorithms.neighbors.periodic_nearest_neighbors_by_atom`.
+        Periodic images are only generated within the search cutoff of the
+        unit cell, so a separate implementation for large universes is no
+        longer needed. For backwards compatibility the nearest neighbor table
+        keeps the columns molecule, frame, atom0 and atom1 (neighbor atom).
+
+    Args:
+        uni (:class:`~exatomic.core.universe.Universe`): Universe
+        source (int, str, list): Integer label or string symbol of source atom
+        a (float): Cubic unit cell dimension (only used if the frame has no cell vectors)
+        sizes (iterable): List of slices to create
+        kwargs: Additional keyword arguments to be passed to atom two body calculation
+
+    Returns:
+        dct (dict): Dictionary of sliced universes and nearest neighbor table
+    """
+    warnings.warn("periodic_nearest_neighbors_by_atom_large is deprecated, use "
+                  "periodic_nearest_neighbors_by_atom", DeprecationWarning)
+    dct = periodic_nearest_neighbors_by_atom(uni, source, a, sizes, **kwargs)
+    nearest = dct['nearest'].rename(columns={'atom': 'atom1'})
+    dct['nearest'] = nearest[['molecule', 'frame', 'atom0', 'atom1']]
+    return dct
+
+
+def extract_clusters(uni, source, sizes, path, a=None, fmt="xyz", n_jobs=1,
+                     float_format='%    .8f', **kwargs):
+    """
+    Extract nearest neighbor clusters for every frame and write each cluster
+    to disk as soon as it is produced.
+
+    Frames are streamed one at a time through bonding, unwrapping and
+    slicing (see
+    :func:`~exatomic.algorithms.neighbors.periodic_nearest_neighbors_by_atom`),
+    optionally by a pool of worker processes; clusters are never accumulated
+    in memory and no notebook (progress widget) is required.
+
+    .. code-block:: python
+
+        extract_clusters(u, "Rh", [0, 4, 8], "clusters", dmax=10.0, Rh=2.6, n_jobs=4)
+
+    For the "xyz" format, path is a directory in which an xyz trajectory per
+    cluster size (``cluster_{size}.xyz``, one xyz frame per universe frame)
+    and the nearest neighbor table (``nearest.csv``) are written. For the
+    "hdf" format, path is an HDF5 file to which the nearest neighbor table
+    (key ``nearest``) and clusters (keys ``cluster_{size}``) are appended.
+
+    Args:
+        uni (:class:`~exatomic.core.universe.Universe`): Universe
+        source (int, str, list): Integer label or string symbol of source atom
+        sizes (list): List of slices to create
+        path (str): Output directory (xyz) or file (hdf)
+        a (float): Cubic unit cell dimension (only used if the frame has no cell vectors)
+        fmt (str): Output format, "xyz" or "hdf"
+        n_jobs (int): Number of worker processes (-1 for all cores)
+        float_format (str): Floating point format (xyz)
+        kwargs: Additional keyword arguments to be passed to atom two body calculation
+
+    Returns:
+        n (int): Number of frames sliced
+    """
+    if fmt not in ("xyz", "hdf"):
+        raise ValueError("Unknown format {}, use 'xyz' or 'hdf'".format(fmt))
+    results = _map_frames(_slice, _iter_slices(uni, source, a, sizes, **kwargs), n_jobs,
+                          processes=True)
+    n = 0
+    if fmt == "hdf":
+        with pd.HDFStore(path, mode="a") as store:
+            for nearest, clusters in results:
+                store.append("nearest", nearest, index=False)
+                for nn in sizes:
+                    store.append("cluster_" + str(nn), clusters[nn], index=False,
+                                 min_itemsize={'symbol': 3})
+                n += 1
+        return n
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    files = {nn: open(os.path.join(path, "cluster_" + str(nn) + ".xyz"), "w") for nn in sizes}
+    try:
+        for nearest, clusters in results:
+            nearest.to_csv(os.path.join(path, "nearest.csv"), mode="w" if n == 0 else "a",
+                           index=False, header=n == 0)
+            for nn in sizes:
+                _write_xyz(files[nn], clusters[nn], float_format)
+            n += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return n
+
+
+def _write_xyz(f, atom, float_format):
+    """Append a cluster (frame) to an open xyz trajectory file."""
+    fdx = atom['frame'].iloc[0] if len(atom) > 0 else ''
+    f.write(XYZ._header.format(nat=len(atom), comment='frame: ' + str(fdx)))
+    atom = atom[XYZ._cols].copy()
+    for col in ('x', 'y', 'z'):
+        atom[col] *= Length['au', 'Angstrom']
+    atom.to_csv(f, sep=' ', header=False, index=False, float_format=float_format,
+                quoting=csv.QUOTE_NONE, escapechar=' ')
@@ -7,10 +7,9 @@ Pair Correlation Functions
 """
 import numpy as np
 import pandas as pd
-from IPython.display import display
-from ipywidgets import FloatProgress
 from exa.util.units import Length
-from exatomic.core.universe import Universe
+from exatomic.core.two import _pdist_frames, _map_frames, _frame_cell
+from exatomic.algorithms.distance import pair_histogram
 
 
 def radial_pair_correlation(universe, a, b, dr=0.05, start=1.0, stop=13.0,
@@ -75,20 +74,8 @@ def radial_pair_correlation(universe, a, b, dr=0.05, start=1.0, stop=13.0,
         rescaling values appropriately.
     """
     bins = np.arange(start, stop, dr)                     # Discrete values of r for histogram
-    if isinstance(a, str):
-        a_idx = universe.atom[universe.atom['symbol'] == a].index.values
-    elif isinstance(a, (int, list, tuple, np.int64, np.int32)):
-        a = [a] if not isinstance(a, (list, tuple)) else a
-        a_idx = universe.atom[universe.atom['label'].isin(a)].index.values
-    else:
-        a_idx = a
-    if isinstance(b, str):
-        b_idx = universe.atom[universe.atom['symbol'] == b].index.values
-    elif isinstance(a, (int, list, tuple, np.int64, np.int32)):
-        b = [b] if not isinstance(b, (list, tuple)) else b
-        b_idx = universe.atom[universe.atom['label'].isin(b)].index.values
-    else:
-        b_idx = b
+    a_idx = universe.atom.index.values[_selection(universe.atom, a)]
+    b_idx = universe.atom.index.values[_selection(universe.atom, b)]
     if "distance" in universe.atom_two.columns:
         c = "distance"
     else:
@@ -98,23 +85,195 @@ def radial_pair_correlation(universe, a, b, dr=0.05, start=1.0, stop=13.0,
                                       (universe.atom_two['atom0'].isin(b_idx) &
                                        universe.atom_two['atom1'].isin(a_idx)), c]
     hist, bins = np.histogram(distances, bins)            # Compute histogram
+    numa = len(a_idx)/len(universe)
+    numb = len(b_idx)/len(universe)
+    return _normalize(hist, bins, universe.frame, numa, numb, length, window)
+
+
+def radial_pcf(universe, a, b, dr=0.05, start=1.0, stop=13.0, length="Angstrom",
+               window=1, n_jobs=1):
+    """
+    Compute the angularly independent pair correlation function directly from
+    atomic coordinates.
+
+    Unlike :func:`~exatomic.algorithms.pcf.radial_pair_correlation`, no two
+    body data is required. Frames are processed one at a time (by a pool of
+    workers); pairs of a and b atoms within the largest bin edge are found by
+    a linked cell search and binned immediately, so memory usage does not
+    depend on the length of the trajectory. The result is the same as that of
+    :func:`~exatomic.algorithms.pcf.radial_pair_correlation` given (minimum
+    image) two body data up to stop.
+
+    .. code-block:: Python
+
+        pcf = radial_pcf(universe, "O", "O", stop=12.0, n_jobs=4)
+
+    Args:
+        universe (:class:`~exatomic.Universe`): The universe
+        a (str, list, array): First atom type (see :func:`~exatomic.algorithms.pcf.radial_pair_correlation`)
+        b (str, list, array): Second atom type
+        dr (float): Radial step size
+        start (float): Starting radial point
+        stop (float): Stopping radial point
+        length (str): Output unit of length
+        window (int): Smoothen data (default no smoothing)
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+
+    Returns:
+        pcf (:class:`~pandas.DataFrame`): Pair correlation distribution and count
+
+    Warning:
+        For periodic universes, stop should not exceed half of the smallest
+        cell width (minimum image convention).
+    """
+    return radial_pcfs(universe, {0: (a, b)}, dr, start, stop, length, window, n_jobs)[0]
+
+
+def radial_pcfs(universe, pairs=None, dr=0.05, start=1.0, stop=13.0, length="Angstrom",
+                window=1, n_jobs=1):
+    """
+    Compute pair correlation functions of many pairs of atom types in a single
+    pass over atomic coordinates.
+
+    Each atom is assigned a code according to the selections (a and b of every
+    pair) it belongs to; pairs within the largest bin edge are found once per
+    frame and binned by pair of codes. Every pair correlation function (and
+    coordination number) is obtained from that single histogram. By default,
+    all pairs of atomic symbols are computed.
+
+    .. code-block:: Python
+
+        pcfs = radial_pcfs(universe)                # Keys "H_H", "H_O", "O_O", ...
+        pcfs = radial_pcfs(universe, {"O_H": ([0], "H"), "O_O": ("O", "O")})
+
+    Args:
+        universe (:class:`~exatomic.Universe`): The universe
+        pairs (dict): Keys and values of ``a``, ``b`` arguments (default all pairs of symbols)
+        dr (float): Radial step size
+        start (float): Starting radial point
+        stop (float): Stopping radial point
+        length (str): Output unit of length
+        window (int): Smoothen data (default no smoothing)
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+
+    Returns:
+        pcfs (dict): Pair correlation distribution and count (see
+        :func:`~exatomic.algorithms.pcf.radial_pcf`) for each key of pairs
+    """
+    if pairs is None:
+        symbols = sorted(universe.atom['symbol'].astype(str).unique())
+        pairs = {a + "_" + b: (a, b) for i, a in enumerate(symbols) for b in symbols[i:]}
+    bins = np.arange(start, stop, dr)
+    keys = list(pairs.keys())
+    masks = []
+    for key in keys:
+        a, b = pairs[key]
+        masks += [_selection(universe.atom, a), _selection(universe.atom, b)]
+    member = np.column_stack(masks)
+    # Atoms with the same membership (in every a and b) share a code
+    signatures, codes = np.unique(member, axis=0, return_inverse=True)
+    codes = codes.ravel().astype(np.int64)
+    if not signatures[0].any():
+        # Atoms not in any selection (sorted first) are ignored
+        codes -= 1
+        signatures = signatures[1:]
+    codes = pd.Series(codes, index=universe.atom.index)
+    hist = _pair_counts(universe, codes, len(signatures), bins, n_jobs)
+    pcfs = {}
+    for i, key in enumerate(keys):
+        ina = signatures[:, 2*i]
+        inb = signatures[:, 2*i + 1]
+        counts = hist[np.outer(ina, inb) | np.outer(inb, ina)].sum(axis=0)
+        numa = member[:, 2*i].sum()/len(universe)
+        numb = member[:, 2*i + 1].sum()/len(universe)
+        pcfs[key] = _normalize(counts, bins, universe.frame, numa, numb, length, window)
+    return pcfs
+
+
+def _pair_counts(universe, codes, ncode, bins, n_jobs=1):
+    """
+    Histogram of pair distances, by pair of atom codes, summed over frames.
+
+    Args:
+        universe (:class:`~exatomic.Universe`): The universe
+        codes (:class:`~pandas.Series`): Per atom code (0 to ncode - 1, negative to ignore)
+        ncode (int): Number of codes
+        bins (array): Bin edges
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+
+    Returns:
+        hist (array): Pair counts of shape (ncode, ncode, len(bins) - 1), see
+        :func:`~exatomic.algorithms.distance.pair_histogram`
+    """
+    if universe.periodic:
+        boundary = "ortho" if universe.orthorhombic else "triclinic"
+        if "rx" not in universe.frame.columns:
+            universe.frame.compute_cell_magnitudes()
+    else:
+        boundary = "free"
+    hist = np.zeros((ncode, ncode, len(bins) - 1), dtype=np.int64)
+    worker = lambda item: _frame_counts(item[1], boundary, ncode, bins)
+    for counts in _map_frames(worker, _pdist_frames(universe, boundary, codes), n_jobs):
+        hist += counts
+    return hist
+
+
+def _frame_counts(args, boundary, ncode, bins):
+    """
+    Pair histogram of a single frame given the per frame arguments generated
+    by :func:`~exatomic.core.two._pdist_frames` (with codes).
+    """
+    x, y, z = args[:3]
+    codes = args[-1]
+    cell = _frame_cell(args, boundary)
+    keep = codes >= 0
+    return pair_histogram(x[keep], y[keep], z[keep], cell, boundary != "free",
+                          codes[keep], ncode, bins)
+
+
+def _selection(atom, a):
+    """
+    Boolean mask of the atoms selected by a (see
+    :func:`~exatomic.algorithms.pcf.radial_pair_correlation`).
+    """
+    if isinstance(a, str):
+        return (atom['symbol'] == a).values
+    elif isinstance(a, (int, list, tuple, np.int64, np.int32)):
+        a = [a] if not isinstance(a, (list, tuple)) else a
+        return atom['label'].isin(a).values
+    return atom.index.isin(a)
+
+
+def _normalize(hist, bins, frame, numa, numb, length="Angstrom", window=1):
+    """
+    Pair correlation distribution and count from a histogram of pair distances.
+
+    Args:
+        hist (array): Pair counts
+        bins (array): Bin edges
+        frame (:class:`~exatomic.core.frame.Frame`): Frame table (cell dimensions)
+        numa (float): Average number of atoms a per frame
+        numb (float): Average number of atoms b per frame
+        length (str): Output unit of length
+        window (int): Smoothing window
+
+    Returns:
+        pcf (:class:`~pandas.DataFrame`): Pair correlation distribution and count
+    """
     nn = hist.sum()                                       # Number of observations
     bmax = bins.max()                                     # Note that bins is unchanged by np.hist..
-    rx, ry, rz = universe.frame[["rx", "ry", "rz"]].mean().values
+    rx, ry, rz = frame[["rx", "ry", "rz"]].mean().values
     ratio = (((bmax/rx + bmax/ry + bmax/rz)/3)**3).mean() # Variable actual vol and bin vol
     v_shell = bins[1:]**3 - bins[:-1]**3                  # Volume of each bin shell
-    if 'cell_volume' in universe.frame.columns:
-        v_cell = universe.frame["cell_volume"].mean()         # Actual volume
-    elif 'Volume' in universe.frame.columns:
-        v_cell = universe.frame["Volume"].mean()         # Actual volume
-        c = 'Volume'
-    elif 'volume' in universe.frame.columns:
-        v_cell = universe.frame["volume"].mean()         # Actual volume
+    if 'cell_volume' in frame.columns:
+        v_cell = frame["cell_volume"].mean()         # Actual volume
+    elif 'Volume' in frame.columns:
+        v_cell = frame["Volume"].mean()         # Actual volume
+    elif 'volume' in frame.columns:
+        v_cell = frame["volume"].mean()         # Actual volume
     else:
-        v_cell = universe.frame["rx"].max()**3
+        v_cell = frame["rx"].max()**3
     g = hist*v_cell*ratio/(v_shell*nn)                    # Compute pair correlation
-    numa = len(a_idx)/len(universe)
-    numb = len(b_idx)/len(universe)
     n = hist.cumsum()/nn*numa*numb*4/3*np.pi*bmax**3/v_cell
     r = (bins[1:] + bins[:-1])/2*Length["au", length]
     unit = "au"
@@ -131,7 +290,8 @@ def radial_pair_correlation(universe, a, b, dr=0.05, start=1.0, stop=13.0,
     return df
 
 
-def radial_pcf_out_of_core(hdftwo, hdfout, u, pairs, **kwargs):
+def radial_pcf_out_of_core(hdftwo, hdfout, u, pairs, n_jobs=1, checkpoint=100,
+                           **kwargs):
     """
     Out of core radial pair correlation calculation.
 
@@ -143,44 +303,93 @@ def radial_pcf_out_of_core(hdftwo, hdfout, u, pairs, **kwargs):
     .. code:: Python
 
         radial_pcf_out_of_core("in.hdf", "out.hdf", uni, {"O_H": ([0], "H")},
-                               length="Angstrom", dr=0.01)
+                               length="Angstrom", dr=0.01, n_jobs=4)
+
+    Frames are read one at a time and histogrammed by a pool of workers; raw
+    pair counts (rather than normalized pair correlation functions) are summed
+    over frames and normalized once at the end. Reading from hdftwo happens
+    serially on the calling thread (HDF5 access is not thread safe) and only
+    overlaps with the histogramming of previously read frames, so I/O bound
+    calculations do not benefit from additional workers. Partial sums (key
+    ``radial_pcf_counts``) and the frames they include (key
+    ``radial_pcf_frames``) are saved to hdfout every checkpoint frames, so
+    that a restarted calculation resumes from the last checkpoint.
 
     Args:
         hdftwo (str): HDF filepath containing atomic two body data
         hdfout (str): HDF filepath to which radial PCF data will be written (see Note)
         u (:class:`~exatomic.core.universe.Universe`): Universe
         pairs (dict): Dictionary of string name keys, values of ``a``, ``b`` arguments (see Note)
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+        checkpoint (int): Number of frames between checkpoints (at least 1)
         kwargs: Additional keyword arguments to be passed (see Note)
 
+    Returns:
+        frames (array): Frame indices processed by this call
+
     Note:
         Results will be stored in the hdfout HDF file. Keys are of the form
         ``radial_pcf_key``. The keys of ``pairs`` are used to store the output
         while the values are used to perform the pair correlation itself.
+        Additional keyword arguments are those of
+        :func:`~exatomic.algorithms.pcf.radial_pair_correlation`.
     """
-    f = u.atom['frame'].unique()
-    n = len(f)
-    fp = FloatProgress(description="Computing:")
-    display(fp)
-    fdx = f[0]
-    twokey = "frame_" + str(fdx) + "/atom_two"
-    atom = u.atom[u.atom['frame'] == fdx].copy()
-    uu = Universe(atom=atom, frame=u.frame.loc[[fdx]],
-    atom_two = pd.read_hdf(hdftwo, twokey))
-    pcfs = {}
-    for key, ab in pairs.items():
-        pcfs[key] = radial_pair_correlation(uu, ab[0], ab[1], **kwargs).reset_index()
-    fp.value = 1/n*100
-    for i, fdx in enumerate(f[1:]):
-        twokey = "frame_" + str(fdx) + "/atom_two"
-        atom = u.atom[u.atom['frame'] == fdx].copy()
-        uu = Universe(atom=atom, frame=u.frame.loc[[fdx]],
-        atom_two = pd.read_hdf(hdftwo, twokey))
-        for key, ab in pairs.items():
-            pcfs[key] += radial_pair_correlation(uu, ab[0], ab[1], **kwargs).reset_index()
-        fp.value = (i+1)/n*100
-    store = pd.HDFStore(hdfout)
-    for key in pairs.keys():
-        pcfs[key] /= n
-        store.put("radial_pcf_"+key, pcfs[key])
-    store.close()
-    fp.close()
+    if checkpoint < 1:
+        raise ValueError("checkpoint must be at least 1, got {}".format(checkpoint))
+    if u.periodic and "rx" not in u.frame.columns:
+        u.frame.compute_cell_magnitudes()
+    dr = kwargs.pop('dr', 0.05)
+    bins = np.arange(kwargs.pop('start', 1.0), kwargs.pop('stop', 13.0), dr)
+    keys = [str(key) for key in pairs.keys()]
+    natom = u.atom.index.max() + 1 if len(u.atom) > 0 else 0
+    masks = {}
+    for key, (a, b) in zip(keys, pairs.values()):
+        masks[key] = (np.zeros((natom, ), dtype=bool), np.zeros((natom, ), dtype=bool))
+        masks[key][0][u.atom.index.values[_selection(u.atom, a)]] = True
+        masks[key][1][u.atom.index.values[_selection(u.atom, b)]] = True
+    counts = pd.DataFrame(0, index=range(len(bins) - 1), columns=keys, dtype=np.int64)
+    done = np.empty((0, ), dtype=np.int64)
+    with pd.HDFStore(hdfout, mode="a") as store:
+        if "/radial_pcf_counts" in store.keys():
+            counts = store.get("radial_pcf_counts")
+            if len(counts) != len(bins) - 1 or sorted(counts.columns) != sorted(keys):
+                raise ValueError("Checkpoint in {} does not match bins or pairs".format(hdfout))
+            done = store.get("radial_pcf_frames")['frame'].values.astype(np.int64)
+        frames = np.setdiff1d(u.atom['frame'].unique().astype(np.int64), done)
+        worker = lambda two: _two_counts(two, masks, bins)
+        with pd.HDFStore(hdftwo, mode="r") as twostore:
+            twokeys = set(twostore.keys())
+            items = (twostore.get(key) if key in twokeys else None for key in
+                     ("/frame_" + str(fdx) + "/atom_two" for fdx in frames))
+            for i, hists in enumerate(_map_frames(worker, items, n_jobs)):
+                for key, hist in hists.items():
+                    counts[key] += hist
+                if (i + 1) % checkpoint == 0 or i + 1 == len(frames):
+                    store.put("radial_pcf_counts", counts)
+                    store.put("radial_pcf_frames",
+                              pd.DataFrame({'frame': np.union1d(done, frames[:i + 1])}))
+                    store.flush(fsync=True)
+        nframe = u.atom['frame'].nunique()
+        for key in keys:
+            numa = masks[key][0].sum()/nframe
+            numb = masks[key][1].sum()/nframe
+            pcf = _normalize(counts[key].values, bins, u.frame, numa, numb, **kwargs)
+            store.put("radial_pcf_" + key, pcf.reset_index())
+    return frames
+
+
+def _two_counts(atom_two, masks, bins):
+    """
+    Histograms of a frame's pair distances for each pair of atom selections
+    (see :func:`~exatomic.algorithms.pcf.radial_pcf_out_of_core`).
+    """
+    if atom_two is None:
+        return {}
+    c = "distance" if "distance" in atom_two.columns else "dr"
+    atom0 = atom_two['atom0'].values.astype(np.int64)
+    atom1 = atom_two['atom1'].values.astype(np.int64)
+    hists = {}
+    for key, (isa, isb) in masks.items():
+        sel = (isa[atom0] & isb[atom1]) | (isb[atom0] & isa[atom1])
+        hists[key] = np.histogram(atom_two[c].values[sel], bins)[0]
+    return hists
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.core.atom import Atom
+from exatomic.core.universe import Universe
+from exatomic.core.two import compute_atom_two_out_of_core
+from exatomic.core.tests.test_molecule import make_water
+from exatomic.algorithms.angles import compute_angles_out_of_core, compute_dihedrals
+
+
+class TestAngles(TestCase):
+    def setUp(self):
+        # Shifted such that molecules straddle the cell boundary
+        self.uni = make_water(shift=-0.5)
+        self.hoh = np.arccos(np.dot([1.81, 0.0, 0.0], [-0.45, 1.75, 0.0])/
+                             (1.81*np.hypot(0.45, 1.75)))
+
+    def test_compute_atom_three(self):
+        """One H-O-H angle per water, centered on O."""
+        self.uni.compute_atom_two(bonds_only=True, Na=0.5)
+        three = self.uni.atom_three
+        self.assertEqual(len(three), 2*27)
+        self.assertTrue(np.all(self.uni.atom.loc[three['atom0'], 'symbol'] == "O"))
+        self.assertTrue(np.all(self.uni.atom.loc[three['atom1'], 'symbol'] == "H"))
+        self.assertTrue(np.allclose(three['angle'], self.hoh))
+        self.assertListEqual(sorted(three['frame'].unique()), [0, 1])
+
+    def test_compute_angles_out_of_core(self):
+        """Per frame angles from stored two body data."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "two.hdf")
+            compute_atom_two_out_of_core(path, self.uni, dmax=4.0, Na=0.5)
+            frames = compute_angles_out_of_core(path, self.uni)
+            self.assertListEqual(frames.tolist(), [0, 1])
+            adf = pd.read_hdf(path, "frame_1/atom_angle")
+            self.assertEqual(len(adf), 27)
+            self.assertTrue(np.allclose(adf['angle'], self.hoh))
+
+
+class TestDihedrals(TestCase):
+    def setUp(self):
+        # Hydrogen peroxide with H-O-O-H dihedrals of 60 and -120 degrees
+        self.phi = np.radians([60.0, -120.0])
+        xyz = []
+        for phi in self.phi:
+            xyz += [[-0.6, 1.7, 0.0], [0.0, 0.0, 0.0], [2.8, 0.0, 0.0],
+                    [3.4, 1.7*np.cos(phi), 1.7*np.sin(phi)]]
+        xyz = np.array(xyz)
+        atom = pd.DataFrame.from_dict({'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2],
+                                       'symbol': ['H', 'O', 'O', 'H']*2,
+                                       'frame': np.repeat([0, 1], 4)})
+        self.uni = Universe(atom=Atom(atom))
+        self.uni.compute_atom_two(bonds_only=True)
+
+    def test_compute_dihedrals(self):
+        """Fixed paths, angles and histogram per frame."""
+        dihedrals = compute_dihedrals(self.uni)
+        self.assertEqual(len(dihedrals), 2)
+        self.assertTrue(np.allclose(dihedrals['dihedral'], self.phi))
+        self.assertListEqual(sorted(dihedrals.loc[0, ['atom1', 'atom2']]), [1, 2])
+        self.assertListEqual(dihedrals['frame'].tolist(), [0, 1])
+        hist = compute_dihedrals(self.uni, bins=4)
+        self.assertListEqual(hist.values.tolist(), [[0, 0, 1, 0], [1, 0, 0, 0]])
+        numpy_bins = compute_dihedrals(self.uni, bins=np.int64(4))
+        self.assertListEqual(numpy_bins.values.tolist(), hist.values.tolist())
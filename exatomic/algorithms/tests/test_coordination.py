@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import numpy as np
+from unittest import TestCase
+from exatomic.core.tests.test_molecule import make_water
+from exatomic.algorithms.coordination import compute_coordination
+
+
+class TestCoordination(TestCase):
+    def setUp(self):
+        self.uni = make_water(shift=-0.5)
+
+    def test_count(self):
+        """Na (cube center) has eight O neighbors, each O six."""
+        cn = compute_coordination(self.uni, "Na", "O", rcut=6.0)
+        self.assertListEqual(cn.tolist(), [8, 8])
+        self.assertTrue(np.all(self.uni.atom.loc[cn.index, 'symbol'] == "Na"))
+        cn = compute_coordination(self.uni, "O", "O", rcut=6.0, dense=True, n_jobs=2)
+        self.assertEqual(cn.shape, (2, 27))
+        self.assertTrue(np.all(cn == 6))
+
+    def test_switching(self):
+        """Rational switching function weighted count."""
+        cn = compute_coordination(self.uni, "O", "O", rcut=8.0, r0=5.0)
+        q = 5.7/5.0
+        self.assertTrue(np.allclose(cn, 6*(1 - q**6)/(1 - q**12)))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.algorithms.correlation import (correlate_fft, time_correlation,
+                                             correlation_spectrum, _fft_chunksize)
+
+
+def direct(a, b):
+    """Brute force all origins correlation."""
+    nt = len(a)
+    return np.array([(a[:nt - m]*b[m:]).sum(axis=2).mean(axis=0) for m in range(nt)])
+
+
+class TestCorrelation(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        self.nt, self.nat = 25, 4
+        self.v = rng.normal(size=(self.nt, self.nat, 3))
+        self.f = rng.normal(size=(self.nt, self.nat, 3))
+        self.atom = pd.DataFrame.from_dict({
+            'vx': self.v[:, :, 0].ravel(), 'vy': self.v[:, :, 1].ravel(),
+            'vz': self.v[:, :, 2].ravel(), 'fx': self.f[:, :, 0].ravel(),
+            'fy': self.f[:, :, 1].ravel(), 'fz': self.f[:, :, 2].ravel(),
+            'symbol': ['O', 'H']*(self.nt*self.nat//2),
+            'frame': np.repeat(range(self.nt), self.nat)})
+
+    def test_correlate_fft(self):
+        """Auto- and cross-correlations match the direct sums."""
+        self.assertTrue(np.allclose(correlate_fft(self.v), direct(self.v, self.v)))
+        self.assertTrue(np.allclose(correlate_fft(self.v, self.f), direct(self.v, self.f)))
+        self.assertEqual(correlate_fft(self.v, maxlag=5).shape, (6, self.nat))
+
+    def test_time_correlation(self):
+        """Per atom (chunked, grouped) and per frame signals."""
+        ref = direct(self.v, self.v)
+        vacf = time_correlation(self.atom, by='symbol', chunksize=3)
+        self.assertTrue(np.allclose(vacf['O'], ref[:, ::2].mean(axis=1)))
+        self.assertTrue(np.allclose(vacf['H'], ref[:, 1::2].mean(axis=1)))
+        ccf = time_correlation(self.atom, other=("fx", "fy", "fz"), maxlag=10)
+        self.assertTrue(np.allclose(ccf, direct(self.v, self.f)[:11].mean(axis=1)))
+        frame = pd.DataFrame(self.v[:, 0], columns=['dx', 'dy', 'dz'])
+        dacf = time_correlation(frame, ("dx", "dy", "dz"), normalize=True)
+        self.assertTrue(np.allclose(dacf, ref[:, 0]/ref[0, 0]))
+
+    def test_chunksize(self):
+        """Chunks derived from a memory budget."""
+        self.assertEqual(_fft_chunksize(10**5, 3, 2**28), 14)
+        self.assertEqual(_fft_chunksize(10**5, 3, 1), 1)
+        ref = time_correlation(self.atom, by='symbol')
+        small = time_correlation(self.atom, by='symbol', memory=8*64*3*3)
+        self.assertTrue(np.allclose(ref, small))
+
+    def test_spectrum(self):
+        """The spectrum of a cosine peaks at its frequency."""
+        t = np.arange(512)*0.5
+        corr = pd.Series(np.cos(2*np.pi*0.25*t))
+        spec = correlation_spectrum(corr, dt=0.5)
+        self.assertAlmostEqual(spec.idxmax(), 0.25, places=2)
+        with self.assertRaises(ValueError):
+            correlation_spectrum(corr, window="unknown")
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.core.universe import Universe
+from exatomic.core.atom import Atom
+from exatomic.algorithms.displacement import (msd_fft, mean_squared_displacement,
+                                              unwrap_positions, unwrap_trajectory)
+
+
+def make_walk(nframes=20, nat=6, seed=1, step=1.0):
+    """Random walk trajectory (unwrapped coordinates)."""
+    rng = np.random.RandomState(seed)
+    xyz = np.cumsum(step*rng.normal(size=(nframes, nat, 3)), axis=0)
+    atom = pd.DataFrame.from_dict({'x': xyz[:, :, 0].ravel(),
+                                   'y': xyz[:, :, 1].ravel(),
+                                   'z': xyz[:, :, 2].ravel(),
+                                   'symbol': ['O', 'H', 'H']*(nframes*nat//3),
+                                   'frame': np.repeat(range(nframes), nat)})
+    return xyz, Universe(atom=Atom(atom))
+
+
+class TestDisplacement(TestCase):
+    def setUp(self):
+        self.xyz, self.uni = make_walk()
+
+    def test_msd_fft(self):
+        """FFT result matches the direct average over all time origins."""
+        nt = len(self.xyz)
+        direct = np.array([((self.xyz[m:] - self.xyz[:nt - m])**2).sum(axis=2).mean(axis=0)
+                           for m in range(nt)])
+        self.assertTrue(np.allclose(msd_fft(self.xyz), direct))
+        self.assertTrue(np.allclose(msd_fft(self.xyz)[0], 0.0))
+
+    def test_mean_squared_displacement(self):
+        """Per species averages and atom chunking."""
+        msd = msd_fft(self.xyz)
+        df = mean_squared_displacement(self.uni, chunksize=4)
+        self.assertListEqual(df.columns.tolist(), ['H', 'O'])
+        self.assertTrue(np.allclose(df['O'], msd[:, ::3].mean(axis=1)))
+        self.assertTrue(np.allclose(df['H'], np.delete(msd, np.s_[::3], axis=1).mean(axis=1)))
+        self.assertTrue(np.allclose(mean_squared_displacement(self.uni, by=None), msd.mean(axis=1)))
+
+
+class TestUnwrap(TestCase):
+    def setUp(self):
+        self.xyz, self.uni = make_walk(nframes=40, step=0.3)
+        nt = len(self.xyz)
+        # Variable triclinic cell
+        scale = 1 + 0.03*np.sin(np.arange(nt))
+        self.cells = scale[:, None, None]*np.array([[6.0, 0.0, 0.0],
+                                                    [1.5, 5.5, 0.0],
+                                                    [0.5, 1.0, 7.0]])
+        # Start inside the cell and drift across its boundaries
+        self.xyz += 0.5*self.cells[0].sum(axis=0) + 0.15*np.arange(nt)[:, None, None]
+
+    def wrap(self, xyz, cells):
+        frac = np.einsum('tni,tij->tnj', xyz, np.linalg.inv(cells))
+        return np.einsum('tni,tij->tnj', frac - np.floor(frac), cells)
+
+    def test_unwrap_positions(self):
+        """Wrapped trajectories are recovered for variable and constant cells."""
+        nt = len(self.xyz)
+        for cells in (self.cells, np.tile(self.cells[0], (nt, 1, 1)),
+                      np.tile(np.diag([6.0, 6.5, 7.0]), (nt, 1, 1)),
+                      np.array([np.diag(d) for d in self.cells[:, [0, 1, 2], [0, 1, 2]]])):
+            wrapped = self.wrap(self.xyz, cells)
+            self.assertTrue(np.any(np.abs(wrapped - self.xyz) > 1.0))
+            self.assertTrue(np.allclose(unwrap_positions(wrapped, cells), self.xyz))
+
+    def test_unwrap_trajectory(self):
+        """Extra atom columns and dense output."""
+        wrapped = self.wrap(self.xyz, self.cells)
+        self.uni.atom['x'] = wrapped[:, :, 0].ravel()
+        self.uni.atom['y'] = wrapped[:, :, 1].ravel()
+        self.uni.atom['z'] = wrapped[:, :, 2].ravel()
+        for i, col in enumerate(['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']):
+            self.uni.frame[col] = self.cells[:, i//3, i % 3]
+        self.uni.frame['periodic'] = True
+        dense = unwrap_trajectory(self.uni, dense=True)
+        self.assertTrue(np.allclose(dense, self.xyz))
+        df = unwrap_trajectory(self.uni)
+        self.assertListEqual(df.columns.tolist(), ['ux', 'uy', 'uz'])
+        self.assertTrue(np.allclose(df.values, dense.reshape(-1, 3)))
+        self.assertTrue(np.allclose(mean_squared_displacement(self.uni, by=None, unwrap=True),
+                                    msd_fft(self.xyz).mean(axis=1)))
@@ -7,7 +7,8 @@ Two Body Properties Computations
 """
 import numpy as np
 from unittest import TestCase
-from exatomic.algorithms.distance import cartmag
+from exatomic.algorithms.distance import (cartmag, pdist, pdist_ortho,
+                                          pdist_cells, pdist_ortho_cells)
 
 
 class Test3DOperations(TestCase):
@@ -22,3 +23,34 @@ class Test3DOperations(TestCase):
         check = (x**2 + y**2 + z**2)**0.5
         result = cartmag(x, y, z)
         self.assertTrue(np.allclose(check, result))
+
+
+class TestCells(TestCase):
+    def setUp(self):
+        n = 200
+        self.a = 12.0
+        rng = np.random.RandomState(0)
+        self.x = rng.rand(n)*self.a
+        self.y = rng.rand(n)*self.a
+        self.z = rng.rand(n)*self.a
+        self.index = np.arange(n, dtype=np.int64)
+
+    def test_pdist_cells(self):
+        """Linked cell search finds the same pairs as the direct search."""
+        for dmax in (2.0, 5.0, 20.0):
+            check = pdist(self.x, self.y, self.z, self.index, dmax)
+            result = pdist_cells(self.x, self.y, self.z, self.index, dmax)
+            check = sorted(zip(check[4], check[5], np.round(check[3], 8)))
+            result = sorted(zip(result[4], result[5], np.round(result[3], 8)))
+            self.assertListEqual(check, result)
+
+    def test_pdist_ortho_cells(self):
+        """Includes a cell with fewer than three linked cells along an edge."""
+        a, b, c = self.a, self.a, self.a*0.5
+        z = np.mod(self.z, c)
+        for dmax in (2.0, 5.0):
+            check = pdist_ortho(self.x, self.y, z, a, b, c, self.index, dmax)
+            result = pdist_ortho_cells(self.x, self.y, z, a, b, c, self.index, dmax)
+            check = sorted(zip(check[4], check[5], check[6], np.round(check[3], 8)))
+            result = sorted(zip(result[4], result[5], result[6], np.round(result[3], 8)))
+            self.assertListEqual(check, result)
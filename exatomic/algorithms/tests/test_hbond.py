@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import numpy as np
+from unittest import TestCase
+from exatomic.core.tests.test_molecule import make_water
+from exatomic.algorithms.hbond import compute_hbonds
+
+
+class TestHBonds(TestCase):
+    def test_compute_hbonds(self):
+        """Each water donates two hydrogen bonds (to its +x and +y neighbors)."""
+        uni = make_water(shift=-0.5)
+        uni.compute_atom_two(bonds_only=True, Na=0.5)
+        hbond, counts = compute_hbonds(uni, n_jobs=2)
+        self.assertListEqual(counts.tolist(), [54, 54])
+        self.assertTrue(np.allclose(hbond['distance'], 5.7))
+        self.assertTrue(np.all(hbond['angle'] >= 120.0))
+        self.assertTrue(np.all(uni.atom.loc[hbond['hydrogen'], 'symbol'] == "H"))
+        self.assertTrue(np.all(uni.atom.loc[hbond['acceptor'], 'symbol'] == "O"))
+        self.assertEqual(hbond.groupby('frame')['donor'].nunique().tolist(), [27, 27])
+        hbond, counts = compute_hbonds(uni, angle=170.0)
+        self.assertListEqual(counts.tolist(), [27, 27])
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.interfaces import XYZ
+from exatomic.core.tests.test_molecule import make_water
+from exatomic.algorithms.neighbors import (periodic_nearest_neighbors_by_atom,
+                                           periodic_nearest_neighbors_by_atom_large,
+                                           extract_clusters)
+
+
+def brute_force(uni, cell, fdx=0):
+    """Sorted minimum (over 27 images) Na to water distances."""
+    xyz = uni.atom.loc[uni.atom['frame'] == fdx, ['x', 'y', 'z']].values
+    shifts = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1)
+                       for k in (-1, 0, 1)]).dot(cell)
+    images = xyz[:-1, None, :] + shifts[None, :, :]
+    dr = np.linalg.norm(images - xyz[-1], axis=2).min(axis=1)
+    return np.sort(dr.reshape(-1, 3).min(axis=1))
+
+
+class TestNeighbors(TestCase):
+    def test_nearest(self):
+        """Orthorhombic and triclinic (cutoff padded) nearest molecules."""
+        for xk in (0.0, 3.0):
+            uni = make_water(shift=-0.5)
+            uni.frame['xk'] = xk
+            cell = np.array([[17.1, 0.0, 0.0], [0.0, 17.1, 0.0], [xk, 0.0, 17.1]])
+            dct = periodic_nearest_neighbors_by_atom(uni, "Na", None, [0, 1, 4],
+                                                     dmax=7.0, Na=0.5)
+            nearest = dct['nearest']
+            self.assertListEqual(nearest.columns.tolist()[:5],
+                                 ['frame', 'idx', 'two', 'atom', 'molecule'])
+            check = brute_force(uni, cell)
+            check = check[check <= 7.0]
+            result = nearest.loc[nearest['frame'] == 0, 'dr'].values
+            self.assertTrue(np.allclose(result, check))
+            for nn in (0, 1, 4):
+                counts = dct[nn].atom['frame'].value_counts()
+                self.assertTrue(np.all(counts == 1 + 3*nn))
+            atom = dct[1].atom
+            water = atom.loc[(atom['frame'] == 0) & (atom['symbol'] != 'Na'), ['x', 'y', 'z']].values
+            self.assertAlmostEqual(np.linalg.norm(water[1] - water[0]), 1.81)
+
+    def test_nearest_large(self):
+        """Deprecated alias keeps its nearest neighbor columns."""
+        uni = make_water(shift=-0.5)
+        with self.assertWarns(DeprecationWarning):
+            dct = periodic_nearest_neighbors_by_atom_large(uni, "Na", None, [1], dmax=7.0, Na=0.5)
+        self.assertListEqual(dct['nearest'].columns.tolist(),
+                             ['molecule', 'frame', 'atom0', 'atom1'])
+        self.assertTrue(np.all(uni.atom.loc[dct['nearest']['atom0'], 'symbol'] == "Na"))
+
+    def test_extract_clusters(self):
+        """Streaming clusters to xyz and HDF."""
+        uni = make_water(nframes=3, shift=-0.5)
+        with tempfile.TemporaryDirectory() as tmp:
+            n = extract_clusters(uni, "Na", [0, 2], tmp, dmax=7.0, n_jobs=2, Na=0.5)
+            self.assertEqual(n, 3)
+            xyz = XYZ(os.path.join(tmp, "cluster_2.xyz"))
+            xyz.parse_atom()
+            self.assertTrue(np.all(xyz.atom['frame'].value_counts() == 7))
+            nearest = pd.read_csv(os.path.join(tmp, "nearest.csv"))
+            self.assertEqual(sorted(nearest['frame'].unique()), [0, 1, 2])
+            path = os.path.join(tmp, "clusters.hdf")
+            extract_clusters(uni, "Na", [0, 2], path, fmt="hdf", dmax=7.0, Na=0.5)
+            cluster = pd.read_hdf(path, "cluster_2")
+            self.assertEqual(len(cluster), 3*7)
+            self.assertTrue(np.all(pd.read_hdf(path, "cluster_0")['symbol'] == "Na"))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.core.universe import Universe
+from exatomic.core.two import compute_atom_two_out_of_core
+from exatomic.core.tests.test_molecule import make_water
+from exatomic.algorithms.pcf import (radial_pair_correlation, radial_pcf, radial_pcfs,
+                                     radial_pcf_out_of_core)
+
+
+class TestPCF(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.uni = make_water(nframes=3, shift=-0.5)
+        self.uni.atom[['x', 'y', 'z']] += np.random.uniform(-0.2, 0.2, (len(self.uni.atom), 3))
+
+    def test_radial_pcf(self):
+        """Streaming pair correlation matches the two body based one."""
+        self.uni.compute_atom_two(dmax=8.0, bonds=False)
+        for a, b in (("O", "O"), ("O", "H"), ("Na", "H")):
+            check = radial_pair_correlation(self.uni, a, b, dr=0.1, start=0.5, stop=8.0)
+            result = radial_pcf(self.uni, a, b, dr=0.1, start=0.5, stop=8.0, n_jobs=2)
+            self.assertTrue(np.allclose(check.values, result.values))
+            self.assertTrue(np.allclose(check.index.values, result.index.values))
+
+    def test_radial_pcfs(self):
+        """All pairs of symbols in a single pass."""
+        pcfs = radial_pcfs(self.uni, dr=0.1, start=0.5, stop=8.0)
+        self.assertListEqual(sorted(pcfs.keys()), ["H_H", "H_Na", "H_O", "Na_Na",
+                                                    "Na_O", "O_O"])
+        for key in ("H_O", "O_O"):
+            check = radial_pcf(self.uni, *key.split("_"), dr=0.1, start=0.5, stop=8.0)
+            self.assertTrue(np.allclose(check.values, pcfs[key].values))
+        labeled = radial_pcfs(self.uni, {"O_H": ("O", "H"), "Na_H": ("Na", "H")},
+                              dr=0.1, start=0.5, stop=8.0)
+        self.assertTrue(np.allclose(labeled["O_H"].values, pcfs["H_O"].values))
+        self.assertTrue(np.allclose(labeled["Na_H"].values, pcfs["H_Na"].values))
+
+    def test_radial_pcf_out_of_core(self):
+        """Parallel reduction of pair counts, resumed from a checkpoint."""
+        kwargs = dict(dr=0.1, start=0.5, stop=8.0)
+        pairs = {"O_H": ("O", "H"), "O_O": ("O", "O")}
+        with tempfile.TemporaryDirectory() as tmp:
+            two = os.path.join(tmp, "two.hdf")
+            out = os.path.join(tmp, "out.hdf")
+            compute_atom_two_out_of_core(two, self.uni, dmax=8.0, vector=False, bonds=False)
+            atom = self.uni.atom[self.uni.atom['frame'].astype(int) < 2].copy()
+            # Cell vectors only (no cell magnitudes)
+            frame = self.uni.frame.loc[[0, 1]].drop(columns=['rx', 'ry', 'rz'], errors='ignore')
+            part = Universe(atom=atom, frame=frame)
+            with self.assertRaises(ValueError):
+                radial_pcf_out_of_core(two, out, part, pairs, checkpoint=0, **kwargs)
+            frames = radial_pcf_out_of_core(two, out, part, pairs, checkpoint=1, **kwargs)
+            self.assertListEqual(frames.tolist(), [0, 1])
+            frames = radial_pcf_out_of_core(two, out, self.uni, pairs, n_jobs=2, **kwargs)
+            self.assertListEqual(frames.tolist(), [2])
+            for key, (a, b) in pairs.items():
+                check = radial_pcf(self.uni, a, b, **kwargs).reset_index()
+                result = pd.read_hdf(out, "radial_pcf_" + key)
+                self.assertTrue(np.allclose(check.values, result.values))
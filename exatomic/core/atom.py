@@ -15,6 +15,7 @@ from exa.util.units import Length
 from exatomic.base import sym2z, sym2mass
 from exatomic.algorithms.distance import modv
 from exatomic.core.error import PeriodicUniverseError
+from exatomic.core.molecule import unwrap_molecules
 from exatomic.algorithms.geometry import make_small_molecule
 from exatomic import plotter
 
@@ -371,6 +372,9 @@ class ProjectedAtom(DataFrame):
 
 class VisualAtom(DataFrame):
     """
+    Coordinates for which molecules are whole (sparse) in periodic systems.
+    These coordinates are used to update the corresponding
+    :class:`~exatomic.atom.Atom` object.
     """
     _index = 'atom'
     _columns = ['x', 'y', 'z']
@@ -378,16 +382,13 @@ class VisualAtom(DataFrame):
     @classmethod
     def from_universe(cls, universe):
         """
+        Unwrap molecules using the bond graph.
+
+        See Also:
+            :func:`~exatomic.core.molecule.unwrap_molecules`
         """
         if universe.frame.is_periodic():
-            atom = universe.atom[['x', 'y', 'z']].copy()
-            atom.update(universe.unit_atom)
-            bonded = universe.atom_two.loc[universe.atom_two['bond'] == True, 'atom1'].astype(np.int64)
-            prjd = universe.projected_atom.loc[bonded.index].to_dense()
-            prjd['atom'] = bonded
-            prjd.drop_duplicates('atom', inplace=True)
-            prjd.set_index('atom', inplace=True)
-            atom.update(prjd)
+            atom = unwrap_molecules(universe)
             return cls(atom[atom != universe.atom[['x', 'y', 'z']]])
         raise PeriodicUniverseError()
 
@@ -86,10 +86,32 @@ class Frame(DataFrame):
         self['rz'] = cartmag(self['xk'].values, self['yk'].values, self['zk'].values)
 
     def orthorhombic(self):
-        if "xi" in self.columns and np.allclose(self["xj"], 0.0):
+        """
+        Check if the cell (applicable to periodic simulations) is orthorhombic
+        (in all frames).
+        """
+        offdiag = [col for col in ("xj", "xk", "yi", "yk", "zi", "zj")
+                   if col in self.columns]
+        if "xi" in self.columns and np.allclose(self[offdiag], 0.0):
             return True
         return False
 
+    def cell_matrix(self, fdx):
+        """
+        Return the cell matrix of a given frame.
+
+        The rows of the matrix are the cell vectors (xi, yi, zi), (xj, yj, zj),
+        and (xk, yk, zk).
+
+        Args:
+            fdx (int): Frame index
+
+        Returns:
+            cell (:class:`~numpy.ndarray`): 3x3 cell matrix
+        """
+        cols = ['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']
+        return self.loc[fdx, cols].values.astype(np.float64).reshape(3, 3)
+
 
 def compute_frame(universe):
     """
@@ -1,180 +1,383 @@
-# -*- coding: utf-8 -*-
-# Copyright (c) 2015-2020, Exa Analytics Development Team
-# Distributed under the terms of the Apache License 2.0
-"""
-Molecule Table
-###################
-"""
-import numpy as np
-import pandas as pd
-import networkx as nx
-import warnings
-from networkx.algorithms.components import connected_components
-from exa import DataFrame
-from exatomic.base import sym2mass
-from exatomic.formula import string_to_dict, dict_to_string
-
-
-class Molecule(DataFrame):
-    """
-    Description of molecules in the atomic universe.
-    """
-    _index = 'molecule'
-    _categories = {'frame': np.int64, 'formula': str, 'classification': object}
-
-    #@property
-    #def _constructor(self):
-    #    return Molecule
-
-    def classify(self, *classifiers):
-        """
-        Classify molecules into arbitrary categories.
-
-        .. code-block:: Python
-
-            u.molecule.classify(('solute', 'Na'), ('solvent', 'H(2)O(1)'))
-
-        Args:
-            classifiers: Any number of tuples of the form ('label', 'identifier', exact) (see below)
-
-        Note:
-            A classifier has 3 parts, "label", e.g. "solvent", "identifier", e.g.
-            "H(2)O(1)", and exact (true or false). If exact is false (default),
-            classification is greedy and (in this example) molecules with formulas
-            "H(1)O(1)", "H(3)O(1)", etc. would get classified as "solvent". If,
-            instead, exact were set to true, those molecules would remain
-            unclassified.
-
-        Warning:
-            Classifiers are applied in the order passed; where identifiers overlap,
-            the latter classification is used.
-
-        See Also:
-            :func:`~exatomic.algorithms.nearest.compute_nearest_molecules`
-        """
-        for c in classifiers:
-            n = len(c)
-            if n != 3 and n != 2:
-                raise ClassificationError()
-        self['classification'] = None
-        for classifier in classifiers:
-            identifier = string_to_dict(classifier[0])
-            classification = classifier[1]
-            exact = classifier[2] if len(classifier) == 3 else False
-            this = self
-            for symbol, count in identifier.items():
-                this = this[this[symbol] == count] if exact else this[this[symbol] >= 1]
-            if len(this) > 0:
-                self.ix[self.index.isin(this.index), 'classification'] = classification
-            else:
-                raise KeyError('No records found for {}, with identifier {}.'.format(classification, identifier))
-        self['classification'] = self['classification'].astype('category')
-        if len(self[self['classification'].isnull()]) > 0:
-            warnings.warn("Unclassified molecules remaining...")
-
-    def get_atom_count(self):
-        """
-        Compute the number of atoms per molecule.
-        """
-        symbols = self._get_symbols()
-        return self[symbols].sum(axis=1)
-
-    def get_formula(self, as_map=False):
-        """
-        Compute the string representation of the molecule.
-        """
-        symbols = self._get_symbols()
-        mcules = self[symbols].to_dict(orient='index')
-        ret = map(dict_to_string, mcules.values())
-        if as_map:
-            return ret
-        return list(ret)
-
-    def _get_symbols(self):
-        """
-        Helper method to get atom symbols.
-        """
-        return [col for col in self if len(col) < 3 and col[0].istitle()]
-
-
-def compute_molecule(universe):
-    """
-    Cluster atoms into molecules and create the :class:`~exatomic.molecule.Molecule`
-    table.
-
-    Args:
-        universe: Atomic universe
-
-    Returns:
-        molecule: Molecule table
-
-    Warning:
-        This function modifies the universe's atom (:class:`~exatomic.atom.Atom`)
-        table in place!
-    """
-    nodes = universe.atom.index.values
-    bonded = universe.atom_two.loc[universe.atom_two['bond'] == True, ['atom0', 'atom1']]
-    edges = zip(bonded['atom0'].astype(np.int64), bonded['atom1'].astype(np.int64))
-    g = nx.Graph()
-    g.add_nodes_from(nodes)
-    g.add_edges_from(edges)
-    # generate molecule indices for the atom table
-    mapper = {}
-    i = 0
-    for k, v in g.degree():    # First handle single atom "molecules"
-        if v == 0:
-            mapper[k] = i
-            i += 1
-    for seht in connected_components(g):    # Second handle multi atom molecules
-        for adx in seht:
-            mapper[adx] = i
-        i += 1
-    universe.atom['molecule'] = universe.atom.index.map(lambda x: mapper[x])
-    universe.atom['mass'] = universe.atom['symbol'].map(sym2mass).astype(float)
-    grps = universe.atom.groupby('molecule')
-    molecule = grps['symbol'].value_counts().unstack().fillna(0).astype(np.int64)
-    molecule.columns.name = None
-    molecule['mass'] = grps['mass'].sum()
-    universe.atom['molecule'] = universe.atom['molecule'].astype('category')
-    del universe.atom['mass']
-    return molecule
-
-
-def compute_molecule_count(universe):
-    """
-    """
-    if 'molecule' not in universe.atom.columns:
-        universe.compute_molecule()
-    universe.atom._revert_categories()
-    mapper = universe.atom.drop_duplicates('molecule').set_index('molecule')['frame']
-    universe.atom._set_categories()
-    universe.molecule['frame'] = universe.molecule.index.map(lambda x: mapper[x])
-    molecule_count = universe.molecule.groupby('frame').size()
-    del universe.molecule['frame']
-    return molecule_count
-
-
-def compute_molecule_com(universe):
-    """
-    Compute molecules' centers of mass.
-    """
-    if 'molecule' not in universe.atom.columns:
-        universe.compute_molecule()
-    mass = universe.atom.get_element_masses()
-    if universe.frame.is_periodic():
-        xyz = universe.atom[['x', 'y', 'z']].copy()
-        xyz.update(universe.visual_atom)
-    else:
-        xyz = universe.atom[['x', 'y', 'z']]
-    xm = xyz['x'].mul(mass)
-    ym = xyz['y'].mul(mass)
-    zm = xyz['z'].mul(mass)
-    #rm = xm.add(ym).add(zm)
-    df = pd.DataFrame.from_dict({'xm': xm, 'ym': ym, 'zm': zm, 'mass': mass,
-                                 'molecule': universe.atom['molecule']})
-    groups = df.groupby('molecule')
-    sums = groups.sum()
-    cx = sums['xm'].div(sums['mass'])
-    cy = sums['ym'].div(sums['mass'])
-    cz = sums['zm'].div(sums['mass'])
-    return cx, cy, cz
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+"""
+Molecule Table
+###################
+"""
+import numpy as np
+import pandas as pd
+import warnings
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, breadth_first_order
+from exa import DataFrame
+from exatomic.base import sym2mass
+from exatomic.algorithms.distance import unwrap_bonded
+from exatomic.formula import string_to_dict, dict_to_string
+from exatomic.core.error import ClassificationError
+
+
+class Molecule(DataFrame):
+    """
+    Description of molecules in the atomic universe.
+    """
+    _index = 'molecule'
+    _categories = {'frame': np.int64, 'formula': str, 'classification': object}
+
+    #@property
+    #def _constructor(self):
+    #    return Molecule
+
+    def classify(self, *classifiers):
+        """
+        Classify molecules into arbitrary categories.
+
+        .. code-block:: Python
+
+            u.molecule.classify(('Na', 'solute'), ('H(2)O(1)', 'solvent'))
+
+        Args:
+            classifiers: Any number of tuples of the form ('identifier', 'label', exact) (see below)
+
+        Note:
+            A classifier has 3 parts, "identifier", e.g. "H(2)O(1)", "label", e.g.
+            "solvent", and exact (true or false). If exact is false (default),
+            classification is greedy and (in this example) molecules with formulas
+            "H(1)O(1)", "H(3)O(1)", etc. would get classified as "solvent". If,
+            instead, exact were set to true, those molecules would remain
+            unclassified.
+
+        Tip:
+            Classifiers are evaluated once per distinct composition (see
+            :func:`~exatomic.core.molecule.Molecule.get_composition`) rather
+            than per molecule.
+
+        Warning:
+            Classifiers are applied in the order passed; where identifiers overlap,
+            the latter classification is used.
+
+        See Also:
+            :func:`~exatomic.algorithms.nearest.compute_nearest_molecules`
+        """
+        for c in classifiers:
+            n = len(c)
+            if n != 3 and n != 2:
+                raise ClassificationError()
+        symbols = self._get_symbols()
+        counts, inverse = self.get_composition()
+        categories = []
+        codes = np.full((len(counts), ), -1, dtype=np.int64)
+        for classifier in classifiers:
+            identifier = string_to_dict(classifier[0])
+            classification = classifier[1]
+            exact = classifier[2] if len(classifier) == 3 else False
+            match = np.ones((len(counts), ), dtype=bool)
+            for symbol, count in identifier.items():
+                col = counts[:, symbols.index(symbol)] if symbol in symbols else 0
+                match &= (col == count) if exact else (col >= 1)
+            if not np.any(match[inverse]):
+                raise KeyError('No records found for {}, with identifier {}.'.format(classification, identifier))
+            if classification not in categories:
+                categories.append(classification)
+            codes[match] = categories.index(classification)
+        self['classification'] = pd.Categorical.from_codes(codes[inverse], categories)
+        if np.any(codes[inverse] < 0):
+            warnings.warn("Unclassified molecules remaining...")
+
+    def get_atom_count(self):
+        """
+        Compute the number of atoms per molecule.
+        """
+        symbols = self._get_symbols()
+        return self[symbols].sum(axis=1)
+
+    def get_composition(self):
+        """
+        Encode each molecule's composition (symbol counts) as an integer key.
+
+        Returns:
+            counts (array): Distinct symbol count vectors (columns as :func:`~exatomic.core.molecule.Molecule._get_symbols`)
+            keys (array): Per molecule index into counts
+        """
+        symbols = self._get_symbols()
+        values = self[symbols].fillna(0).values.astype(np.int64)
+        counts, keys = np.unique(values.reshape(len(self), len(symbols)), axis=0,
+                                 return_inverse=True)
+        return counts, keys.ravel()
+
+    def get_formula(self, as_map=False):
+        """
+        Compute the string representation of the molecule.
+
+        Formula strings are generated once per distinct composition.
+        """
+        symbols = self._get_symbols()
+        counts, keys = self.get_composition()
+        formulas = np.array([dict_to_string(dict(zip(symbols, row))) for row in counts],
+                            dtype=object)
+        ret = formulas[keys]
+        if as_map:
+            return iter(ret)
+        return list(ret)
+
+    def _get_symbols(self):
+        """
+        Helper method to get atom symbols.
+        """
+        return [col for col in self if len(col) < 3 and col[0].istitle()]
+
+
+def compute_molecule(universe, track=False):
+    """
+    Cluster atoms into molecules and create the :class:`~exatomic.molecule.Molecule`
+    table.
+
+    Molecules are the connected components of the (sparse) bond matrix (see
+    :func:`~exatomic.core.two.atom_two_csr`). Single atom "molecules" are
+    numbered first, followed by multi atom molecules, each ordered by their
+    lowest atom index.
+
+    If track is true, molecule indices are instead persistent across frames
+    (see :func:`~exatomic.core.molecule.track_molecules`). The molecule table
+    then has a row per molecule per frame: its index is the persistent
+    molecule index (repeated in every frame the molecule exists) and the
+    additional frame column identifies the frame, i.e. rows are keyed by
+    (frame, molecule).
+
+    .. code-block:: python
+
+        uni.compute_molecule(track=True)
+        table = uni.molecule[uni.molecule['frame'] == 2]    # Molecules of frame 2
+        history = uni.molecule.loc[[5]]                     # Molecule 5 in every frame
+
+    Args:
+        universe: Atomic universe
+        track (bool): Carry molecule indices forward from frame to frame
+
+    Returns:
+        molecule: Molecule table
+
+    Warning:
+        This function modifies the universe's atom (:class:`~exatomic.atom.Atom`)
+        table in place!
+    """
+    if track:
+        molecule = track_molecules(universe.atom, universe.atom_two)
+        n = molecule.max() + 1
+        frame = universe.atom['frame'].values.astype(np.int64)
+        keys, rows = np.unique(frame*n + molecule, return_inverse=True)
+        table = _molecule_table(universe.atom, rows, len(keys))
+        table.index = pd.Index(keys%n, name='molecule')
+        table['frame'] = keys//n
+    else:
+        molecule = _molecule_components(universe)
+        table = _molecule_table(universe.atom, molecule, molecule.max() + 1)
+    universe.atom['molecule'] = pd.Categorical(molecule)
+    return table
+
+
+def track_molecules(atom, atom_two):
+    """
+    Compute molecule indices that are persistent across frames.
+
+    Atoms are identified from frame to frame by their label (see
+    :func:`~exatomic.core.atom.Atom.get_atom_labels`) and frames are processed
+    in order, carrying the previous frame's molecule indices forward. If the
+    bonds (by atom label) of a frame are identical to those of the previous
+    frame, its molecules are unchanged and their indices are copied without
+    further work. Otherwise the connected components of that frame's bonds
+    are computed and matched to the previous molecules: molecules whose atoms
+    are unchanged keep their index, changed molecules are matched greedily by
+    the number of atoms they share with a previous molecule (so the larger
+    fragment of a dissociated molecule keeps its index) and unmatched
+    molecules get new indices.
+
+    Args:
+        atom (:class:`~exatomic.core.atom.Atom`): Atom table
+        atom_two (:class:`~exatomic.core.two.AtomTwo`): Two body table (with bonds)
+
+    Returns:
+        tracked (array): Per atom persistent molecule indices
+    """
+    if 'label' in atom.columns:
+        label = atom['label'].values.astype(np.int64)
+    else:
+        label = atom.get_atom_labels().values.astype(np.int64)
+    frame = atom['frame'].values.astype(np.int64)
+    nlabel = label.max() + 1 if len(label) > 0 else 0
+    bonds = atom_two[atom_two['bond'] == True]
+    pos0 = atom.index.get_indexer(bonds['atom0'].values.astype(np.int64))
+    pos1 = atom.index.get_indexer(bonds['atom1'].values.astype(np.int64))
+    # Bonds by frame, keyed by the (ordered) labels of the bonded atoms
+    key = np.minimum(label[pos0], label[pos1])*nlabel + np.maximum(label[pos0], label[pos1])
+    border = np.argsort(frame[pos0], kind='mergesort')
+    bfdx, bstart = np.unique(frame[pos0][border], return_index=True)
+    fbonds = dict(zip(bfdx, np.split(border, bstart[1:])))
+    empty = np.empty((0, ), dtype=np.int64)
+    tracked = np.empty((len(atom), ), dtype=np.int64)
+    current = np.full((nlabel, ), -1, dtype=np.int64)
+    local = np.empty((len(atom), ), dtype=np.int64)
+    nxt = 0
+    last = None
+    order = np.argsort(frame, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(frame[order])) + 1
+    for idx in np.split(order, bounds):
+        b = fbonds.get(frame[idx[0]], empty)
+        state = (np.sort(label[idx]), np.sort(key[b]))
+        if last is not None and all(np.array_equal(i, j) for i, j in zip(state, last)):
+            tracked[idx] = current[label[idx]]    # Bonds unchanged
+            continue
+        last = state
+        local[idx] = np.arange(len(idx))
+        graph = csr_matrix((np.ones((len(b), )), (local[pos0[b]], local[pos1[b]])),
+                           shape=(len(idx), len(idx)))
+        ncomp, inverse = connected_components(graph, directed=False)
+        previous = current[label[idx]]
+        # Overlap (number of shared atoms) of new and previous molecules
+        keys, counts = np.unique(inverse*(nxt + 1) + previous + 1, return_counts=True)
+        comp = keys//(nxt + 1)
+        prev = keys%(nxt + 1) - 1
+        ids = np.full((ncomp, ), -1, dtype=np.int64)
+        # Unchanged molecules: a single previous molecule not shared with others
+        npairs = np.bincount(comp, minlength=ncomp)
+        nprev = np.bincount(prev[prev >= 0], minlength=nxt)
+        same = (npairs[comp] == 1) & (prev >= 0)
+        same[same] = nprev[prev[same]] == 1
+        ids[comp[same]] = prev[same]
+        # Changed molecules: greedy matching by overlap
+        changed = np.flatnonzero(~same & (prev >= 0))
+        used = set()
+        for i in changed[np.argsort(-counts[changed], kind='mergesort')]:
+            if ids[comp[i]] < 0 and prev[i] not in used:
+                ids[comp[i]] = prev[i]
+                used.add(prev[i])
+        # New molecules: single atoms first, then by lowest atom index
+        new = np.flatnonzero(ids < 0)
+        new = new[np.argsort(np.bincount(inverse, minlength=ncomp)[new] > 1, kind='mergesort')]
+        ids[new] = np.arange(nxt, nxt + len(new))
+        nxt += len(new)
+        tracked[idx] = ids[inverse]
+        current[label[idx]] = tracked[idx]
+    return tracked
+
+
+def _molecule_components(universe):
+    """
+    Per atom molecule indices from the connected components of the bond matrix.
+    """
+    index = universe.atom.index.values
+    labels = connected_components(universe.bond_csr, directed=False)[1][index]
+    labels, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.lexsort((np.arange(len(labels)), sizes > 1))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse]
+
+
+def _molecule_table(atom, rows, n):
+    """
+    Symbol counts and mass per molecule, given the (molecule table) row of
+    each atom.
+    """
+    symbols = atom['symbol'].astype(str).values
+    unique, codes = np.unique(symbols, return_inverse=True)
+    counts = np.bincount(rows*len(unique) + codes, minlength=n*len(unique))
+    mass = pd.Series(unique).map(sym2mass).astype(float).values[codes]
+    data = dict(zip(unique, counts.reshape(n, len(unique)).T.astype(np.int64)))
+    data['mass'] = np.bincount(rows, weights=mass, minlength=n)
+    return pd.DataFrame(data, index=pd.RangeIndex(n, name='molecule'))
+
+
+def compute_molecule_count(universe):
+    """
+    Compute the number of molecules per frame.
+    """
+    if 'molecule' not in universe.atom.columns:
+        universe.compute_molecule()
+    molecule = universe.atom['molecule'].values.astype(np.int64)
+    frame = universe.atom['frame'].values.astype(np.int64)
+    n = molecule.max() + 1
+    keys = np.unique(frame*n + molecule)
+    return pd.Series(keys//n).value_counts().sort_index()
+
+
+def compute_molecule_com(universe):
+    """
+    Compute molecules' centers of mass.
+
+    For periodic universes, molecules are first made whole (see
+    :func:`~exatomic.core.molecule.unwrap_molecules`). Centers are computed
+    for all molecules (of all frames) at once.
+
+    Returns:
+        cx, cy, cz (array): Center of mass ordered as the molecule table rows
+    """
+    if 'molecule' not in universe.atom.columns:
+        universe.compute_molecule()
+    if universe.frame.is_periodic():
+        xyz = unwrap_molecules(universe).values
+    else:
+        xyz = universe.atom[['x', 'y', 'z']].values.astype(np.float64)
+    mass = universe.atom.get_element_masses().values.astype(np.float64)
+    rows = _molecule_rows(universe)
+    n = len(universe.molecule)
+    total = np.bincount(rows, weights=mass, minlength=n)
+    cx = np.bincount(rows, weights=mass*xyz[:, 0], minlength=n)/total
+    cy = np.bincount(rows, weights=mass*xyz[:, 1], minlength=n)/total
+    cz = np.bincount(rows, weights=mass*xyz[:, 2], minlength=n)/total
+    return cx, cy, cz
+
+
+def unwrap_molecules(universe):
+    """
+    Make every molecule whole in each frame of a periodic universe.
+
+    A spanning forest of the bond graph (see
+    :func:`~exatomic.core.two.atom_two_csr`) rooted at the first atom of each
+    molecule is traversed breadth first and atoms are placed at the minimum
+    image relative to their parent atom, using each frame's cell.
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): Periodic universe with bonds
+
+    Returns:
+        unwrapped (:class:`~pandas.DataFrame`): Unwrapped x, y, z coordinates
+    """
+    atom = universe.atom
+    index = atom.index.values
+    csr = universe.bond_csr
+    n = csr.shape[0]
+    labels = connected_components(csr, directed=False)[1]
+    roots = index[np.unique(labels[index], return_index=True)[1]]
+    # Virtual node n connects the roots so that a single traversal suffices
+    coo = csr.tocoo()
+    forest = csr_matrix((np.ones((len(coo.data) + len(roots), )),
+                         (np.concatenate((coo.row, np.full(len(roots), n))),
+                          np.concatenate((coo.col, roots)))), shape=(n + 1, n + 1))
+    order, parent = breadth_first_order(forest, n, directed=True, return_predecessors=True)
+    position = np.full((n + 1, ), -1, dtype=np.int64)
+    position[index] = np.arange(len(index))
+    cols = ['xi', 'yi', 'zi', 'xj', 'yj', 'zj', 'xk', 'yk', 'zk']
+    cells = universe.frame[cols].values.astype(np.float64).reshape(-1, 3, 3)
+    cdx = universe.frame.index.get_indexer(atom['frame'].values.astype(np.int64))
+    x, y, z = unwrap_bonded(atom['x'].values.astype(np.float64),
+                            atom['y'].values.astype(np.float64),
+                            atom['z'].values.astype(np.float64),
+                            position[order[1:]], position[parent[index]],
+                            cells, cdx.astype(np.int64))
+    return pd.DataFrame.from_dict({'x': x, 'y': y, 'z': z}).set_index(atom.index)
+
+
+def _molecule_rows(universe):
+    """
+    Molecule table row (position) of each atom, for both global and tracked
+    (see :func:`~exatomic.core.molecule.track_molecules`) molecule indices.
+    """
+    table = universe.molecule
+    molecule = universe.atom['molecule'].values.astype(np.int64)
+    if table.index.is_unique:
+        return table.index.get_indexer(molecule)
+    n = max(molecule.max(), table.index.max()) + 1
+    keys = table['frame'].values.astype(np.int64)*n + table.index.values.astype(np.int64)
+    frame = universe.atom['frame'].values.astype(np.int64)
+    return pd.Index(keys).get_indexer(frame*n + molecule)
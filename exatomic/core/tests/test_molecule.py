@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.core.atom import Atom
+from exatomic.core.universe import Universe
+
+
+def make_water(nside=3, nframes=2, spacing=5.7, shift=0.0):
+    """
+    Periodic box of water molecules on a grid (plus a lone Na atom), optionally
+    shifted so that molecules straddle the cell boundary.
+    """
+    a = nside*spacing
+    grid = np.array([(i, j, k) for i in range(nside) for j in range(nside)
+                     for k in range(nside)], dtype=float)*spacing
+    oh = np.array([[0.0, 0.0, 0.0], [1.81, 0.0, 0.0], [-0.45, 1.75, 0.0]])
+    xyz = (grid[:, None, :] + oh[None, :, :]).reshape(-1, 3)
+    xyz = np.vstack((xyz, [[spacing/2]*3]))
+    xyz = np.mod(xyz + shift, a)
+    symbols = ['O', 'H', 'H']*len(grid) + ['Na']
+    nat = len(xyz)
+    atom = pd.DataFrame.from_dict({'x': np.tile(xyz[:, 0], nframes),
+                                   'y': np.tile(xyz[:, 1], nframes),
+                                   'z': np.tile(xyz[:, 2], nframes),
+                                   'symbol': symbols*nframes,
+                                   'frame': np.repeat(range(nframes), nat)})
+    uni = Universe(atom=Atom(atom))
+    for i, col in enumerate(['xi', 'xj', 'xk', 'yi', 'yj', 'yk', 'zi', 'zj', 'zk']):
+        uni.frame[col] = a if i % 4 == 0 else 0.0
+    for col in ['ox', 'oy', 'oz']:
+        uni.frame[col] = 0.0
+    uni.frame['periodic'] = True
+    return uni
+
+
+class TestMolecule(TestCase):
+    def setUp(self):
+        self.uni = make_water(shift=-0.5)
+        self.uni.compute_atom_two(bonds_only=True, Na=0.5)
+
+    def test_compute_molecule(self):
+        """Connected components of the (periodic) bond graph."""
+        self.uni.compute_molecule()
+        molecule = self.uni.molecule
+        self.assertEqual(len(molecule), 2*28)
+        self.assertEqual((molecule['Na'] == 1).sum(), 2)
+        water = molecule[molecule['O'] == 1]
+        self.assertTrue(np.all(water['H'] == 2))
+        self.assertTrue(np.allclose(water['mass'], 18.015, atol=0.01))
+        self.assertTrue(np.all(molecule.iloc[:2]['Na'] == 1))    # Single atoms first
+        self.assertTrue(np.all(self.uni.frame['molecule_count'] == 28))
+
+    def test_track_molecules(self):
+        """Persistent molecule indices across frames."""
+        uni = make_water(nframes=3, shift=1.0)
+        h = uni.atom.index[(uni.atom['frame'] == 2)][1]    # Dissociate an H in frame 2
+        uni.atom.loc[h, ['x', 'y', 'z']] = [3.85, 3.85, 9.55]
+        uni.compute_atom_two(bonds_only=True, Na=0.5)
+        uni.compute_molecule(track=True)
+        molecule = uni.atom['molecule'].astype(int)
+        frame = uni.atom['frame'].astype(int)
+        first = molecule[frame == 0].values
+        self.assertTrue(np.all(molecule[frame == 1].values == first))
+        last = molecule[frame == 2].values
+        self.assertTrue(np.all(last[:1] == first[:1]))    # Larger fragment keeps its index
+        self.assertTrue(np.all(last[2:] == first[2:]))
+        self.assertEqual(last[1], first.max() + 1)
+        table = uni.molecule
+        self.assertEqual(len(table), 28 + 28 + 29)
+        self.assertTrue(np.all(uni.frame['molecule_count'].values == [28, 28, 29]))
+        self.assertEqual(table[table['frame'] == 2].loc[first[0], 'H'], 1)
+
+    def test_molecule_com(self):
+        """Centers of mass of molecules that straddle the cell boundary."""
+        ref = make_water(nframes=1)
+        ref.compute_atom_two(bonds_only=True, Na=0.5)
+        ref.compute_molecule()
+        ref.compute_molecule_com()
+        a = 3*5.7
+        check = np.mod(ref.molecule[['cx', 'cy', 'cz']].values - 0.5, a)
+        check = check[np.lexsort(check.T)]
+        for track in (False, True):
+            self.uni.compute_molecule(track=track)
+            self.uni.compute_molecule_com()
+            atom = self.uni.atom
+            molecule = atom.loc[atom['frame'] == 1, 'molecule'].astype(int).unique()
+            if track:
+                table = self.uni.molecule[self.uni.molecule['frame'] == 1]
+            else:
+                table = self.uni.molecule.loc[molecule]
+            com = np.mod(table[['cx', 'cy', 'cz']].values, a)
+            self.assertTrue(np.allclose(com[np.lexsort(com.T)], check))
+        unwrapped = self.uni.atom[['x', 'y', 'z']].copy()
+        unwrapped.update(self.uni.visual_atom)
+        dr = np.linalg.norm(unwrapped.values[1] - unwrapped.values[0])
+        self.assertAlmostEqual(dr, 1.81)
+
+    def test_classify(self):
+        """Classification and formulas by distinct composition."""
+        self.uni.compute_molecule()
+        molecule = self.uni.molecule
+        formula = molecule.get_formula()
+        self.assertEqual(formula.count('H(2)O(1)'), 54)
+        self.assertEqual(formula.count('Na(1)'), 2)
+        molecule.classify(('H(2)O(1)', 'solvent', True), ('Na', 'solute'))
+        counts = molecule['classification'].value_counts()
+        self.assertEqual(counts['solvent'], 54)
+        self.assertEqual(counts['solute'], 2)
+        with self.assertRaises(KeyError):
+            molecule.classify(('Cl', 'ion'))
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from exatomic.core.atom import Atom
+from exatomic.core.universe import Universe
+from exatomic.core.two import (compute_atom_two, iter_atom_two, completed_frames,
+                               compute_atom_two_out_of_core, _VerletKernel,
+                               _pdist_frames)
+from exatomic.algorithms.distance import pdist
+
+
+def make_universe(n=60, nframes=2, a=12.0, periodic=True, seed=0):
+    """Random water-like (O, H, H) periodic universe used by the tests below."""
+    rng = np.random.RandomState(seed)
+    nat = 3*n
+    atom = pd.DataFrame.from_dict({'x': rng.rand(nat*nframes)*a,
+                                   'y': rng.rand(nat*nframes)*a,
+                                   'z': rng.rand(nat*nframes)*a,
+                                   'symbol': ['O', 'H', 'H']*n*nframes,
+                                   'frame': np.repeat(range(nframes), nat)})
+    uni = Universe(atom=Atom(atom))
+    if periodic:
+        for i, col in enumerate(['xi', 'xj', 'xk', 'yi', 'yj', 'yk', 'zi', 'zj', 'zk']):
+            uni.frame[col] = a if i % 4 == 0 else 0.0
+        for col in ['ox', 'oy', 'oz']:
+            uni.frame[col] = 0.0
+        uni.frame['periodic'] = True
+    return uni
+
+
+def sort_two(atom_two):
+    return atom_two.sort_values(['atom0', 'atom1']).reset_index(drop=True)
+
+
+class TestAtomTwo(TestCase):
+    def setUp(self):
+        self.free = make_universe(periodic=False)
+        self.periodic = make_universe()
+
+    def test_cells(self):
+        for uni in (self.free, self.periodic):
+            check = sort_two(compute_atom_two(uni, vector=True))
+            result = sort_two(compute_atom_two(uni, vector=True, method="cells"))
+            self.assertListEqual(list(check.columns), list(result.columns))
+            self.assertTrue(np.allclose(check['dr'], result['dr']))
+            self.assertTrue(np.all(check['bond'] == result['bond']))
+        with self.assertRaises(ValueError):
+            compute_atom_two(self.free, method="unknown")
+
+    def test_iter_atom_two(self):
+        check = compute_atom_two(self.periodic)
+        chunks = list(iter_atom_two(self.periodic, chunksize=1))
+        self.assertEqual(len(chunks), 2)
+        result = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(len(check), len(result))
+        self.assertTrue(np.allclose(check['dr'], result['dr']))
+        frame = check['atom0'].map(self.periodic.atom['frame']).astype(int)
+        self.assertTrue(np.all(frame.values == result['frame'].values))
+
+    def test_triclinic(self):
+        """Monoclinic cell whose vectors vary by frame."""
+        uni = make_universe(n=40)
+        uni.frame['xk'] = [-2.0, -3.0]
+        uni.frame['zk'] = [12.0, 11.5]
+        self.assertFalse(uni.orthorhombic)
+        for method in ("direct", "cells"):
+            atom_two = compute_atom_two(uni, vector=True, method=method)
+            for fdx in (0, 1):
+                cell = uni.frame.cell_matrix(fdx)
+                atom = uni.atom[uni.atom['frame'] == fdx]
+                two = atom_two[atom_two['atom0'].isin(atom.index)]
+                prj = two['projection'].values
+                shift = np.column_stack((prj//9 - 1, prj//3 % 3 - 1, prj % 3 - 1)).dot(cell)
+                xyz = uni.atom[['x', 'y', 'z']].values
+                frac = np.linalg.solve(cell.T, xyz.T).T
+                xyz = (frac - np.floor(frac)).dot(cell)
+                vec = xyz[two['atom0'].values] + shift - xyz[two['atom1'].values]
+                self.assertTrue(np.allclose(vec, two[['dx', 'dy', 'dz']].values))
+                self.assertTrue(np.allclose(np.linalg.norm(vec, axis=1), two['dr']))
+                self.assertTrue(two['dr'].max() < 8.0)
+        check = sort_two(compute_atom_two(uni, vector=True))
+        result = sort_two(compute_atom_two(uni, vector=True, method="cells"))
+        self.assertTrue(np.allclose(check['dr'], result['dr']))
+
+    def test_n_jobs(self):
+        """Frame parallel results are identical (including order) to serial ones."""
+        uni = make_universe(nframes=5)
+        check = compute_atom_two(uni, vector=True)
+        result = compute_atom_two(uni, vector=True, n_jobs=3)
+        self.assertTrue(np.all(check['atom0'].values == result['atom0'].values))
+        self.assertTrue(np.all(check['atom1'].values == result['atom1'].values))
+        self.assertTrue(np.allclose(check['dr'], result['dr']))
+        result = compute_atom_two(uni, vector=True, n_jobs=-1)
+        self.assertTrue(np.allclose(check['dr'], result['dr']))
+        for n_jobs in (0, -2):
+            with self.assertRaises(ValueError):
+                compute_atom_two(uni, vector=True, n_jobs=n_jobs)
+
+    def test_bonds_only(self):
+        """Bond only search finds the same bonds as the full search."""
+        uni = make_universe(n=40)
+        uni.frame['xk'] = [-2.0, -3.0]
+        for u in (self.free, self.periodic, uni):
+            check = compute_atom_two(u, vector=True, O=1.0, bond_extra=0.5)
+            check = sort_two(check[check['bond'] == True])
+            result = sort_two(compute_atom_two(u, vector=True, bonds_only=True,
+                                               O=1.0, bond_extra=0.5))
+            self.assertListEqual(list(check.columns), list(result.columns))
+            self.assertTrue(np.all(check[['atom0', 'atom1']].values == result[['atom0', 'atom1']].values))
+            self.assertTrue(np.allclose(check[['dx', 'dy', 'dz', 'dr']], result[['dx', 'dy', 'dz', 'dr']]))
+        result = compute_atom_two(self.free, bonds_only=True)
+        self.assertNotIn('dx', result.columns)
+
+    def test_verlet(self):
+        """Neighbor list reuse along a (random walk) trajectory."""
+        nframes = 6
+        uni = make_universe(n=40, nframes=nframes)
+        first = uni.atom[uni.atom['frame'] == 0][['x', 'y', 'z']].values
+        steps = np.random.RandomState(1).normal(scale=0.05, size=(nframes, ) + first.shape)
+        xyz = np.concatenate(first + np.cumsum(steps, axis=0))
+        uni.atom[['x', 'y', 'z']] = xyz
+        uni.compute_unit_atom()
+        uni.frame['xk'] = -2.0
+        for u in (uni, make_universe(n=40, nframes=1, periodic=False)):
+            check = compute_atom_two(u, vector=True, dmax=5.0)
+            result = compute_atom_two(u, vector=True, dmax=5.0, method="verlet")
+            check['frame'] = check['atom0'].map(u.atom['frame']).astype(int)
+            result['frame'] = result['atom0'].map(u.atom['frame']).astype(int)
+            check = check.sort_values(['frame', 'atom0', 'atom1']).reset_index(drop=True)
+            result = result.sort_values(['frame', 'atom0', 'atom1']).reset_index(drop=True)
+            cols = ['atom0', 'atom1'] + (['projection'] if u.periodic else [])
+            self.assertTrue(np.all(check[cols].values == result[cols].values))
+            self.assertTrue(np.allclose(check['dr'], result['dr']))
+        with self.assertRaises(ValueError):
+            compute_atom_two(uni, method="verlet", bonds_only=True)
+
+    def test_verlet_cell(self):
+        """Gradual cell deformation (constant pressure) does not force rebuilds."""
+        nframes = 6
+        uni = make_universe(n=40, nframes=nframes)
+        scale = 1 - 0.002*np.arange(nframes)
+        first = uni.atom[uni.atom['frame'] == 0][['x', 'y', 'z']].values
+        steps = np.random.RandomState(3).normal(scale=0.02, size=(nframes, ) + first.shape)
+        xyz = (first + np.cumsum(steps, axis=0))*scale[:, None, None]
+        uni.atom[['x', 'y', 'z']] = np.concatenate(xyz)
+        for col in ('xi', 'yj', 'zk'):
+            uni.frame[col] = 12.0*scale
+        ortho = Universe(atom=uni.atom.copy(), frame=uni.frame.copy())
+        uni.frame['xk'] = -2.0*scale
+        for u in (uni, ortho):
+            u.compute_unit_atom()
+            check = sort_two(compute_atom_two(u, vector=True, dmax=5.0))
+            result = sort_two(compute_atom_two(u, vector=True, dmax=5.0, method="verlet"))
+            self.assertTrue(np.all(check[['atom0', 'atom1', 'projection']].values ==
+                                   result[['atom0', 'atom1', 'projection']].values))
+            self.assertTrue(np.allclose(check['dr'], result['dr']))
+        boundary = "triclinic"
+        kernel = _VerletKernel(boundary, False, 2.0)
+        for fdx, args in _pdist_frames(uni, boundary):
+            kernel(*args, 5.0)
+        self.assertEqual(kernel.builds, 1)
+        kernel = _VerletKernel(boundary, False, 0.1)
+        for fdx, args in _pdist_frames(uni, boundary):
+            kernel(*args, 5.0)
+        self.assertEqual(kernel.builds, nframes)
+
+    def test_verlet_reorder(self):
+        """The neighbor list is rebuilt if the atoms (index) change."""
+        kernel = _VerletKernel("free", False, 1.0)
+        rng = np.random.RandomState(2)
+        x, y, z = rng.rand(3, 30)*6.0
+        index = np.arange(30)
+        kernel(x, y, z, index, 3.0)
+        kernel(x, y, z, index + 30, 3.0)
+        self.assertEqual(kernel.builds, 1)
+        perm = rng.permutation(30)
+        dr, atom0, atom1 = kernel(x[perm], y[perm], z[perm], index[perm], 3.0)
+        self.assertEqual(kernel.builds, 2)
+        check = pdist(x[perm], y[perm], z[perm], index[perm], 3.0)
+        self.assertEqual(len(dr), len(check[0]))
+
+    def test_compact(self):
+        """Compact data types match the default (float64/int64) output."""
+        check = compute_atom_two(self.periodic, vector=True)
+        result = compute_atom_two(self.periodic, vector=True, compact=True)
+        for col in ('dx', 'dy', 'dz', 'dr'):
+            self.assertEqual(result[col].dtype, np.float32)
+        self.assertEqual(result['projection'].dtype, np.int8)
+        for col in ('atom0', 'atom1'):
+            self.assertEqual(result[col].dtype, np.int32)
+            self.assertTrue(np.all(check[col].astype(np.int64).values == result[col].values))
+        self.assertTrue(np.allclose(check['dr'], result['dr'], atol=1e-5))
+        self.assertTrue(np.all(check['bond'].values == result['bond'].values))
+        for two in iter_atom_two(self.periodic, compact=True):
+            self.assertEqual(two['frame'].dtype, np.int32)
+
+    def test_out_of_core(self):
+        """Chunked HDF output, skipping completed frames on restart."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "two.hdf")
+            uni = make_universe(nframes=3)
+            done = compute_atom_two_out_of_core(path, uni, dmax=5.0, chunksize=2)
+            self.assertEqual(list(done), [0, 1, 2])
+            self.assertEqual(list(completed_frames(path)), [0, 1, 2])
+            self.assertEqual(len(compute_atom_two_out_of_core(path, uni, dmax=5.0)), 0)
+            check = compute_atom_two(uni, dmax=5.0, vector=True)
+            check['frame'] = check['atom0'].map(uni.atom['frame']).astype(int)
+            for fdx in range(3):
+                two = pd.read_hdf(path, "frame_{}/atom_two".format(fdx))
+                ref = check[check['frame'] == fdx]
+                self.assertEqual(len(two), len(ref))
+                self.assertEqual(two['bond'].sum(), ref['bond'].sum())
+
+    def test_out_of_core_empty(self):
+        """Frames without pairs are written (empty) and recorded as completed."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "two.hdf")
+            uni = make_universe(n=4, nframes=3, periodic=False)
+            far = uni.atom['frame'].astype(int) == 1
+            for q in ('x', 'y', 'z'):
+                uni.atom.loc[far, q] *= 100.0
+            compute_atom_two_out_of_core(path, uni, dmax=5.0, chunksize=3)
+            self.assertEqual(list(completed_frames(path)), [0, 1, 2])
+            self.assertEqual(len(compute_atom_two_out_of_core(path, uni, dmax=5.0)), 0)
+            full = pd.read_hdf(path, "frame_0/atom_two")
+            empty = pd.read_hdf(path, "frame_1/atom_two")
+            self.assertEqual(len(empty), 0)
+            self.assertListEqual(empty.columns.tolist(), full.columns.tolist())
+            self.assertTrue(np.all(empty.dtypes == full.dtypes))
+
+    def test_out_of_core_cubic(self):
+        """The deprecated cubic cell argument sets a cell if none is present."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "two.hdf")
+            uni = make_universe(nframes=1, periodic=False)
+            with self.assertWarns(DeprecationWarning):
+                compute_atom_two_out_of_core(path, uni, 12.0)
+            self.assertFalse(uni.periodic)
+            self.assertNotIn('xi', uni.frame.columns)
+            ref = make_universe(nframes=1)
+            ref.compute_atom_two(dmax=12.0)
+            self.assertEqual(len(pd.read_hdf(path, "frame_0/atom_two")), len(ref.atom_two))
+
+    def test_sparse(self):
+        """Sparse (CSR) distance and bond matrices."""
+        uni = make_universe()
+        uni.compute_atom_two()
+        two = uni.atom_two
+        csr = uni.atom_two_csr
+        self.assertEqual(csr.shape, (len(uni.atom), len(uni.atom)))
+        self.assertEqual(csr.nnz, 2*len(two))
+        i, j = int(two['atom0'].iloc[0]), int(two['atom1'].iloc[0])
+        self.assertAlmostEqual(csr[i, j], two['dr'].iloc[0])
+        self.assertAlmostEqual(csr[j, i], two['dr'].iloc[0])
+        uni.compute_bond_count()
+        bonded = two.loc[two['bond'] == True, ['atom0', 'atom1']].stack().astype(int)
+        counts = bonded.value_counts().reindex(uni.atom.index, fill_value=0)
+        self.assertTrue(np.all(uni.atom['bond_count'].values == counts.values))
+        self.assertEqual(uni.bond_csr.nnz, 2*two['bond'].sum())
+        # Assigning a new two body table invalidates the cached matrices
+        uni.atom_two = two[two['bond'] == False]
+        self.assertEqual(uni.bond_csr.nnz, 0)
+        self.assertEqual(uni.atom_two_csr.nnz, 2*len(uni.atom_two))
+
+    def test_sparse_container(self):
+        """Cached sparse matrices do not interfere with info, copy and HDF output."""
+        uni = make_universe(nframes=1)
+        uni.compute_atom_two()
+        nnz = uni.atom_two_csr.nnz
+        bonds = uni.bond_csr.nnz
+        self.assertIn('atom_two', uni.info().index)
+        copy = uni.copy()
+        self.assertEqual(copy.atom_two_csr.nnz, nnz)
+        self.assertEqual(copy.bond_csr.nnz, bonds)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "uni.hdf")
+            uni.to_hdf(path)
+            loaded = Universe.load(path)
+            self.assertEqual(loaded.atom_two_csr.nnz, nnz)
+            self.assertEqual(loaded.bond_csr.nnz, bonds)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015-2020, Exa Analytics Development Team
+# Distributed under the terms of the Apache License 2.0
+"""
+Atomic Three Body
+##################################
+This module provides the table of three body (bond angle) properties, see
+:func:`~exatomic.algorithms.angles.compute_angles`.
+
++-------------------+----------+---------------------------------------------+
+| Column            | Type     | Description                                 |
++===================+==========+=============================================+
+| atom0             | integer  | central atom (:class:`~exatomic.atom.Atom`) |
++-------------------+----------+---------------------------------------------+
+| atom1             | integer  | first outer atom                            |
++-------------------+----------+---------------------------------------------+
+| atom2             | integer  | second outer atom                           |
++-------------------+----------+---------------------------------------------+
+| angle             | float    | angle atom1-atom0-atom2 (radians)           |
++-------------------+----------+---------------------------------------------+
+| frame             | integer  | non-unique integer (req.)                   |
++-------------------+----------+---------------------------------------------+
+"""
+from exa import DataFrame
+
+
+class AtomThree(DataFrame):
+    """Bond angles."""
+    _index = "three"
+    _columns = ["atom0", "atom1", "atom2", "angle"]
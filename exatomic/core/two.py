@@ -27,15 +27,31 @@ guide for the types of data found in two body tables provided by this module
 | symbols           | category | concatenated atomic symbols                 |
 +-------------------+----------+---------------------------------------------+
 """
+import os
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from IPython.display import display
-from ipywidgets import FloatProgress
+from scipy.sparse import csr_matrix
 from exa import DataFrame
 #from exa.util.units import Length
 from exatomic.base import sym2radius
 from exatomic.algorithms.distance import (pdist_ortho, pdist_ortho_nv, pdist,
-                                          pdist_nv)
+                                          pdist_nv, pdist_cells, pdist_cells_nv,
+                                          pdist_ortho_cells, pdist_ortho_cells_nv,
+                                          pdist_triclinic, pdist_triclinic_nv,
+                                          pdist_triclinic_cells,
+                                          pdist_triclinic_cells_nv, wrap_triclinic,
+                                          pdist_bonds, pdist_ortho_bonds,
+                                          pdist_triclinic_bonds, verlet_list,
+                                          pdist_pairs, max_displacement)
+
+
+# Column data types of the compact AtomTwo representation
+compact_dtypes = {'dx': np.float32, 'dy': np.float32, 'dz': np.float32,
+                  'dr': np.float32, 'atom0': np.int32, 'atom1': np.int32,
+                  'projection': np.int8}
 
 
 class AtomTwo(DataFrame):
@@ -60,7 +76,8 @@ class MoleculeTwo(DataFrame):
         return MoleculeTwo
 
 
-def compute_atom_two(universe, dmax=8.0, vector=False, bonds=True, **kwargs):
+def compute_atom_two(universe, dmax=8.0, vector=False, bonds=True, method="direct",
+                     n_jobs=1, bonds_only=False, skin=2.0, compact=False, **kwargs):
     """
     Compute interatomic distances and determine bonds.
 
@@ -69,6 +86,11 @@ def compute_atom_two(universe, dmax=8.0, vector=False, bonds=True, **kwargs):
         atom_two = compute_atom_two(uni, dmax=4.0)    # Max distance of interest as 4 bohr
         atom_two = compute_atom_two(uni, vector=True) # Return distance vector components as well as distance
         atom_two = compute_atom_two(uni, bonds=False) # Don't compute bonds
+        atom_two = compute_atom_two(uni, method="cells") # Linked cell search (large systems)
+        atom_two = compute_atom_two(uni, n_jobs=-1)   # Process frames on all cores
+        atom_two = compute_atom_two(uni, bonds_only=True) # Only bonded pairs (e.g. for molecules)
+        atom_two = compute_atom_two(uni, method="verlet", skin=1.0) # Reuse neighbors across frames
+        atom_two = compute_atom_two(uni, compact=True) # float32 distances, int32 indices
         # Compute bonds with custom covalent radii (atomic units)
         atom_two = compute_atom_two(unit, H=10.0, He=20.0, Li=30.0, bond_extra=100.0)
 
@@ -77,174 +99,490 @@ def compute_atom_two(universe, dmax=8.0, vector=False, bonds=True, **kwargs):
         dmax (float): Maximum distance of interest
         vector (bool): Compute distance vector (needed for angles)
         bonds (bool): Compute bonds (default True)
+        method (str): Pair search algorithm, "direct" (all pairs), "cells" (linked cells) or "verlet"
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+        bonds_only (bool): Only search for (and return) bonded pairs
+        skin (float): Neighbor list skin for the "verlet" method
+        compact (bool): Store distances as float32, indices as int32 and projections as int8
+        kwargs: Additional keyword arguments for :func:`~exatomic.core.two._compute_bonds`
+
+    Returns:
+        atom_two (:class:`~exatomic.core.two.AtomTwo`): Two body data
+
+    Tip:
+        The "cells" method scales linearly with the number of atoms (per frame)
+        and is preferable for systems with more than a few thousand atoms.
+        For trajectories (with the same atoms in every frame) the "verlet"
+        method builds a neighbor list up to dmax + skin and only rebuilds it
+        when an atom has moved more than half the skin; frames are then
+        processed sequentially (n_jobs is ignored). It cannot be combined
+        with ``bonds_only``.
+        If only bonds are of interest (e.g. to compute molecules), use
+        ``bonds_only=True``; the bond criterion is applied during the (linked
+        cell) search so that the table is much smaller.
+
+    Note:
+        Periodic universes may have orthorhombic or general (triclinic) cells,
+        which may vary from frame to frame. In both cases the projection
+        column identifies the periodic image of atom0 used (see
+        :func:`~exatomic.algorithms.distance.pdist_triclinic`).
+        With ``compact=True`` the atom0 and atom1 columns are plain int32
+        columns rather than categoricals.
+
+    See Also:
+        For trajectories whose two body data does not fit in memory, see
+        :func:`~exatomic.core.two.iter_atom_two`.
+    """
+    kernel, columns, frames, params = _setup_pdist(universe, dmax, vector, method,
+                                                   bonds_only, skin, compact, **kwargs)
+    if method == "verlet":
+        n_jobs = 1
+    atom_two = _compute_pdist(frames, kernel, columns, params, n_jobs=n_jobs,
+                              compact=compact)
+    _finalize_two(universe, atom_two, vector, bonds, bonds_only, **kwargs)
+    return atom_two
+
+
+def iter_atom_two(universe, dmax=8.0, vector=False, bonds=True, method="direct",
+                  chunksize=1, n_jobs=1, bonds_only=False, skin=2.0, compact=False,
+                  frames=None, **kwargs):
+    """
+    Compute interatomic distances (and bonds) in chunks of frames.
+
+    Rather than assembling a single :class:`~exatomic.core.two.AtomTwo` for
+    the entire trajectory, two body data is yielded per chunk of frames; only
+    one chunk is held in memory at a time.
+
+    .. code-block:: python
+
+        for atom_two in iter_atom_two(uni, dmax=6.0, chunksize=100):
+            ...    # Process (or write to disk) 100 frames at a time
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): Universe object with atom table
+        dmax (float): Maximum distance of interest
+        vector (bool): Compute distance vector
+        bonds (bool): Compute bonds (default True)
+        method (str): Pair search algorithm, "direct", "cells" or "verlet"
+        chunksize (int): Number of frames per yielded chunk
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+        bonds_only (bool): Only search for (and return) bonded pairs
+        skin (float): Neighbor list skin for the "verlet" method
+        compact (bool): Store distances as float32, indices as int32 and projections as int8
+        frames (array): Restrict the computation to these frame indices (default all)
         kwargs: Additional keyword arguments for :func:`~exatomic.core.two._compute_bonds`
+
+    Yields:
+        atom_two (:class:`~exatomic.core.two.AtomTwo`): Two body data (with frame column)
+    """
+    kernel, columns, frames, params = _setup_pdist(universe, dmax, vector, method,
+                                                   bonds_only, skin, compact, frames,
+                                                   **kwargs)
+    if method == "verlet":
+        n_jobs = 1
+    chunk = []
+    for item in frames:
+        chunk.append(item)
+        if len(chunk) == chunksize:
+            atom_two = _compute_pdist(chunk, kernel, columns, params, frame=True,
+                                      n_jobs=n_jobs, compact=compact)
+            _finalize_two(universe, atom_two, vector, bonds, bonds_only, **kwargs)
+            yield atom_two
+            chunk = []
+    if len(chunk) > 0:
+        atom_two = _compute_pdist(chunk, kernel, columns, params, frame=True,
+                                  n_jobs=n_jobs, compact=compact)
+        _finalize_two(universe, atom_two, vector, bonds, bonds_only, **kwargs)
+        yield atom_two
+
+
+def _setup_pdist(universe, dmax, vector, method, bonds_only, skin=2.0, compact=False,
+                 frames=None, **kwargs):
+    """
+    Prepare the pair kernel, per frame arguments and additional (trailing)
+    kernel parameters for a two body computation.
+    """
+    if compact and len(universe.atom) > 0 and universe.atom.index.max() > np.iinfo(np.int32).max:
+        raise ValueError("Atom index too large for compact (int32) two body data")
+    if method == "verlet" and bonds_only:
+        raise ValueError("The 'verlet' method does not support bonds_only, use 'cells'")
+    kernel, columns, boundary = _select_pdist(universe, vector, method, bonds_only)
+    if method == "verlet":
+        kernel = _VerletKernel(boundary, vector, skin)
+    if bonds_only:
+        codes, radii, bond_extra = _bond_radii(universe.atom, **kwargs)
+        frames = _pdist_frames(universe, boundary, codes, frames)
+        params = (radii, bond_extra, dmax)
+    else:
+        frames = _pdist_frames(universe, boundary, frames=frames)
+        params = (dmax, )
+    return kernel, columns, frames, params
+
+
+def _finalize_two(universe, atom_two, vector, bonds, bonds_only, **kwargs):
+    """Determine bonds (inplace) after a pair search."""
+    if bonds_only:
+        atom_two['bond'] = True
+        if not vector:
+            for col in ('dx', 'dy', 'dz'):
+                del atom_two[col]
+    elif bonds:
+        _compute_bonds(universe.atom, atom_two, **kwargs)
+
+
+def _select_pdist(universe, vector, method, bonds_only=False):
     """
+    Select the appropriate pair kernel for a universe.
+
+    Returns:
+        kernel (function): Pair kernel
+        columns (tuple): Names of the kernel's return values
+        boundary (str): Boundary conditions, "free", "ortho" or "triclinic"
+    """
+    if method not in ("direct", "cells", "verlet"):
+        raise ValueError("Unknown method {}, use 'direct', 'cells' or 'verlet'".format(method))
+    cells = method == "cells"
+    vector = vector or bonds_only
     if universe.periodic:
-        if universe.orthorhombic and vector:
-            atom_two = compute_pdist_ortho(universe, dmax=dmax)
-        elif universe.orthorhombic:
-            atom_two = compute_pdist_ortho_nv(universe, dmax=dmax)
+        if vector:
+            columns = ('dx', 'dy', 'dz', 'dr', 'atom0', 'atom1', 'projection')
         else:
-            raise NotImplementedError("Only supports orthorhombic cells")
+            columns = ('dr', 'atom0', 'atom1', 'projection')
+        if universe.orthorhombic:
+            if bonds_only:
+                kernel = pdist_ortho_bonds
+            elif vector:
+                kernel = pdist_ortho_cells if cells else pdist_ortho
+            else:
+                kernel = pdist_ortho_cells_nv if cells else pdist_ortho_nv
+            return kernel, columns, "ortho"
+        if bonds_only:
+            kernel = pdist_triclinic_bonds
+        elif vector:
+            kernel = pdist_triclinic_cells if cells else pdist_triclinic
+        else:
+            kernel = pdist_triclinic_cells_nv if cells else pdist_triclinic_nv
+        return kernel, columns, "triclinic"
+    if bonds_only:
+        kernel = pdist_bonds
+        columns = ('dx', 'dy', 'dz', 'dr', 'atom0', 'atom1')
     elif vector:
-        atom_two = compute_pdist(universe, dmax=dmax)
+        kernel = pdist_cells if cells else pdist
+        columns = ('dx', 'dy', 'dz', 'dr', 'atom0', 'atom1')
     else:
-        atom_two = compute_pdist_nv(universe, dmax=dmax)
-    if bonds:
-        _compute_bonds(universe.atom, atom_two, **kwargs)
+        kernel = pdist_cells_nv if cells else pdist_nv
+        columns = ('dr', 'atom0', 'atom1')
+    return kernel, columns, "free"
+
+
+class _VerletKernel(object):
+    """
+    Stateful pair kernel that reuses a (Verlet) neighbor list across
+    consecutive frames.
+
+    The neighbor list contains all pairs within dmax + skin and is rebuilt
+    (using the linked cell search) only when some atom has moved more than
+    half of the skin since the last build, or when the atoms or dmax change.
+    Otherwise, only the listed pairs are checked. If the (periodic) cell
+    changes (e.g. constant pressure trajectories), displacements are measured
+    in the cell of the last build (same fractional coordinates) and the skin
+    available to them is reduced by the largest compression of the cell, so
+    that the list stays valid under gradual cell deformation. Frames contain the
+    same atoms (in the same order) if their atom indices differ from those of
+    the last build by a constant offset (as for consecutive frames of an atom
+    table); any other change of the atom index forces a rebuild. Calls accept the
+    same arguments and return the same values as the corresponding cell
+    kernels (see :func:`~exatomic.core.two._select_pdist`).
+
+    Args:
+        boundary (str): Boundary conditions, "free", "ortho" or "triclinic"
+        vector (bool): Return distance vectors
+        skin (float): Neighbor list skin
+    """
+    def __call__(self, x, y, z, *args):
+        if self.boundary == "ortho":
+            cell = np.diag(np.array(args[:3], dtype=np.float64))
+            args = args[3:]
+        elif self.boundary == "triclinic":
+            cell = args[0]
+            args = args[1:]
+        else:
+            cell = np.zeros((3, 3))
+        index, dmax = args
+        periodic = self.boundary != "free"
+        if self._rebuild(x, y, z, cell, index, dmax, periodic):
+            self.ii, self.jj = verlet_list(x, y, z, cell, periodic, dmax + self.skin)
+            self.reference = (x.copy(), y.copy(), z.copy(), cell, dmax, index.copy())
+            self.builds += 1
+        dx, dy, dz, dr, atom0, atom1, prj = pdist_pairs(x, y, z, cell, periodic, index,
+                                                        self.ii, self.jj, dmax, self.vector)
+        values = (dx, dy, dz) if self.vector else ()
+        values += (dr, atom0, atom1)
+        return values + (prj, ) if periodic else values
+
+    def _rebuild(self, x, y, z, cell, index, dmax, periodic):
+        """Check if the neighbor list needs to be (re)built."""
+        if self.reference is None:
+            return True
+        x0, y0, z0, cell0, dmax0, index0 = self.reference
+        if dmax != dmax0 or len(x) != len(x0):
+            return True
+        if len(index) > 0 and not np.array_equal(index - index[0], index0 - index0[0]):
+            return True
+        skin = self.skin
+        if periodic and not np.allclose(cell, cell0):
+            # Pair vectors transform as r = r0.dot(deform), so current pairs
+            # within dmax were within dmax/smin in the reference cell
+            deform = np.linalg.solve(cell0, cell)
+            smin = np.linalg.svd(deform, compute_uv=False).min()
+            skin -= dmax*(1/smin - 1)
+            if skin <= 0:
+                return True
+            xyz = np.linalg.solve(deform.T, np.vstack((x, y, z))).T
+            x, y, z = (np.ascontiguousarray(xyz[:, i]) for i in range(3))
+            cell = cell0
+        return max_displacement(x, y, z, x0, y0, z0, cell, periodic) > skin/2
+
+    def __init__(self, boundary, vector, skin):
+        self.boundary = boundary
+        self.vector = vector
+        self.skin = skin
+        self.reference = None
+        self.ii = None
+        self.jj = None
+        self.builds = 0
+
+
+def _pdist_frames(universe, boundary, codes=None, frames=None):
+    """
+    Generate per frame arguments for the pair kernels.
+
+    For periodic universes, in unit cell coordinates and cell dimensions
+    (orthorhombic) or the cell matrix (triclinic) are provided. Triclinic
+    coordinates are wrapped frame by frame, so that variable cell
+    trajectories are supported.
+
+    Note:
+        This generator (the groupby over frames and, for triclinic cells,
+        :func:`~exatomic.algorithms.distance.wrap_triclinic`) runs serially on
+        the consuming thread; only the pair kernels applied to its output are
+        parallelized by :func:`~exatomic.core.two._map_frames`.
+
+    Args:
+        universe (:class:`~exatomic.core.universe.Universe`): Universe
+        boundary (str): Boundary conditions, "free", "ortho" or "triclinic"
+        codes (:class:`~pandas.Series`): Per atom integer codes (appended to the arguments)
+        frames (array): Only generate arguments for these frame indices
+
+    Yields:
+        fdx (int): Frame index
+        args (tuple): Positional arguments (excluding dmax) for the pair kernel
+    """
+    if boundary == "ortho":
+        if "rx" not in universe.frame.columns:
+            universe.frame.compute_cell_magnitudes()
+        atom = universe.atom[["x", "y", "z", "frame"]].copy()
+        atom.update(universe.unit_atom)
+    else:
+        atom = universe.atom
+    if frames is not None:
+        atom = atom[atom['frame'].isin(frames)]
+    for fdx, group in atom.groupby("frame"):
+        if len(group) > 0:
+            args = (group['x'].values.astype(float),
+                    group['y'].values.astype(float),
+                    group['z'].values.astype(float))
+            if boundary == "ortho":
+                args += tuple(universe.frame.loc[fdx, ["rx", "ry", "rz"]])
+            elif boundary == "triclinic":
+                cell = universe.frame.cell_matrix(fdx)
+                args = wrap_triclinic(*args, cell) + (cell, )
+            args += (group.index.values.astype(int), )
+            if codes is not None:
+                args += (codes.loc[group.index].values.astype(np.int64), )
+            yield fdx, args
+
+
+def _frame_cell(args, boundary):
+    """
+    Cell matrix of the per frame arguments generated by
+    :func:`~exatomic.core.two._pdist_frames` (zeros for free boundary conditions).
+    """
+    if boundary == "ortho":
+        return np.diag(np.array(args[3:6], dtype=np.float64))
+    elif boundary == "triclinic":
+        return args[3]
+    return np.zeros((3, 3))
+
+
+def _map_frames(func, items, n_jobs=1, processes=False):
+    """
+    Apply a function to each item, optionally using a pool of threads (or
+    processes).
+
+    Threads are intended for the (nogil) numba kernels, which run
+    concurrently. Work dominated by pandas (which holds the GIL) should use
+    processes, in which case func and the items must be picklable. At most a
+    few items per worker are in flight at any time and results are yielded in
+    the order of the items, so output is deterministic and memory usage does
+    not depend on the number of items.
+
+    Args:
+        func (function): Function of a single item
+        items (iterable): Items to process
+        n_jobs (int): Number of threads, at least 1 (-1 or None for all cores)
+        processes (bool): Use a pool of processes rather than threads
+
+    Yields:
+        result: Result of func for each item (in order)
+    """
+    if n_jobs is None or n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    elif n_jobs < 1:
+        raise ValueError("n_jobs must be a positive integer or -1 (all cores), got {}".format(n_jobs))
+    if n_jobs == 1:
+        for item in items:
+            yield func(item)
+        return
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=n_jobs) as pool:
+        futures = deque()
+        for item in items:
+            futures.append(pool.submit(func, item))
+            if len(futures) >= 2*n_jobs:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def _compute_pdist(frames, kernel, columns, params, frame=False, n_jobs=1,
+                   compact=False):
+    """
+    Run a pair kernel over frames and assemble the results.
+
+    Per frame results are concatenated one column at a time and released
+    immediately, so that peak memory usage stays close to the size of the
+    final table (rather than twice that).
+
+    Args:
+        frames (iterable): Frame index, kernel argument pairs (see _pdist_frames)
+        kernel (function): Pair kernel
+        columns (tuple): Names of the kernel's return values
+        params (tuple): Trailing kernel arguments (e.g. maximum distance of interest)
+        frame (bool): Include a frame column
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+        compact (bool): Convert (per frame) results to compact data types
+
+    Returns:
+        atom_two (:class:`~exatomic.core.two.AtomTwo`): Two body data
+    """
+    def worker(item):
+        result = kernel(*item[1], *params)
+        if compact:
+            result = tuple(value.astype(compact_dtypes[name], copy=False)
+                           for name, value in zip(columns, result))
+        return item[0], result
+
+    values = [[] for _ in columns]
+    fdxs = []
+    counts = []
+    for fdx, result in _map_frames(worker, frames, n_jobs):
+        for lst, value in zip(values, result):
+            lst.append(value)
+        fdxs.append(fdx)
+        counts.append(len(result[0]))
+    data = {}
+    for name in columns:
+        lst = values.pop(0)
+        dtype = compact_dtypes[name] if compact else None
+        data[name] = np.concatenate(lst) if len(lst) > 0 else np.empty((0, ), dtype=dtype)
+        del lst
+    if frame:
+        dtype = np.int32 if compact else np.int64
+        data['frame'] = np.repeat(np.array(fdxs, dtype=dtype), counts)
+    atom_two = AtomTwo.from_dict(data)
+    if compact:
+        # Categoricals of (nearly) unique atom indices would have int64 categories
+        for col in ('atom0', 'atom1'):
+            if col in atom_two.columns:
+                atom_two[col] = data[col]
     return atom_two
 
 
-def compute_pdist(universe, dmax=8.0):
+def compute_pdist(universe, dmax=8.0, method="direct", n_jobs=1):
     """
     Compute interatomic distances for atoms in free boundary conditions.
 
     Does return distance vector.
     """
-    dxs = []
-    dys = []
-    dzs = []
-    drs = []
-    atom0s = []
-    atom1s = []
-    for _, group in universe.atom.groupby("frame"):
-        if len(group) > 0:
-            values = pdist(group['x'].values.astype(float),
-                           group['y'].values.astype(float),
-                           group['z'].values.astype(float),
-                           group.index.values.astype(int), dmax)
-            dxs.append(values[0])
-            dys.append(values[1])
-            dzs.append(values[2])
-            drs.append(values[3])
-            atom0s.append(values[4])
-            atom1s.append(values[5])
-    dxs = np.concatenate(dxs)
-    dys = np.concatenate(dys)
-    dzs = np.concatenate(dzs)
-    drs = np.concatenate(drs)
-    atom0s = np.concatenate(atom0s)
-    atom1s = np.concatenate(atom1s)
-    return AtomTwo.from_dict({'dx': dxs, 'dy': dys, 'dz': dzs, 'dr': drs,
-                              'atom0': atom0s, 'atom1': atom1s})
-
-
-def compute_pdist_nv(universe, dmax=8.0):
+    kernel = pdist_cells if method == "cells" else pdist
+    return _compute_pdist(_pdist_frames(universe, "free"), kernel,
+                          ('dx', 'dy', 'dz', 'dr', 'atom0', 'atom1'), (dmax, ), n_jobs=n_jobs)
+
+
+def compute_pdist_nv(universe, dmax=8.0, method="direct", n_jobs=1):
     """
     Compute interatomic distances for atoms in free boundary conditions.
 
     Does not return distance vector.
     """
-    drs = []
-    atom0s = []
-    atom1s = []
-    #for fdx, group in universe.atom.groupby("frame"):
-    for _, group in universe.atom.groupby("frame"):
-        if len(group) > 0:
-            values = pdist_nv(group['x'].values.astype(float),
-                              group['y'].values.astype(float),
-                              group['z'].values.astype(float),
-                              group.index.values.astype(int), dmax)
-            drs.append(values[0])
-            atom0s.append(values[1])
-            atom1s.append(values[2])
-    drs = np.concatenate(drs)
-    atom0s = np.concatenate(atom0s)
-    atom1s = np.concatenate(atom1s)
-    return AtomTwo.from_dict({'dr': drs, 'atom0': atom0s, 'atom1': atom1s})
+    kernel = pdist_cells_nv if method == "cells" else pdist_nv
+    return _compute_pdist(_pdist_frames(universe, "free"), kernel,
+                          ('dr', 'atom0', 'atom1'), (dmax, ), n_jobs=n_jobs)
 
 
-def compute_pdist_ortho(universe, dmax=8.0):
+def compute_pdist_ortho(universe, dmax=8.0, method="direct", n_jobs=1):
     """
     Compute interatomic distances between atoms in an orthorhombic
     periodic cell.
 
     Args:
         universe (:class:`~exatomic.core.universe.Universe`): A universe
-        bonds (bool): Compute bonds as well as distances
-        bond_extra (float): Extra factor to use when determining bonds
         dmax (float): Maximum distance of interest
-        rtol (float): Relative tolerance (float equivalence)
-        atol (float): Absolute tolerance (float equivalence)
-        radii (kwargs): Custom (covalent) radii to use when determining bonds
-    """
-    if "rx" not in universe.frame.columns:
-        universe.frame.compute_cell_magnitudes()
-    dxs = []
-    dys = []
-    dzs = []
-    drs = []
-    atom0s = []
-    atom1s = []
-    prjs = []
-    atom = universe.atom[["x", "y", "z", "frame"]].copy()
-    atom.update(universe.unit_atom)
-    for fdx, group in atom.groupby("frame"):
-        if len(group) > 0:
-            a, b, c = universe.frame.loc[fdx, ["rx", "ry", "rz"]]
-            values = pdist_ortho(group['x'].values.astype(float),
-                                 group['y'].values.astype(float),
-                                 group['z'].values.astype(float),
-                                 a, b, c,
-                                 group.index.values.astype(int), dmax)
-            dxs.append(values[0])
-            dys.append(values[1])
-            dzs.append(values[2])
-            drs.append(values[3])
-            atom0s.append(values[4])
-            atom1s.append(values[5])
-            prjs.append(values[6])
-    dxs = np.concatenate(dxs)
-    dys = np.concatenate(dys)
-    dzs = np.concatenate(dzs)
-    drs = np.concatenate(drs)
-    atom0s = np.concatenate(atom0s)
-    atom1s = np.concatenate(atom1s)
-    prjs = np.concatenate(prjs)
-    return AtomTwo.from_dict({'dx': dxs, 'dy': dys, 'dz': dzs, 'dr': drs,
-                              'atom0': atom0s, 'atom1': atom1s, 'projection': prjs})
-
-
-def compute_pdist_ortho_nv(universe, dmax=8.0):
+        method (str): Pair search algorithm, "direct" or "cells"
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+    """
+    kernel = pdist_ortho_cells if method == "cells" else pdist_ortho
+    return _compute_pdist(_pdist_frames(universe, "ortho"), kernel,
+                          ('dx', 'dy', 'dz', 'dr', 'atom0', 'atom1', 'projection'), (dmax, ), n_jobs=n_jobs)
+
+
+def compute_pdist_ortho_nv(universe, dmax=8.0, method="direct", n_jobs=1):
     """
     Compute interatomic distances between atoms in an orthorhombic
     periodic cell.
 
+    Does not return distance vector.
+
     Args:
         universe (:class:`~exatomic.core.universe.Universe`): A universe
-        bonds (bool): Compute bonds as well as distances
-        bond_extra (float): Extra factor to use when determining bonds
         dmax (float): Maximum distance of interest
-        rtol (float): Relative tolerance (float equivalence)
-        atol (float): Absolute tolerance (float equivalence)
-        radii (kwargs): Custom (covalent) radii to use when determining bonds
-    """
-    if "rx" not in universe.frame.columns:
-        universe.frame.compute_cell_magnitudes()
-    drs = []
-    atom0s = []
-    atom1s = []
-    prjs = []
-    atom = universe.atom[["x", "y", "z", "frame"]].copy()
-    atom.update(universe.unit_atom)
-    for fdx, group in atom.groupby("frame"):
-        if len(group) > 0:
-            a, b, c = universe.frame.loc[fdx, ["rx", "ry", "rz"]]
-            values = pdist_ortho_nv(group['x'].values.astype(float),
-                                    group['y'].values.astype(float),
-                                    group['z'].values.astype(float),
-                                    a, b, c,
-                                    group.index.values.astype(int), dmax)
-            drs.append(values[0])
-            atom0s.append(values[1])
-            atom1s.append(values[2])
-            prjs.append(values[3])
-    drs = np.concatenate(drs)
-    atom0s = np.concatenate(atom0s)
-    atom1s = np.concatenate(atom1s)
-    prjs = np.concatenate(prjs)
-    return AtomTwo.from_dict({'dr': drs, 'atom0': atom0s, 'atom1': atom1s,
-                              'projection': prjs})
+        method (str): Pair search algorithm, "direct" or "cells"
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+    """
+    kernel = pdist_ortho_cells_nv if method == "cells" else pdist_ortho_nv
+    return _compute_pdist(_pdist_frames(universe, "ortho"), kernel,
+                          ('dr', 'atom0', 'atom1', 'projection'), (dmax, ), n_jobs=n_jobs)
+
+
+def _bond_radii(atom, bond_extra=0.45, **radii):
+    """
+    Per atom symbol codes and (covalent) radii per code for bond detection.
+
+    Args:
+        atom (:class:`~exatomic.core.atom.Atom`): Atom table
+        bond_extra (float): Additional amount for determining bonds
+        radii: Custom radii to use for computing bonds
+
+    Returns:
+        codes (:class:`~pandas.Series`): Symbol category code of each atom
+        rad (array): Radius of each code
+        bond_extra (float): Additional amount for determining bonds
+    """
+    symbol = atom['symbol'].astype('category')
+    rad = np.array([radii.get(sym, sym2radius[sym][0])
+                    for sym in symbol.cat.categories], dtype=np.float64)
+    return symbol.cat.codes, rad, float(bond_extra)
 
 
 def _compute_bonds(atom, atom_two, bond_extra=0.45, **radii):
@@ -256,61 +594,163 @@ def _compute_bonds(atom, atom_two, bond_extra=0.45, **radii):
         radii: Custom radii to use for computing bonds
     """
     atom['symbol'] = atom['symbol'].astype('category')
-    radmap = {sym: sym2radius[sym][0] for sym in atom['symbol'].cat.categories}
-    radmap.update(radii)
-    maxdr = (atom_two['atom0'].map(atom['symbol']).map(radmap).astype(float) +
-             atom_two['atom1'].map(atom['symbol']).map(radmap).astype(float) + bond_extra)
+    codes, rad, bond_extra = _bond_radii(atom, bond_extra, **radii)
+    maxdr = (rad[codes.loc[atom_two['atom0'].values.astype(np.int64)].values] +
+             rad[codes.loc[atom_two['atom1'].values.astype(np.int64)].values] + bond_extra)
     atom_two['bond'] = np.where(atom_two['dr'] <= maxdr, True, False)
 
 
-def _compute_bond_count(atom, atom_two):
+def _compute_bond_count(atom, atom_two=None, csr=None):
     """
     Compute bond counts inplace.
+
+    Args:
+        atom (:class:`~exatomic.core.atom.Atom`): Atom table
+        atom_two (:class:`~exatomic.core.two.AtomTwo`): Two body data
+        csr (:class:`~scipy.sparse.csr_matrix`): Bond matrix (used instead of atom_two if given)
     """
-    if "bond" not in atom_two.columns:
-        _compute_bonds(atom, atom_two)
-    bonded = atom_two.loc[atom_two['bond'] == True, ["atom0", "atom1"]].stack()
-    atom['bond_count'] = bonded.value_counts().sort_index()
+    if csr is None:
+        if "bond" not in atom_two.columns:
+            _compute_bonds(atom, atom_two)
+        csr = atom_two_csr(atom_two, atom.index.max() + 1, bonds=True)
+    atom['bond_count'] = np.diff(csr.indptr)[atom.index.values]
 
 
-def compute_atom_two_out_of_core(hdfname, uni, a, **kwargs):
+def atom_two_csr(atom_two, natoms=None, column="dr", bonds=False):
     """
-    Perform an out of core periodic two body calculation for a simple cubic
-    unit cell with dimension a.
+    Convert two body data to a symmetric sparse (CSR) matrix keyed by atom index.
+
+    Pairs only exist within a frame, so the matrix is block diagonal with a
+    block per frame. Neighbors of an atom (and the corresponding values) are
+    obtained in time proportional to the number of neighbors.
 
-    All data will be saved to and HDF5 file with the given filename. Key
-    structure is per frame, i.e. ``frame_fdx/atom_two``.
+    .. code-block:: python
+
+        csr = atom_two_csr(uni.atom_two, bonds=True)
+        neighbors = csr.indices[csr.indptr[i]:csr.indptr[i+1]]    # Atoms bonded to atom i
+        counts = np.diff(csr.indptr)                              # Bond counts (by atom index)
+
+    Args:
+        atom_two (:class:`~exatomic.core.two.AtomTwo`): Two body data
+        natoms (int): Matrix dimension (default largest atom index plus one)
+        column (str): Column providing the matrix values
+        bonds (bool): Only include bonded pairs
+
+    Returns:
+        csr (:class:`~scipy.sparse.csr_matrix`): Sparse two body matrix
+    """
+    if bonds:
+        atom_two = atom_two[atom_two['bond'] == True]
+    atom0 = atom_two['atom0'].values.astype(np.int64)
+    atom1 = atom_two['atom1'].values.astype(np.int64)
+    if natoms is None:
+        natoms = max(atom0.max(), atom1.max()) + 1 if len(atom0) > 0 else 0
+    data = atom_two[column].values.astype(np.float64)
+    csr = csr_matrix((np.concatenate((data, data)),
+                      (np.concatenate((atom0, atom1)), np.concatenate((atom1, atom0)))),
+                     shape=(natoms, natoms))
+    csr.sort_indices()
+    return csr
+
+
+def compute_atom_two_out_of_core(hdfname, uni, a=None, dmax=8.0, vector=True, bonds=True,
+                                 method="cells", chunksize=10, n_jobs=1, compact=False,
+                                 bonds_only=False, skin=2.0, **kwargs):
+    """
+    Perform an out of core two body calculation for free, orthorhombic or
+    triclinic universes.
+
+    Frames are computed in chunks (see :func:`~exatomic.core.two.iter_atom_two`)
+    and saved to an HDF5 file with the given filename. Key structure is per
+    frame, i.e. ``frame_fdx/atom_two``. Completed frames are recorded (key
+    ``atom_two_frames``) after each chunk is written so that a restarted
+    calculation skips frames that have already been computed.
+
+    .. code-block:: python
+
+        compute_atom_two_out_of_core("two.hdf", uni, dmax=6.0, chunksize=100)
 
     Args:
         hdfname (str): HDF file name
         uni (:class:`~exatomic.core.universe.Universe`): Universe
-        a (float): Simple cubic unit cell dimension
+        a (float): Deprecated simple cubic cell dimension; if given it is used as dmax
+            and, for universes without cell data, a cubic cell (a, a, a) is used
+            (as in earlier versions; the universe itself is not modified)
+        dmax (float): Maximum distance of interest
+        vector (bool): Compute distance vector
+        bonds (bool): Compute bonds (default True)
+        method (str): Pair search algorithm, "direct", "cells" or "verlet"
+        chunksize (int): Number of frames computed (and written) at a time
+        n_jobs (int): Number of frames processed concurrently (-1 for all cores)
+        compact (bool): Store distances as float32, indices as int32 and projections as int8
+        bonds_only (bool): Only search for (and save) bonded pairs
+        skin (float): Neighbor list skin for the "verlet" method
         kwargs: Keyword arguments for bond computation (i.e. covalent radii)
 
+    Returns:
+        frames (array): Frame indices computed by this call
+
     See Also:
         :func:`~exatomic.core.two._compute_bonds`
     """
-    store = pd.HDFStore(hdfname, mode="a")
-    unit_atom = uni.atom[['symbol', 'x', 'y', 'z', 'frame']].copy()
-    unit_atom['symbol'] = unit_atom['symbol'].astype(str)
-    unit_atom['frame'] = unit_atom['frame'].astype(int)
-    unit_atom.update(uni.unit_atom)
-    grps = unit_atom.groupby("frame")
-    n = len(grps)
-    fp = FloatProgress(description="AtomTwo to HDF:")
-    display(fp)
-    for i, (fdx, atom) in enumerate(grps):
-        v = pdist_ortho(atom['x'].values, atom['y'].values,
-                        atom['z'].values, a, a, a,
-                        atom.index.values, a)
-        tdf = pd.DataFrame.from_dict({'frame': np.array([fdx]*len(v[0]), dtype=int),
-                                      'dx': v[0], 'dy': v[1], 'dz': v[2], 'dr': v[3],
-                                       'atom0': v[4], 'atom1': v[5], 'projection': v[6]})
-        _compute_bonds(uni.atom[uni.atom['frame'] == fdx], tdf, **kwargs)
-        store.put("frame_"+str(fdx) + "/atom_two", tdf)
-        fp.value = i/n*100
-    store.close()
-    fp.close()
+    if a is not None:
+        warnings.warn("The cubic cell argument a is deprecated; use dmax and "
+                      "cell columns in the frame table", DeprecationWarning)
+        dmax = a
+        if not uni.periodic:
+            # Cubic cell on a copy of the frame table (the input is not modified)
+            frame = uni.frame.copy()
+            for i, col in enumerate(['xi', 'xj', 'xk', 'yi', 'yj', 'yk', 'zi', 'zj', 'zk']):
+                frame[col] = a if i % 4 == 0 else 0.0
+            for col in ['ox', 'oy', 'oz']:
+                frame[col] = 0.0
+            frame['periodic'] = True
+            uni = uni.__class__(atom=uni.atom, frame=frame)
+    with pd.HDFStore(hdfname, mode="a") as store:
+        done = completed_frames(store)
+        frames = np.setdiff1d(uni.atom['frame'].unique().astype(np.int64), done)
+        if len(frames) == 0:
+            return frames
+        chunks = iter_atom_two(uni, dmax=dmax, vector=vector, bonds=bonds, method=method,
+                               chunksize=chunksize, n_jobs=n_jobs, bonds_only=bonds_only,
+                               skin=skin, compact=compact, frames=frames, **kwargs)
+        for i, atom_two in enumerate(chunks):
+            atom_two._revert_categories()
+            if compact:
+                for col in ('atom0', 'atom1'):
+                    atom_two[col] = atom_two[col].astype(np.int32)
+            atom_two = pd.DataFrame(atom_two)
+            # Chunks follow the (sorted) requested frames, including frames without pairs
+            fdxs = frames[i*chunksize:(i + 1)*chunksize]
+            groups = dict(list(atom_two.groupby('frame')))
+            empty = atom_two.iloc[:0]
+            for fdx in fdxs:
+                tdf = groups.get(fdx, empty)
+                store.put("frame_" + str(fdx) + "/atom_two", tdf.reset_index(drop=True))
+            store.append("atom_two_frames", pd.DataFrame({'frame': fdxs}))
+            store.flush(fsync=True)
+    return frames
+
+
+def completed_frames(store):
+    """
+    Frames whose two body data has been written by
+    :func:`~exatomic.core.two.compute_atom_two_out_of_core`.
+
+    Args:
+        store (str, :class:`~pandas.HDFStore`): HDF file name or open store
+
+    Returns:
+        frames (array): Sorted, completed frame indices
+    """
+    if not isinstance(store, pd.HDFStore):
+        if not os.path.exists(store):
+            return np.empty((0, ), dtype=np.int64)
+        with pd.HDFStore(store, mode="r") as opened:
+            return completed_frames(opened)
+    if "/atom_two_frames" not in store.keys():
+        return np.empty((0, ), dtype=np.int64)
+    return np.unique(store.select("atom_two_frames")['frame'].values.astype(np.int64))
 
 
 def compute_molecule_two(universe):
@@ -14,17 +14,20 @@ simulations), step number (e.g. geometry optimization), or an arbitrary index
 import six
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 from exa import DataFrame, Container, TypedMeta
 from .frame import Frame, compute_frame_from_atom
 from .atom import Atom, UnitAtom, ProjectedAtom, VisualAtom, Frequency
-from .two import (AtomTwo, MoleculeTwo, compute_atom_two,
+from .two import (AtomTwo, MoleculeTwo, compute_atom_two, atom_two_csr,
                   _compute_bond_count, _compute_bonds)
+from .three import AtomThree
 from .molecule import (Molecule, compute_molecule, compute_molecule_com,
                        compute_molecule_count)
 from .field import AtomicField
 from .orbital import Orbital, Excitation, MOMatrix, DensityMatrix
 from .basis import Overlap, BasisSet, BasisSetOrder
 from exatomic.algorithms.orbital import add_molecular_orbitals
+from exatomic.algorithms.angles import compute_angles
 from exatomic.algorithms.basis import BasisFunctions, compute_uncontracted_basis_set_order
 from .tensor import Tensor
 
@@ -32,6 +35,9 @@ class Meta(TypedMeta):
     atom = Atom
     frame = Frame
     atom_two = AtomTwo
+    atom_two_csr = csr_matrix
+    bond_csr = csr_matrix
+    atom_three = AtomThree
     unit_atom = UnitAtom
     projected_atom = ProjectedAtom
     visual_atom = VisualAtom
@@ -57,6 +63,26 @@ class Meta(TypedMeta):
     multipole = DataFrame
     tensor = Tensor
 
+    @staticmethod
+    def create_property(name, ptype):
+        """
+        Typed property; setting or deleting atom_two also removes the cached
+        sparse two body matrices (see :meth:`~exatomic.core.universe.Universe._clear_two_csr`).
+        """
+        prop = TypedMeta.create_property(name, ptype)
+        if name != 'atom_two':
+            return prop
+
+        def setter(self, obj):
+            prop.fset(self, obj)
+            self._clear_two_csr()
+
+        def deleter(self):
+            prop.fdel(self)
+            self._clear_two_csr()
+
+        return property(prop.fget, setter, deleter)
+
 
 class Universe(six.with_metaclass(Meta, Container)):
     """
@@ -69,6 +95,9 @@ class Universe(six.with_metaclass(Meta, Container)):
         frame (:class:`~exatomic.core.frame.Frame`): State variables:
         atom (:class:`~exatomic.core.atom.Atom`): (Classical) atomic data (e.g. coordinates)
         atom_two (:class:`~exatomic.core.two.AtomTwo`): Interatomic distances
+        atom_two_csr (:class:`~scipy.sparse.csr_matrix`): Interatomic distances (sparse, by atom index)
+        bond_csr (:class:`~scipy.sparse.csr_matrix`): Bond lengths (sparse, by atom index)
+        atom_three (:class:`~exatomic.core.three.AtomThree`): Bond angles
         molecule (:class:`~exatomic.core.molecule.Molecule`): Molecule information
         orbital (:class:`~exatomic.core.orbital.Orbital`): Molecular orbital information
         momatrix (:class:`~exatomic.core.orbital.MOMatrix`): Molecular orbital coefficient matrix
@@ -134,9 +163,41 @@ class Universe(six.with_metaclass(Meta, Container)):
         Args:
             mapper (dict): Custom radii to use when determining bonds
             bond_extra (float): Extra additive factor to use when determining bonds
+            bonds_only (bool): Only compute bonded pairs (sufficient for molecules)
+
+        Note:
+            The sparse distance and bond matrices (atom_two_csr, bond_csr)
+            are computed (and cached) on first access.
+
+        See Also:
+            :func:`~exatomic.core.two.compute_atom_two`
         """
         self.atom_two = compute_atom_two(self, *args, **kwargs)
 
+    def compute_atom_two_csr(self):
+        """
+        Compute the sparse interatomic distance matrix.
+
+        See Also:
+            :func:`~exatomic.core.two.atom_two_csr`
+        """
+        self.atom_two_csr = atom_two_csr(self.atom_two, self.atom.index.max() + 1)
+
+    def compute_bond_csr(self):
+        """
+        Compute the sparse (bonded pairs only) distance matrix.
+
+        See Also:
+            :func:`~exatomic.core.two.atom_two_csr`
+        """
+        self.bond_csr = atom_two_csr(self.atom_two, self.atom.index.max() + 1, bonds=True)
+
+    def _clear_two_csr(self):
+        """Remove cached sparse two body matrices (e.g. after bonds change)."""
+        for name in ('_atom_two_csr', '_bond_csr'):
+            if hasattr(self, name):
+                delattr(self, name)
+
     def compute_bonds(self, *args, **kwargs):
         """
         Updates bonds (and molecules).
@@ -145,16 +206,37 @@ class Universe(six.with_metaclass(Meta, Container)):
             :func:`~exatomic.two.AtomTwo.compute_bonds`
         """
         _compute_bonds(self.atom, self.atom_two, *args, **kwargs)
+        self._clear_two_csr()
+
+    def compute_atom_three(self, bonds=True):
+        """
+        Compute bond angles.
+
+        Args:
+            bonds (bool): Restrict to bond angles (default True)
+
+        See Also:
+            :func:`~exatomic.algorithms.angles.compute_angles`
+        """
+        self.atom_three = compute_angles(self, bonds=bonds)
 
     def compute_bond_count(self):
         """
         Compute bond counts and attach them to the :class:`~exatomic.atom.Atom` table.
         """
-        _compute_bond_count(self)
+        _compute_bond_count(self.atom, csr=self.bond_csr)
+
+    def compute_molecule(self, track=False):
+        """
+        Compute the :class:`~exatomic.molecule.Molecule` table.
 
-    def compute_molecule(self):
-        """Compute the :class:`~exatomic.molecule.Molecule` table."""
-        self.molecule = compute_molecule(self)
+        Args:
+            track (bool): Persistent molecule indices across frames
+
+        See Also:
+            :func:`~exatomic.core.molecule.compute_molecule`
+        """
+        self.molecule = compute_molecule(self, track=track)
         self.compute_molecule_count()
 
     def compute_molecule_com(self):